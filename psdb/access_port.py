@@ -64,6 +64,9 @@ class MemAP(AP):
     def read_bulk(self, addr, size):
         return self.db.read_bulk(addr, size, self.ap_num)
 
+    def read_bulk_into(self, addr, buf):
+        return self.db.read_bulk_into(addr, buf, self.ap_num)
+
     def write_32(self, v, addr):
         self.db.write_32(v, addr, self.ap_num)
 
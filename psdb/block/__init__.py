@@ -1,9 +1,12 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
 from .bd import Block, BlockOutOfRangeException
 from .rambd import RAMBD
+from .sparse_image import IntervalIndex, SparseImage
 
 
 __all__ = ['Block',
            'BlockOutOfRangeException',
+           'IntervalIndex',
            'RAMBD',
+           'SparseImage',
            ]
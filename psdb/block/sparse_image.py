@@ -0,0 +1,102 @@
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import bisect
+
+from .bd import BlockOutOfRangeException
+
+
+class IntervalIndex:
+    '''
+    A sorted index of disjoint address intervals.  Adjacent and overlapping
+    intervals are coalesced as they are added, so lookups and insertions
+    are a binary search over the distinct regions.
+    '''
+    def __init__(self):
+        self.starts = []
+        self.ends   = []
+
+    def overlaps(self, addr, size):
+        '''
+        Checks if any interval in the index overlaps the region defined by
+        addr and size.
+        '''
+        i = bisect.bisect_left(self.starts, addr + size) - 1
+        return i >= 0 and self.ends[i] > addr
+
+    def add(self, addr, size):
+        '''
+        Adds the region defined by addr and size to the index.
+        '''
+        if size <= 0:
+            return
+        end = addr + size
+        lo  = bisect.bisect_left(self.ends, addr)
+        hi  = bisect.bisect_right(self.starts, end)
+        if lo < hi:
+            addr = min(addr, self.starts[lo])
+            end  = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [addr]
+        self.ends[lo:hi]   = [end]
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+
+class SparseImage:
+    '''
+    A sparse memory image made up of fixed-size pages.  A page is allocated
+    as a bytearray holding the fill byte the first time any part of it is
+    written and is then updated in place, so building an image costs time
+    proportional to the amount of data written.  The regions that have been
+    written are tracked in an IntervalIndex.
+
+    Pages are addressed by page number, which is the page address divided by
+    the page size.  Writes to pages outside [first_page, first_page +
+    npages) raise BlockOutOfRangeException.
+    '''
+    def __init__(self, page_size, fill=b'\xff', first_page=0,
+                 npages=0x10000000000000000):
+        self.page_size  = page_size
+        self.fill       = fill * page_size
+        self.first_page = first_page
+        self.end_page   = first_page + npages
+        self.pages      = {}
+        self.written    = IntervalIndex()
+
+    def overlaps(self, addr, size):
+        '''
+        Checks if any data has been written to the region defined by addr
+        and size.
+        '''
+        return self.written.overlaps(addr, size)
+
+    def write(self, addr, data):
+        '''
+        Writes data into the image, overwriting anything previously written
+        to the same addresses.
+        '''
+        mv   = memoryview(data).cast('B')
+        pos  = 0
+        size = len(mv)
+        while pos < size:
+            pagenum = (addr + pos) // self.page_size
+            if pagenum < self.first_page or pagenum >= self.end_page:
+                raise BlockOutOfRangeException(self, pagenum)
+
+            page = self.pages.get(pagenum)
+            if page is None:
+                page = self.pages[pagenum] = bytearray(self.fill)
+            offset = (addr + pos) % self.page_size
+            count  = min(size - pos, self.page_size - offset)
+            page[offset:offset + count] = mv[pos:pos + count]
+            self.written.add(addr + pos, count)
+            pos += count
+
+    def iter_pages(self):
+        '''
+        Iterates over the populated pages in address order, yielding a
+        (page number, page address, page data) tuple for each.  The page
+        data is a memoryview onto the image.
+        '''
+        for pagenum in sorted(self.pages):
+            yield (pagenum, pagenum * self.page_size,
+                   memoryview(self.pages[pagenum]))
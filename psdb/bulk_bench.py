@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import argparse
+import random
+import time
+import sys
+
+import psdb.probes
+
+
+EXCLUDE_SRAMS = ['Backup SRAM']
+
+
+def bench(ap, addr, size, niters):
+    data = random.randbytes(size)
+
+    t0 = time.time()
+    for _ in range(niters):
+        ap.write_bulk(data, addr)
+    t1 = time.time()
+    for _ in range(niters):
+        rdata = ap.read_bulk(addr, size)
+    t2 = time.time()
+    assert rdata == data
+
+    return (size * niters / (t1 - t0), size * niters / (t2 - t1))
+
+
+def bench_mode(probe, rd, rv, use_async):
+    if use_async:
+        if not probe.enable_async_transfers():
+            print('Asynchronous transfers not supported by this probe.')
+            return
+        mode = 'async'
+    else:
+        if hasattr(probe, 'disable_async_transfers'):
+            probe.disable_async_transfers()
+        mode = 'sync'
+
+    size = rd.size
+    if rv.max_size is not None:
+        size = min(size, rv.max_size)
+    while size >= 1024:
+        wr, rd_rate = bench(rd.ap, rd.dev_base, size, rv.iterations)
+        print('%5s %8u bytes: write %8.1f KiB/s  read %8.1f KiB/s' %
+              (mode, size, wr / 1024, rd_rate / 1024))
+        size //= 4
+
+
+def main(rv):
+    # Probe the specified serial number (or find the default if no serial number
+    # was specified.
+    probe = psdb.probes.make_one_ns(rv)
+    f     = probe.set_tck_freq(rv.probe_freq)
+    print('Probing with SWD frequency at %.3f MHz' % (f/1.e6))
+
+    # Use the probe to detect a target platform.
+    target = probe.probe(verbose=rv.verbose,
+                         connect_under_reset=rv.connect_under_reset)
+    f      = probe.set_max_target_tck_freq()
+    print('Set SWD frequency to %.3f MHz' % (f/1.e6))
+
+    # Find an SRAM to use.
+    for rd in target.ram_devs.values():
+        if rv.mem_name is not None and rv.mem_name != rd.name:
+            continue
+        if rd.name in EXCLUDE_SRAMS:
+            continue
+        break
+    else:
+        raise psdb.ProbeException('No suitable SRAM found.')
+    print('Benchmarking %s...' % rd.name)
+
+    # Compare the synchronous path against the async engine, if the probe has
+    # one.  Only USB probes opened through pyusb's libusb1 backend have an
+    # async engine; the simulated probe and USB replay only exercise the
+    # synchronous path.
+    bench_mode(probe, rd, rv, False)
+    if hasattr(probe, 'enable_async_transfers'):
+        bench_mode(probe, rd, rv, True)
+
+
+def _main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--usb-path')
+    parser.add_argument('--serial-num')
+    parser.add_argument('--connect-under-reset', action='store_true')
+    parser.add_argument('--probe-freq', type=int, default=1000000)
+    parser.add_argument('--verbose', '-v', action='store_true')
+    parser.add_argument('--mem-name')
+    parser.add_argument('--max-size', type=int)
+    parser.add_argument('--iterations', type=int, default=4)
+    rv = parser.parse_args()
+
+    try:
+        main(rv)
+    except psdb.ProbeException as e:
+        print(e)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    _main()
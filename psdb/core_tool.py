@@ -25,14 +25,15 @@ def main(rv):
     f      = probe.set_max_target_tck_freq()
     print('Set SWD frequency to %.3f MHz' % (f/1.e6))
 
-    # Generate the core file.
-    c = psdb.elf.Core()
+    # Generate the core file.  Memory devices are only read while the core
+    # is being written, streaming their contents straight to disk.
+    c = psdb.elf.Core(elide_size=rv.elide_size)
 
     # Iterate over all devices to get memory and peripheral registers.
     for d in target.devs.values():
         if isinstance(d, psdb.devices.MemDevice):
             print('Adding "%s"...' % d.name)
-            c.add_mem_map(d.dev_base, d.read_mem_block(d.dev_base, d.size))
+            c.add_mem_region(d.dev_base, d.size, d.read_mem_block)
         elif rv.peripheral_capture:
             print('Adding "%s"...' % d.name)
             region_data = b''
@@ -62,6 +63,7 @@ def main(rv):
         c.add_thread(regs)
 
     # Write it out.
+    print('Writing "%s"...' % rv.output_path)
     c.write(rv.output_path)
 
     # Resume if halt wasn't requested.
@@ -79,6 +81,8 @@ def _main():
     parser.add_argument('--verbose', '-v', action='store_true')
     parser.add_argument('--output-path', '-o', required=True)
     parser.add_argument('--peripheral-capture', '-p', action='store_true')
+    parser.add_argument('--elide-size', type=lambda x: int(x, 0),
+                        default=4096)
     rv = parser.parse_args()
 
     try:
@@ -69,6 +69,9 @@ class Cortex(psdb.component.Component):
     def read_bulk(self, addr, size):
         return self.ap.read_bulk(addr, size)
 
+    def read_bulk_into(self, addr, buf):
+        return self.ap.read_bulk_into(addr, buf)
+
     def read_core_register(self, name):
         '''Reads a single core register.'''
         assert self.flags & FLAG_HALTED
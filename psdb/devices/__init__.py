@@ -1,7 +1,7 @@
 # Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
 from .device import (Device, ReadCommand, Reg, Reg32, Reg32R, Reg32W, Reg32S,
                      Reg32RS, Reg8, Reg8S, AReg32, AReg32R, AReg32W, AReg32S,
-                     AReg32RS, RegDiv, MemDevice, RAMDevice)
+                     AReg32RS, RegDiv, MemDevice, RAMDevice, WriteCommand)
 from .flash import Flash
 from . import core
 
@@ -25,5 +25,6 @@ __all__ = ['AReg32',
            'Reg8',
            'Reg8S',
            'RegDiv',
+           'WriteCommand',
            'core',
            ]
@@ -0,0 +1,213 @@
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import hashlib
+import os
+import struct
+import zlib
+
+from ..block import Block, SparseImage, BlockOutOfRangeException
+
+
+# A saved plan is a header followed by a zlib-compressed payload holding a
+# record for each sector, each followed by the runs to program in it:
+#
+#   header: magic, version, mem_base, sector_size, nsectors, nblocks
+#   sector: block number, CRC32 of the sector image, number of runs
+#   run:    offset in the sector, length, data
+#
+# Sector images are rebuilt from their runs on load; everything outside the
+# runs is erased.
+MAGIC   = b'PSBP'
+VERSION = 1
+HEADER  = struct.Struct('<4sIIIII')
+SECTOR  = struct.Struct('<III')
+RUN     = struct.Struct('<II')
+
+
+class BurnPlanException(Exception):
+    pass
+
+
+class BurnPlan:
+    '''
+    Everything that Flash.burn_dv() derives from a data vector before it
+    touches the target: the image of each sector to be written, keyed by
+    block number, the runs in each sector that actually need programming,
+    the expected CRC32 of each sector and the resulting erase mask.  A plan
+    depends only on the data vector and the flash geometry, so it can be
+    computed once with make() and then saved and reloaded.
+    '''
+    def __init__(self, mem_base, sector_size, nsectors, blocks, runs, crcs):
+        self.mem_base    = mem_base
+        self.sector_size = sector_size
+        self.nsectors    = nsectors
+        self.blocks      = blocks
+        self.runs        = runs
+        self.crcs        = crcs
+        self.first_block = mem_base // sector_size
+        self.mask        = self.mask_for(blocks)
+
+    @staticmethod
+    def make(flash, dv, bank_swap=False):
+        '''
+        Prepares the sector images for the data vector as described in
+        Flash.burn_dv() and returns the resulting BurnPlan.
+        '''
+        image = SparseImage(flash.sector_size,
+                            first_page=flash.mem_base // flash.sector_size,
+                            npages=flash.nsectors)
+        for v in dv:
+            try:
+                addr = flash._swap_addr(v[0], v[1]) if bank_swap else v[0]
+                image.write(addr, v[1])
+            except BlockOutOfRangeException:
+                pass
+
+        blocks = {}
+        runs   = {}
+        crcs   = {}
+        for n, addr, page in image.iter_pages():
+            data      = page.tobytes()
+            blocks[n] = Block(addr, data)
+            runs[n]   = flash._program_runs(addr, data)
+            crcs[n]   = zlib.crc32(data)
+        return BurnPlan(flash.mem_base, flash.sector_size, flash.nsectors,
+                        blocks, runs, crcs)
+
+    def mask_for(self, block_nums):
+        '''
+        Returns the sector erase mask for a list of block numbers.
+        '''
+        mask = 0
+        for n in block_nums:
+            mask |= (1 << (n - self.first_block))
+        return mask
+
+    def matches(self, flash):
+        '''
+        Returns True if the plan was made for the flash's geometry.
+        '''
+        return (self.mem_base == flash.mem_base and
+                self.sector_size == flash.sector_size and
+                self.nsectors == flash.nsectors)
+
+    def serialize(self):
+        '''
+        Returns the plan in its compact binary form.
+        '''
+        payload = []
+        for n in sorted(self.blocks):
+            addr = self.blocks[n].addr
+            payload.append(SECTOR.pack(n, self.crcs[n], len(self.runs[n])))
+            for run_addr, data in self.runs[n]:
+                payload.append(RUN.pack(run_addr - addr, len(data)))
+                payload.append(data)
+        return (HEADER.pack(MAGIC, VERSION, self.mem_base, self.sector_size,
+                            self.nsectors, len(self.blocks)) +
+                zlib.compress(b''.join(payload)))
+
+    @staticmethod
+    def deserialize(data):
+        '''
+        Rebuilds a BurnPlan from the output of serialize().  Raises
+        BurnPlanException if the data isn't a valid plan.
+        '''
+        try:
+            magic, version, mem_base, sector_size, nsectors, nblocks = \
+                HEADER.unpack_from(data)
+            if magic != MAGIC or version != VERSION:
+                raise BurnPlanException('Not a version %u burn plan.'
+                                        % VERSION)
+            payload = zlib.decompress(data[HEADER.size:])
+        except (struct.error, zlib.error) as e:
+            raise BurnPlanException('Corrupt burn plan.') from e
+
+        blocks = {}
+        runs   = {}
+        crcs   = {}
+        pos    = 0
+        try:
+            for _ in range(nblocks):
+                n, crc, nruns = SECTOR.unpack_from(payload, pos)
+                pos          += SECTOR.size
+                addr          = n * sector_size
+                image         = bytearray(b'\xff' * sector_size)
+                runs[n]       = []
+                for _ in range(nruns):
+                    offset, length = RUN.unpack_from(payload, pos)
+                    pos           += RUN.size
+                    run            = payload[pos:pos + length]
+                    pos           += length
+                    image[offset:offset + length] = run
+                    runs[n].append((addr + offset, run))
+                blocks[n] = Block(addr, bytes(image))
+                crcs[n]   = crc
+        except struct.error as e:
+            raise BurnPlanException('Truncated burn plan.') from e
+        if pos != len(payload) or any(zlib.crc32(blocks[n].data) != crcs[n]
+                                      for n in blocks):
+            raise BurnPlanException('Corrupt burn plan.')
+
+        return BurnPlan(mem_base, sector_size, nsectors, blocks, runs, crcs)
+
+    def save(self, path):
+        '''
+        Atomically writes the plan to the specified path.
+        '''
+        tmp = '%s.%u.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(self.serialize())
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path):
+        '''
+        Loads a plan saved with save().
+        '''
+        with open(path, 'rb') as f:
+            return BurnPlan.deserialize(f.read())
+
+
+class BurnPlanCache:
+    '''
+    A directory of saved BurnPlans.  Plans are content-addressed: the key
+    covers the digests of the image files, the target and flash driver
+    classes, the flash geometry and whether the image is being written to
+    the inactive bank, so a cached plan is only reused for an identical burn.
+    '''
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(image_digests, flash, bank_swap):
+        '''
+        Returns the cache key for a burn of the images with the specified
+        digests to the flash.
+        '''
+        h = hashlib.sha256()
+        for d in image_digests:
+            h.update(d)
+        h.update(('%u %s %s %u %u %u %u %u' % (
+            VERSION, type(flash.target).__name__, type(flash).__name__,
+            flash.mem_base, flash.sector_size, flash.nsectors,
+            flash.PROGRAM_UNIT, bank_swap)).encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.path, key + '.plan')
+
+    def get(self, key):
+        '''
+        Returns the cached plan for the key, or None if there isn't a usable
+        one.
+        '''
+        try:
+            return BurnPlan.load(self._path(key))
+        except (OSError, BurnPlanException):
+            return None
+
+    def put(self, key, plan):
+        '''
+        Stores the plan in the cache under the key.
+        '''
+        plan.save(self._path(key))
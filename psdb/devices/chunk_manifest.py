@@ -0,0 +1,91 @@
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import hashlib
+import os
+
+
+class ChunkManifest:
+    '''
+    Records the SHA-256 of each fixed-size chunk of a file as it is written,
+    so that an interrupted transfer can be resumed from the last good chunk.
+    The manifest is a text file whose first line describes the region being
+    transferred and whose following lines each hold the offset and hash of a
+    completed chunk:
+
+        psdb-chunks 1 <base address> <size> <chunk size>
+        <offset> <sha256>
+        ...
+
+    Use as a context manager around the transfer; load() any existing
+    manifest first to pick up where a previous transfer left off, and call
+    complete() once every chunk has been stored so that a later transfer to
+    the same file starts from scratch.
+    '''
+    def __init__(self, path, base, size, chunk_size):
+        self.path       = path
+        self.header     = ('psdb-chunks 1 0x%08X %u %u\n'
+                           % (base, size, chunk_size))
+        self.chunk_size = chunk_size
+        self.hashes     = {}
+        self.f          = None
+
+    def load(self, data_file):
+        '''
+        Loads the hashes of a previous transfer of the same region and keeps
+        those whose chunk in data_file still matches.  A missing, mismatched
+        or truncated manifest is ignored, as is everything after the first
+        malformed line.
+        '''
+        try:
+            with open(self.path, 'r') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        if not lines or lines[0] != self.header:
+            return
+
+        for l in lines[1:]:
+            fields = l.split()
+            if len(fields) != 2 or not l.endswith('\n'):
+                break
+            try:
+                offset = int(fields[0], 16)
+            except ValueError:
+                break
+            data_file.seek(offset)
+            data = data_file.read(self.chunk_size)
+            if hashlib.sha256(data).hexdigest() == fields[1]:
+                self.hashes[offset] = fields[1]
+
+    def __enter__(self):
+        self.f = open(self.path, 'w')
+        self.f.write(self.header)
+        for offset in sorted(self.hashes):
+            self.f.write('%08X %s\n' % (offset, self.hashes[offset]))
+        self.f.flush()
+        return self
+
+    def __exit__(self, _type, value, traceback):
+        self.f.close()
+        self.f = None
+
+    def store(self, data_file, offset, data):
+        '''
+        Writes a chunk to data_file and records its hash once it is on disk.
+        '''
+        data_file.seek(offset)
+        data_file.write(data)
+        data_file.flush()
+        h = hashlib.sha256(data).hexdigest()
+        self.f.write('%08X %s\n' % (offset, h))
+        self.f.flush()
+        self.hashes[offset] = h
+
+    def complete(self):
+        '''
+        Marks the transfer as finished by deleting the manifest.
+        '''
+        assert self.f is None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
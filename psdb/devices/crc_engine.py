@@ -0,0 +1,106 @@
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import struct
+
+from .target_routine import TargetRoutine, RoutineException
+
+
+# Table-driven CRC32 (the zlib/IEEE 802.3 CRC) over a list of {addr, len}
+# descriptors.  Entered with r0 = the descriptor list, r1 = the descriptor
+# count and r2 = the 256-entry lookup table; the CRC of each region replaces
+# its len field.
+CRC_CODE = bytes.fromhex(
+    '0029'          # cmp     r1, #0
+    '14d0'          # beq     done
+    # next:
+    '0368'          # ldr     r3, [r0, #0]
+    '4468'          # ldr     r4, [r0, #4]
+    '0025'          # movs    r5, #0
+    'ed43'          # mvns    r5, r5
+    '002c'          # cmp     r4, #0
+    '09d0'          # beq     store
+    # loop:
+    '1e78'          # ldrb    r6, [r3]
+    '0133'          # adds    r3, #1
+    '6e40'          # eors    r6, r5
+    '3606'          # lsls    r6, r6, #24
+    'b60d'          # lsrs    r6, r6, #22
+    '9659'          # ldr     r6, [r2, r6]
+    '2d0a'          # lsrs    r5, r5, #8
+    '7540'          # eors    r5, r6
+    '013c'          # subs    r4, #1
+    'f5d1'          # bne     loop
+    # store:
+    'ed43'          # mvns    r5, r5
+    '4560'          # str     r5, [r0, #4]
+    '0830'          # adds    r0, #8
+    '0139'          # subs    r1, #1
+    'ead1'          # bne     next
+    # done:
+    '00be'          # bkpt    #0
+    )
+
+
+def _make_table():
+    table = []
+    for i in range(256):
+        v = i
+        for _ in range(8):
+            v = (v >> 1) ^ (0xEDB88320 if v & 1 else 0)
+        table.append(v)
+    return struct.pack('<256I', *table)
+
+
+CRC_TABLE = _make_table()
+
+
+class CRCEngine(TargetRoutine):
+    '''
+    Computes CRC32s of target memory on the target CPU, so that only the
+    CRCs rather than the memory contents have to cross the debug link.  The
+    CRCs match zlib.crc32().
+    '''
+    MIN_DESCS = 16
+    MIN_RATE  = 100000
+
+    def __init__(self, cpu, ram):
+        super().__init__(cpu, ram, CRC_CODE)
+        self.table_addr = self.data_addr
+        self.desc_addr  = self.data_addr + len(CRC_TABLE)
+        self.max_descs  = (self.data_size - len(CRC_TABLE)) // 8
+
+    @staticmethod
+    def make(target, ap):
+        '''
+        Returns a CRCEngine for memory on the specified AP, or None if the
+        target doesn't have a halted CPU and SRAM there to run it.
+        '''
+        cr = TargetRoutine.find_cpu_and_ram(
+                target, ap, len(CRC_CODE),
+                len(CRC_TABLE) + 8 * CRCEngine.MIN_DESCS)
+        if cr is None:
+            return None
+        return CRCEngine(*cr)
+
+    def crcs(self, alps):
+        '''
+        Returns a list of the CRC32s of each (address, length) pair.  The
+        regions must not overlap the SRAM used by the engine.
+        '''
+        crcs = []
+        for i in range(0, len(alps), self.max_descs):
+            chunk = alps[i:i + self.max_descs]
+            descs = b''.join(struct.pack('<II', a, l) for a, l in chunk)
+            self.start(CRC_TABLE + descs, r0=self.desc_addr, r1=len(chunk),
+                       r2=self.table_addr)
+            try:
+                pc = self.wait_halted(
+                        TargetRoutine.TIMEOUT +
+                        sum(l for _, l in chunk) / CRCEngine.MIN_RATE)
+                if pc != self.code_addr + len(CRC_CODE) - 2:
+                    raise RoutineException('CRC routine halted at 0x%08X.'
+                                           % pc)
+                data = self.ap.read_bulk(self.desc_addr, 8 * len(chunk))
+            finally:
+                self.stop()
+            crcs += [c for _, c in struct.iter_unpack('<II', data)]
+        return crcs
@@ -51,6 +51,14 @@ class ReadCommand:
         self.size = size
 
 
+class WriteCommand:
+    def __init__(self, ap, addr, size, value):
+        self.ap    = ap
+        self.addr  = addr
+        self.size  = size
+        self.value = value
+
+
 class Reg:
     READABLE     = (1 << 0)
     WRITEABLE    = (1 << 1)
@@ -280,34 +288,68 @@ class Device:
         if name[0] == '_' and name.upper() == name:
             rd = self.reg_map[name]
             if isinstance(value, RDCapture):
-                rd.write(value.read())
+                v   = value.read()
+                txn = value.dev.ap.db.txn
+                if txn is not None:
+                    # Inside a transaction the read returns a Future; flush
+                    # so that the copy writes the register's current value.
+                    txn.flush()
+                    v = v.value
+                rd.write(v)
             else:
                 rd.write(value)
         else:
             super().__setattr__(name, value)
 
+    def batch(self, coalesce=True):
+        '''
+        Returns a context manager that defers all register accesses made
+        through this (or any other) Device on the same debug probe until the
+        context exits.  See Probe.transaction().
+        '''
+        return self.ap.db.transaction(coalesce=coalesce)
+
     def _read_8(self, offset):
+        txn = self.ap.db.txn
+        if txn is not None:
+            return txn.read(self.ap, self.dev_base + offset, 1)
         return self.ap.read_8(self.dev_base + offset)
 
     def _read_8_cmd(self, offset):
         return ReadCommand(self.ap, self.dev_base + offset, 1)
 
     def _read_32(self, offset):
+        txn = self.ap.db.txn
+        if txn is not None:
+            return txn.read(self.ap, self.dev_base + offset, 4)
         return self.ap.read_32(self.dev_base + offset)
 
     def _read_32_cmd(self, offset):
         return ReadCommand(self.ap, self.dev_base + offset, 4)
 
     def _write_8(self, v, offset):
-        self.ap.write_8(v, self.dev_base + offset)
+        txn = self.ap.db.txn
+        if txn is not None:
+            txn.write(self.ap, self.dev_base + offset, 1, v)
+        else:
+            self.ap.write_8(v, self.dev_base + offset)
 
     def _write_32(self, v, offset):
-        self.ap.write_32(v, self.dev_base + offset)
+        txn = self.ap.db.txn
+        if txn is not None:
+            txn.write(self.ap, self.dev_base + offset, 4, v)
+        else:
+            self.ap.write_32(v, self.dev_base + offset)
 
     def _set_field(self, v, width, shift, offset):
         assert width + shift <= 32
         mask = (1 << width) - 1
         assert (v & ~mask) == 0
+        txn = self.ap.db.txn
+        if txn is not None:
+            txn.set_field(self.ap, self.dev_base + offset, mask << shift,
+                          v << shift)
+            return
         curr = self._read_32(offset)
         curr &= ~(mask << shift)
         curr |= (v << shift)
@@ -316,6 +358,10 @@ class Device:
     def _get_field(self, width, shift, offset):
         assert width + shift <= 32
         mask = (1 << width) - 1
+        txn  = self.ap.db.txn
+        if txn is not None:
+            return txn.read(self.ap, self.dev_base + offset, 4, shift=shift,
+                            mask=mask)
         curr = self._read_32(offset) >> shift
         return curr & mask
 
@@ -338,6 +384,9 @@ class MemDevice(Device):
     def read_mem_block(self, addr, size):
         return self.ap.read_bulk(addr, size)
 
+    def read_mem_block_into(self, addr, buf):
+        return self.ap.read_bulk_into(addr, buf)
+
 
 class RAMDevice(MemDevice):
     '''
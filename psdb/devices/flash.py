@@ -1,10 +1,23 @@
 # Copyright (c) 2019 Phase Advanced Sensor Systems, Inc.
-import math
+import concurrent.futures
+import contextlib
+import hashlib
+import os
+import re
 import time
+import zlib
 from builtins import range
 
 import psdb
-from ..block import RAMBD, BlockOutOfRangeException
+from .burn_plan import BurnPlan
+from .chunk_manifest import ChunkManifest
+from .crc_engine import CRCEngine
+
+
+# Runs of at least this many erased bytes are skipped rather than programmed;
+# shorter runs cost more in extra write operations than they save.
+BLANK_RUN_MIN = 64
+BLANK_RUN_RE  = re.compile(b'\xff{%u,}' % BLANK_RUN_MIN)
 
 
 class FlashException(Exception):
@@ -20,6 +33,9 @@ class FlashWriteException(Exception):
 
 
 class Flash:
+    # Programming granularity in bytes; writes must be aligned to it.
+    PROGRAM_UNIT = 64
+
     def __init__(self, mem_base, sector_size, nsectors, max_nowait_write_freq):
         super().__init__()
         self.mem_base              = mem_base
@@ -61,20 +77,72 @@ class Flash:
         '''
         raise NotImplementedError
 
-    def erase_sectors(self, mask, verbose=True):
+    def _erase_unlocked(self):
+        '''
+        Returns a context manager that prepares the flash controller for a
+        sequence of _erase_sector_unlocked() and _erase_bank_unlocked()
+        calls, so that the controller is unlocked once for a whole erase plan
+        instead of once per sector.
+        '''
+        return contextlib.nullcontext()
+
+    def _erase_sector_unlocked(self, n):
+        '''
+        Erases the nth sector inside an _erase_unlocked() context.
+        '''
+        self.erase_sector(n, verbose=False)
+
+    def _bank_masks(self):
         '''
-        Erases the sectors specified in the bit mask.
+        Returns a list holding the sector mask of each bank that can be erased
+        in a single operation with _erase_bank_unlocked(), indexed by bank.
+        The list is empty if the flash doesn't support per-bank erase.
+        '''
+        return []
+
+    def _erase_bank_unlocked(self, i):
+        '''
+        Erases the ith bank inside an _erase_unlocked() context.
+        '''
+        raise NotImplementedError
+
+    def _plan_erase(self, mask):
+        '''
+        Returns the list of operations that erases exactly the sectors in the
+        bit mask using the fewest controller operations.  Each operation is a
+        tuple: ('all', None) for a mass erase, ('bank', i) for a bank erase or
+        ('sector', n) for a sector erase.  A mass erase is used if every
+        sector is selected and a bank erase for every bank that is fully
+        selected; the remaining sectors are erased individually.
         '''
         if mask == self.all_mask:
+            return [('all', None)]
+
+        plan = []
+        for i, bank_mask in enumerate(self._bank_masks()):
+            if mask & bank_mask == bank_mask:
+                plan.append(('bank', i))
+                mask &= ~bank_mask
+        plan += [('sector', n) for n in range(mask.bit_length())
+                 if mask & (1 << n)]
+        return plan
+
+    def erase_sectors(self, mask, verbose=True):
+        '''
+        Erases the sectors specified in the bit mask, using mass or bank
+        erase where the mask covers the entire flash or entire banks.
+        '''
+        plan = self._plan_erase(mask)
+        if plan == [('all', None)]:
             self.erase_all(verbose=verbose)
             return
 
-        sectors = []
-        for i in range(int(math.floor(math.log(mask, 2))) + 1):
-            if mask & (1 << i):
-                sectors.append(i)
-        for i in psdb.piter(sectors, verbose=verbose):
-            self.erase_sector(i, verbose=False)
+        with self._erase_unlocked():
+            for op, n in psdb.piter(plan, verbose=verbose):
+                if op == 'bank':
+                    self._erase_bank_unlocked(n)
+                else:
+                    self._erase_sector_unlocked(n)
 
     def erase(self, addr, length, verbose=True):
         '''
@@ -86,10 +154,16 @@ class Flash:
 
     def erase_all(self, verbose=True):
         '''
-        Erases the entire flash.
+        Erases the entire flash, one bank or sector at a time.
         '''
-        for i in psdb.piter(range(self.nsectors), verbose=verbose):
-            self.erase_sector(i, verbose=False)
+        nbanks = len(self._bank_masks())
+        with self._erase_unlocked():
+            if nbanks:
+                for i in psdb.piter(range(nbanks), verbose=verbose):
+                    self._erase_bank_unlocked(i)
+            else:
+                for i in psdb.piter(range(self.nsectors), verbose=verbose):
+                    self._erase_sector_unlocked(i)
 
     def read(self, addr, length):
         '''
@@ -97,12 +171,76 @@ class Flash:
         '''
         raise NotImplementedError
 
+    def read_into(self, addr, buf):
+        '''
+        Reads a region from the flash into the caller-provided buffer; the
+        length of the region is the size of buf in bytes.
+        '''
+        return self.ap.read_bulk_into(addr, buf)
+
     def read_all(self):
         '''
         Reads the entire flash.
         '''
         return self.read(self.mem_base, self.flash_size)
 
+    def _read_retrying(self, addr, length, retries):
+        '''
+        Reads a region from the flash, retrying the read if it fails.
+        '''
+        for attempt in range(retries + 1):
+            try:
+                return self.read(addr, length)
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                print('Read of [0x%08X - 0x%08X] failed (%s), retrying...'
+                      % (addr, addr + length - 1, e))
+
+    def read_to_file(self, path, chunk_size=0x10000, retries=3,
+                     verbose=True):
+        '''
+        Reads the entire flash into the file at path, streaming it in chunks
+        so that the image is never held in memory.  Each chunk is written and
+        hashed on a separate thread while the next chunk is read, and its
+        SHA-256 is recorded in a manifest at path + '.manifest'.  If the read
+        is interrupted, calling this again resumes from the chunks that the
+        manifest and the file agree on.  The manifest is deleted once the
+        whole flash has been read, so reading into an existing, complete file
+        reads everything again.  Returns the MD5 of the image.
+        '''
+        manifest = ChunkManifest(path + '.manifest', self.mem_base,
+                                 self.flash_size, chunk_size)
+        mode     = 'r+b' if os.path.exists(path) else 'w+b'
+        with open(path, mode) as f:
+            manifest.load(f)
+            f.truncate(self.flash_size)
+            offsets = [o for o in range(0, self.flash_size, chunk_size)
+                       if o not in manifest.hashes]
+            if verbose and manifest.hashes:
+                print('Resuming read, %u chunks already done.'
+                      % len(manifest.hashes))
+
+            with manifest, concurrent.futures.ThreadPoolExecutor(1) as pool:
+                pending = None
+                for offset in psdb.piter(offsets, verbose=verbose):
+                    data = self._read_retrying(
+                            self.mem_base + offset,
+                            min(chunk_size, self.flash_size - offset),
+                            retries)
+                    if pending:
+                        pending.result()
+                    pending = pool.submit(manifest.store, f, offset, data)
+                if pending:
+                    pending.result()
+            manifest.complete()
+
+            f.seek(0)
+            md5 = hashlib.md5()
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                md5.update(chunk)
+        return md5
+
     def write(self, addr, data, verbose=True):
         '''
         Writes the specified bytes to the specified address in flash.  The
@@ -110,6 +248,14 @@ class Flash:
         '''
         raise NotImplementedError
 
+    def _make_loader(self):
+        '''
+        Returns a psdb.devices.flash_loader.FlashLoader that programs this
+        flash from target SRAM, or None if the flash driver doesn't have a
+        loader routine or the target has no SRAM to run it from.
+        '''
+        return None
+
     def prune_dv(self, dv):
         '''
         Returns a copy of the data vector containing only alps that are
@@ -117,7 +263,153 @@ class Flash:
         '''
         return psdb.elf.dv.prune_dv(dv, self.mem_base, self.flash_size)
 
-    def burn_dv(self, dv, bank_swap=False, verbose=True, erase=True):
+    def _make_crc_engine(self):
+        '''
+        Returns a psdb.devices.crc_engine.CRCEngine that can compute CRCs of
+        this flash on the target, or None if the target has no SRAM to run it
+        from or its CPU isn't halted.
+        '''
+        return CRCEngine.make(self.target, self.ap)  # pylint: disable=E1101
+
+    def crc(self, addr, length):
+        '''
+        Returns the CRC32 of a region of flash, as computed by zlib.crc32().
+        The CRC is computed by a routine run on the target if possible so
+        that the region doesn't have to be read back; this destroys the SRAM
+        contents.  If the target has no suitable SRAM or its CPU isn't halted
+        the region is read back instead.
+        '''
+        engine = self._make_crc_engine()
+        if engine:
+            return engine.crcs([(addr, length)])[0]
+        return zlib.crc32(self.read(addr, length))
+
+    def _block_matches(self, block):
+        '''
+        Returns True if the flash already holds the contents of the block.
+        '''
+        return self.read(block.addr, len(block.data)) == block.data
+
+    def _check_block(self, block):
+        '''
+        Reads back the block from flash and raises FlashWriteException
+        describing the differences if it doesn't match.
+        '''
+        mem = self.read(block.addr, len(block.data))
+        if mem == block.data:
+            return
+        bad = [i for i, (a, b) in enumerate(zip(block.data, mem)) if a != b]
+        i   = bad[0]
+        raise FlashWriteException(
+            'Verify failed in [0x%08X - 0x%08X]: %u bytes differ, first at '
+            '0x%08X (expected 0x%02X, read 0x%02X).'
+            % (block.addr, block.addr + len(block.data) - 1, len(bad),
+               block.addr + i, block.data[i], mem[i]))
+
+    def _matching_blocks(self, blocks, crcs, use_crc, verbose):
+        '''
+        Returns a list of booleans indicating which of the blocks already
+        match the contents of flash.  If use_crc is True and the target can
+        run a CRCEngine then their expected CRCs are compared against CRCs
+        computed on the target, clobbering SRAM; otherwise the blocks are
+        read back.
+        '''
+        engine = self._make_crc_engine() if use_crc else None
+        if engine:
+            actual = engine.crcs([(b.addr, len(b.data)) for b in blocks])
+            return [a == c for a, c in zip(actual, crcs)]
+        return [self._block_matches(b)
+                for b in psdb.piter(blocks, verbose=verbose)]
+
+    def _differing_sectors(self, plan, sectors, diff, verbose):
+        '''
+        Returns the subset of the plan's sectors, specified by block number,
+        whose contents aren't already in flash.  Sectors are compared using
+        target CRCs if diff is 'crc' and by reading them back otherwise.
+        '''
+        if verbose:
+            print('Comparing flash...')
+        matches = self._matching_blocks([plan.blocks[n] for n in sectors],
+                                        [plan.crcs[n] for n in sectors],
+                                        diff == 'crc', verbose)
+        differing = [n for n, m in zip(sectors, matches) if not m]
+        if verbose:
+            print('Skipping %u of %u sectors that already match.'
+                  % (len(sectors) - len(differing), len(sectors)))
+        return differing
+
+    def _write_runs(self, runs, loader, verbose):
+        '''
+        Writes a list of (address, data) runs to flash, which must already be
+        erased, through a flash loader if requested and available.  Returns
+        the number of bytes written.
+        '''
+        fl = self._make_loader() if loader else None
+        if verbose and loader:
+            if fl:
+                print('Using flash loader in %s with %u-byte buffers.'
+                      % (fl.ram.name, fl.buf_size))
+            else:
+                print('Flash loader unavailable, writing through the AP.')
+        if verbose:
+            print('Burning flash...')
+
+        if fl:
+            with fl:
+                for addr, data in psdb.piter(runs, verbose=verbose):
+                    fl.write(addr, data)
+        else:
+            self._write_runs_direct(runs, verbose)
+        return sum(len(data) for _, data in runs)
+
+    def _program_runs(self, addr, data):
+        '''
+        Splits data destined for the PROGRAM_UNIT-aligned address into a list
+        of (address, data) runs that need programming, leaving out runs of at
+        least BLANK_RUN_MIN erased bytes.  Run boundaries are aligned to the
+        PROGRAM_UNIT.
+        '''
+        unit = self.PROGRAM_UNIT
+        runs = []
+        pos  = 0
+        for m in BLANK_RUN_RE.finditer(data):
+            start = m.start() + (-m.start() % unit)
+            end   = m.end() - (m.end() % unit)
+            if end - start < BLANK_RUN_MIN:
+                continue
+            if pos < start:
+                runs.append((addr + pos, data[pos:start]))
+            pos = end
+        if pos < len(data):
+            runs.append((addr + pos, data[pos:]))
+        return runs
+
+    def _write_runs_direct(self, runs, verbose):
+        '''
+        Writes a list of (address, data) runs to flash through the MEM-AP
+        using write().  Drivers that can overlap programming operations
+        override this.
+        '''
+        for addr, data in psdb.piter(runs, verbose=verbose):
+            self.write(addr, data, verbose=False)
+
+    def _verify_blocks(self, blocks, crcs, verify, verbose):
+        '''
+        Verifies that the blocks were written correctly.  With verify='crc'
+        the CRC of each block is computed on the target and compared against
+        its expected CRC, and only blocks with a mismatched CRC are read back;
+        with verify='read' every block is read back.  Raises
+        FlashWriteException on a mismatch.
+        '''
+        assert verify in ('read', 'crc')
+        if verify == 'crc':
+            matches = self._matching_blocks(blocks, crcs, True, verbose)
+            blocks  = [b for b, m in zip(blocks, matches) if not m]
+        for block in psdb.piter(blocks, verbose=verbose):
+            self._check_block(block)
+
+    def burn_dv(self, dv, bank_swap=False, verbose=True, erase=True,
+                loader=False, diff=False, verify='read'):
         '''
         Burns the specified data vector to flash, erasing sectors as necessary
         to perform the operation.  The data vector is a list of the form:
@@ -139,38 +431,61 @@ class Flash:
         would be performed to the lower 4K.  This is to allow writing a binary
         linked at an active base address into the inactive half of flash in a
         dual-banked system.
+
+        The loader option programs the flash by running a routine on the
+        target out of SRAM, streaming the data to it while it programs, which
+        is much faster than writing the flash through the MEM-AP.  SRAM
+        contents are destroyed.  If the flash driver doesn't support a loader
+        or there is no suitable SRAM the regular path is used instead.
+
+        The diff option compares each sector of the prepared image against
+        the flash first and only erases and writes the sectors that differ.
+        This makes re-flashing an unchanged or slightly changed image cheap.
+        With diff=True or diff='read' the sectors are read back for the
+        comparison.  With diff='crc' they are compared using CRCs computed by
+        a routine run on the target out of SRAM, which avoids the read-back
+        but destroys the SRAM contents; if there is no suitable SRAM the
+        sectors are read back instead.
+
+        The verify option selects how the written data is checked: 'read'
+        reads everything back, while 'crc' compares CRCs computed on the
+        target out of SRAM, destroying its contents, and only reads back
+        sectors whose CRC doesn't match, to report the differences.  If the
+        target can't run the CRC routine 'crc' falls back to 'read'.
         '''
-        bd = RAMBD(self.sector_size,
-                   first_block=self.mem_base // self.sector_size,
-                   nblocks=self.nsectors)
-        for v in dv:
-            try:
-                addr = self._swap_addr(v[0], v[1]) if bank_swap else v[0]
-                bd.write(addr, v[1])
-            except BlockOutOfRangeException:
-                pass
+        self.burn_plan(BurnPlan.make(self, dv, bank_swap=bank_swap),
+                       verbose=verbose, erase=erase, loader=loader, diff=diff,
+                       verify=verify)
+
+    def burn_plan(self, plan, verbose=True, erase=True, loader=False,
+                  diff=False, verify='read'):
+        '''
+        Burns a psdb.devices.burn_plan.BurnPlan made for this flash.  The
+        options are as described in burn_dv(), which prepares a plan and
+        burns it; callers that burn the same image repeatedly can prepare
+        the plan once and cache it instead.
+        '''
+        if not plan.matches(self):
+            raise FlashException('Burn plan is for a different flash.')
+
+        sectors = sorted(plan.blocks)
+        if diff:
+            sectors = self._differing_sectors(plan, sectors, diff, verbose)
+            if not sectors:
+                return
 
         if erase:
             if verbose:
                 print('Erasing flash...')
-            mask = 0
-            for block in bd.blocks.values():
-                mask |= self._mask_for_alp(block.addr, len(block.data))
-            self.erase_sectors(mask, verbose=verbose)
+            self.erase_sectors(plan.mask_for(sectors), verbose=verbose)
 
         f = self.ap.db.set_max_burn_tck_freq(self)  # pylint: disable=E1101
         if verbose:
             print('Set SWD frequency to %.3f MHz' % (f / 1.e6))
 
-        t0 = time.time()
-        total_len = 0
-        if verbose:
-            print('Burning flash...')
-        for block in psdb.piter(bd.blocks.values(), verbose=verbose):
-            while block.data.endswith(b'\xff'*64):
-                block.data = block.data[:-64]
-            self.write(block.addr, block.data, verbose=False)
-            total_len += len(block.data)
+        t0        = time.time()
+        runs      = [r for n in sectors for r in plan.runs[n]]
+        total_len = self._write_runs(runs, loader, verbose)
 
         if verbose:
             elapsed = time.time() - t0
@@ -183,11 +498,12 @@ class Flash:
 
         if verbose:
             print('Verifying flash...')
-        t0 = time.time()
-        for block in psdb.piter(bd.blocks.values(), verbose=verbose):
-            mem = self.read(block.addr, len(block.data))
-            assert mem == block.data
+        t0         = time.time()
+        blocks     = [plan.blocks[n] for n in sectors]
+        verify_len = sum(len(b.data) for b in blocks)
+        self._verify_blocks(blocks, [plan.crcs[n] for n in sectors], verify,
+                            verbose)
         if verbose:
             elapsed = time.time() - t0
             print('Verified %u bytes in %.2f seconds (%.2f K/s).' %
-                  (total_len, elapsed, total_len / (1024*elapsed)))
+                  (verify_len, elapsed, verify_len / (1024*elapsed)))
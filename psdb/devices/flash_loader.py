@@ -0,0 +1,136 @@
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import struct
+import time
+
+from .flash import FlashWriteException
+from .target_routine import TargetRoutine
+
+
+# The loader and host communicate through a mailbox in SRAM that holds a
+# status word followed by two buffer descriptors:
+#
+#   +0x00 status        - nonzero once the loader has stopped on an error
+#   +0x04 desc0.addr    - flash address to program
+#   +0x08 desc0.len     - bytes to program; 0 means the buffer is free
+#   +0x0C desc0.buf     - SRAM address of the buffer
+#   +0x10 desc1.addr
+#   +0x14 desc1.len
+#   +0x18 desc1.buf
+#
+# The host fills a free buffer and then writes its addr/len pair with a
+# single 8-byte write so that len, which hands the buffer over, lands last.
+# The loader consumes the descriptors alternately, programs the buffer and
+# zeroes len to hand it back.
+MAILBOX      = struct.Struct('<I' + 'III'*2)
+DESC_OFFSETS = (0x04, 0x10)
+
+
+class FlashLoader(TargetRoutine):
+    '''
+    Programs flash by running a small routine out of target SRAM instead of
+    pushing every word into the flash through the MEM-AP and polling for
+    completion from the host.  The routine and two data buffers are placed in
+    a RAMDevice and the CPU is started on the routine; the host then streams
+    the next buffer over SWD while the target programs the previous one.
+
+    The flash driver supplies the routine, which is entered with r0 set to
+    the driver-provided argument and r1 pointing at the mailbox, and the
+    unlocked context manager that prepares the flash controller for it.  On
+    an error the routine stores a nonzero status in the mailbox and executes
+    a BKPT.  Use as a context manager:
+
+        with loader:
+            loader.write(addr, data)
+    '''
+    MIN_BUF_SIZE = 256
+    MAX_BUF_SIZE = 8192
+
+    def __init__(self, flash, cpu, ram, code, arg, unlocked):
+        super().__init__(cpu, ram, code)
+        self.flash    = flash
+        self.arg      = arg
+        self.unlocked = unlocked
+        self.mb_addr  = self.data_addr
+        self.buf_size = min(FlashLoader.MAX_BUF_SIZE,
+                            ((self.data_size - MAILBOX.size) // 2) & ~7)
+        self.bufs     = [self.mb_addr + MAILBOX.size + i * self.buf_size
+                         for i in range(2)]
+        self.index    = 0
+
+    @staticmethod
+    def make(flash, code, arg, unlocked):
+        '''
+        Returns a FlashLoader for the flash, or None if the target doesn't
+        have what the loader needs, in which case the caller should fall back
+        to programming through the MEM-AP.
+        '''
+        cr = TargetRoutine.find_cpu_and_ram(
+                flash.target, flash.ap, len(code),
+                MAILBOX.size + 2 * FlashLoader.MIN_BUF_SIZE)
+        if cr is None:
+            return None
+        return FlashLoader(flash, cr[0], cr[1], code, arg, unlocked)
+
+    def __enter__(self):
+        self.unlocked.__enter__()
+        try:
+            mb = MAILBOX.pack(0, 0, 0, self.bufs[0], 0, 0, self.bufs[1])
+            self.index = 0
+            self.start(mb, r0=self.arg, r1=self.mb_addr)
+        except BaseException as e:
+            self.unlocked.__exit__(type(e), e, e.__traceback__)
+            raise
+        return self
+
+    def __exit__(self, _type, value, traceback):
+        try:
+            try:
+                if _type is None:
+                    self._wait(lambda lens: not any(lens))
+            finally:
+                self.stop()
+        finally:
+            self.unlocked.__exit__(_type, value, traceback)
+
+    def _poll(self):
+        mb = MAILBOX.unpack(self.ap.read_bulk(self.mb_addr, MAILBOX.size))
+        if mb[0]:
+            raise FlashWriteException('Flash loader failed with status '
+                                      '0x%08X.' % mb[0])
+        return mb[2], mb[5]
+
+    def _wait(self, pred):
+        '''
+        Polls the mailbox until pred(lens) is True, where lens holds the len
+        fields of the two descriptors.  Raises FlashWriteException if the
+        loader makes no progress for TIMEOUT seconds.
+        '''
+        lens     = self._poll()
+        deadline = time.time() + FlashLoader.TIMEOUT
+        while not pred(lens):
+            prev = lens
+            lens = self._poll()
+            if lens != prev:
+                deadline = time.time() + FlashLoader.TIMEOUT
+            elif time.time() > deadline:
+                if self.cpu.is_halted():
+                    pc = self.cpu.read_core_register('pc')
+                    raise FlashWriteException('Flash loader halted at '
+                                              '0x%08X.' % pc)
+                raise FlashWriteException('Flash loader timed out.')
+
+    def write(self, addr, data):
+        '''
+        Queues data to be programmed at the specified flash address.  The
+        data must meet the flash driver's alignment requirements.  Returns
+        once the data has been handed to the loader; leaving the context
+        waits for the loader to finish.
+        '''
+        for offset in range(0, len(data), self.buf_size):
+            chunk = data[offset:offset + self.buf_size]
+            i     = self.index
+            self._wait(lambda lens, i=i: not lens[i])
+            self.ap.write_bulk(chunk, self.bufs[i])
+            self.ap.write_bulk(struct.pack('<II', addr + offset, len(chunk)),
+                               self.mb_addr + DESC_OFFSETS[i])
+            self.index = i ^ 1
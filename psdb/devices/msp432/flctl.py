@@ -11,19 +11,19 @@ ORM_FLWAIT = 3
 
 
 def to_hex(s):
-    return ' '.join('%02X' % ord(c) for c in s)
+    return ' '.join('%02X' % c for c in s)
 
 
 def not_bytes(s):
-    return ''.join(chr(0xFF & ~ord(c)) for c in s)
+    return bytes(0xFF & ~c for c in s)
 
 
 def or_bytes(l, r):
-    return ''.join(chr(ord(lc) | ord(rc)) for lc, rc in zip(l, r))
+    return bytes(lc | rc for lc, rc in zip(l, r))
 
 
 def and_bytes(l, r):
-    return ''.join(chr(ord(lc) & ord(rc)) for lc, rc in zip(l, r))
+    return bytes(lc & rc for lc, rc in zip(l, r))
 
 
 class UnlockedContextManager:
@@ -47,6 +47,7 @@ class FLCTL(Device, flash.Flash):
     '''
     Driver for the FLCTL device on the MSP432P401 series of MCUs.
     '''
+    PROGRAM_UNIT = 64
     REGS = [Reg32('BANK0_RDCTL',       0x10),
             Reg32('BANK1_RDCTL',       0x14),
             Reg32('RDBRST_CTLSTAT',    0x20,   [('START',           1),
@@ -202,7 +203,7 @@ class FLCTL(Device, flash.Flash):
         '''
         assert (addr & 0x3F) == 0
         assert len(data_bytes) == 64
-        if data_bytes == '\xFF'*64:
+        if data_bytes == b'\xFF'*64:
             return
 
         verify_bits = (1 << 7) | (1 << 6)
@@ -224,7 +225,7 @@ class FLCTL(Device, flash.Flash):
                 fail_bits        = not_bytes(or_bytes(exist_data, new_data))
                 updated_new_data = or_bytes(new_data, fail_bits)
                 self._set_rdmode(addr, 0)
-                if updated_new_data != '\xFF'*64:
+                if updated_new_data != b'\xFF'*64:
                     print('0x%08X: Pre-program auto-verify error.' % addr)
                     print('      data_bytes: %s' % to_hex(data_bytes))
                     print('      exist_data: %s' % to_hex(exist_data))
@@ -242,7 +243,7 @@ class FLCTL(Device, flash.Flash):
                 fail_bits        = and_bytes(not_bytes(temp_var), actual_data)
                 updated_new_data = not_bytes(fail_bits)
                 self._set_rdmode(addr, 0)
-                if fail_bits == '\x00'*64:
+                if fail_bits == b'\x00'*64:
                     return
                 print('0x%08X: Post-program auto-verify error.' % addr)
                 print('      data_bytes: %s' % to_hex(data_bytes))
@@ -290,6 +291,48 @@ class FLCTL(Device, flash.Flash):
             for i in range(0, len(data), 64):
                 self._write_burst_unlocked(addr + i, data[i:i+64])
 
+    def _write_bulk_unlocked(self, addr, data):
+        '''
+        Programs the data using the full-word auto-verify programming mode
+        and returns the final IFG value.  The status and IFG registers are
+        polled together in a single batched read.
+        '''
+        self._CLRIFG      = 0x0000033F
+        self._PRG_CTLSTAT = 0x0000000B
+        self.ap.write_bulk(data, addr)
+        while True:
+            with self.batch():
+                ctlstat = self._PRG_CTLSTAT.read()
+                ifg     = self._IFG.read()
+            if not ctlstat.value & 0x00030000:
+                return ifg.value
+
+    def _repulse_lines_unlocked(self, addr, data, verbose):
+        '''
+        Finds the 64-byte lines of a bulk write that didn't fully program by
+        reading them back in program-verify mode and reprograms just those
+        lines using burst programming, which pulses them again as necessary.
+        Bits outside the written region are left alone.
+        '''
+        base     = addr & ~0x3F
+        end      = (addr + len(data) + 0x3F) & ~0x3F
+        expected = (b'\xFF' * (addr - base) + data +
+                    b'\xFF' * (end - addr - len(data)))
+
+        self._set_rdmode(addr, 3)
+        actual = self.ap.read_bulk(base, end - base)
+        self._set_rdmode(addr, 0)
+
+        self._set_prgbrst_idle()
+        for i in range(0, end - base, 64):
+            line      = expected[i:i + 64]
+            fail_bits = and_bytes(not_bytes(line), actual[i:i + 64])
+            if fail_bits == b'\x00'*64:
+                continue
+            if verbose:
+                print('0x%08X: Re-pulsing line.' % (base + i))
+            self._write_burst_unlocked(base + i, line)
+
     def _write_bulk(self, addr, data, verbose=True):
         '''
         Writes 16-byte lines of data to the flash.  The address must be 16-byte
@@ -300,7 +343,9 @@ class FLCTL(Device, flash.Flash):
         The target region to be written must be in the erased state.
 
         This is ridiculously faster compared to doing PRGBRST operations
-        because we don't need to do a bunch of register setups.
+        because we don't need to do a bunch of register setups.  If the
+        controller reports a programming or verify error, only the lines that
+        failed are reprogrammed with PRGBRST operations.
         '''
         assert self.target.is_halted()
         if not data:
@@ -314,23 +359,12 @@ class FLCTL(Device, flash.Flash):
                     addr, addr + len(data) - 1))
 
         with self._flash_mask_unlocked(self._mask_for_alp(addr, len(data))):
-            self._CLRIFG      = 0x0000033F
-            self._PRG_CTLSTAT = 0x0000000B
-            self.ap.write_bulk(data, addr)
-            while self._PRG_CTLSTAT.STATUS:
-                pass
-
-            v = self._IFG.read()
+            v = self._write_bulk_unlocked(addr, data)
             if v & 0x00000206:
-                # TODO: If we see post-program verify errors, we need to switch
-                #       to Program-Verify mode, re-read everything and find the
-                #       lines that failed to program properly and pulse them
-                #       again.
-                #       Currently, we let the caller handle this by catching
-                #       the exception and then reattempting using write_sector
-                #       which is slower but handles multiple write pulses.
-                raise flash.FlashWriteException(
-                        'Flash operation failed, IFG=0x%08X' % v)
+                if verbose:
+                    print('Bulk write failed with IFG=0x%08X, re-pulsing '
+                          'failed lines.' % v)
+                self._repulse_lines_unlocked(addr, data, verbose)
 
     def _verify_flash_erased(self, addr, length):
         '''
@@ -416,23 +450,12 @@ class FLCTL(Device, flash.Flash):
         '''
         Writes data to flash.  The data must be 16-byte aligned and be a
         multiple of 16 bytes in length.  The data must not span multiple flash
-        banks.
+        banks.  Blank 64-byte lines are skipped.
 
         The target region should already have been erased.
         '''
         assert self.mem_base <= addr
         assert addr + len(data) <= self.mem_base + self.flash_size
 
-        try:
-            self._write_bulk(addr, data, verbose=verbose)
-        except flash.FlashWriteException as e:
-            # Hack until we implement proper pulsing in _write_bulk.
-            if (addr & self.sector_mask) != 0:
-                raise Exception('not aligned') from e
-            if len(data) % 64:
-                raise Exception('not 64-byte multiple') from e
-
-            print('Exception doing bulk write; attempting burst writes')
-            print('-- Exception: %s' % e)
-            self._write_sector(addr, data, verbose=verbose,
-                               already_erased=False)
+        for run_addr, run in self._program_runs(addr, data):
+            self._write_bulk(run_addr, run, verbose=verbose)
@@ -1,6 +1,63 @@
 # Copyright (c) 2019 Phase Advanced Sensor Systems, Inc.
 from ..device import Device
 from ..flash import Flash
+from ..flash_loader import FlashLoader
+
+
+# Thumb (ARMv6-M) flash loader for use with FlashLoader.  Entered with r0 =
+# &FLASH_SR (FLASH_CR follows it) and r1 = the mailbox; for each descriptor it
+# sets CR.PG, copies the buffer into flash a double-word at a time waiting for
+# SR.BSY/CFGBSY to clear after each one, then clears CR.PG and releases the
+# buffer.  If SR shows an error it stores SR in the mailbox status and halts.
+LOADER_CODE = bytes.fromhex(
+    # start:
+    '0a1d'        # adds    r2, r1, #4
+    # wait_desc:
+    '5368'        # ldr     r3, [r2, #4]
+    '002b'        # cmp     r3, #0
+    'fcd0'        # beq     wait_desc
+    '1468'        # ldr     r4, [r2, #0]
+    '9568'        # ldr     r5, [r2, #8]
+    '0126'        # movs    r6, #1
+    '4660'        # str     r6, [r0, #4]
+    # program:
+    '2e68'        # ldr     r6, [r5, #0]
+    '2660'        # str     r6, [r4, #0]
+    '6e68'        # ldr     r6, [r5, #4]
+    '6660'        # str     r6, [r4, #4]
+    '0834'        # adds    r4, #8
+    '0835'        # adds    r5, #8
+    # wait_bsy:
+    '0668'        # ldr     r6, [r0, #0]
+    '0b4f'        # ldr     r7, busy_mask
+    '3e42'        # tst     r6, r7
+    'fbd1'        # bne     wait_bsy
+    '0a4f'        # ldr     r7, error_mask
+    '3e42'        # tst     r6, r7
+    '0bd1'        # bne     error
+    '083b'        # subs    r3, #8
+    'f0d8'        # bhi     program
+    '0026'        # movs    r6, #0
+    '4660'        # str     r6, [r0, #4]
+    '5660'        # str     r6, [r2, #4]
+    '0c32'        # adds    r2, #12
+    'cf1d'        # adds    r7, r1, #7
+    '1537'        # adds    r7, #21
+    'ba42'        # cmp     r2, r7
+    'e1d1'        # bne     wait_desc
+    '183a'        # subs    r2, #24
+    'dfe7'        # b       wait_desc
+    # error:
+    '0027'        # movs    r7, #0
+    '4760'        # str     r7, [r0, #4]
+    '0e60'        # str     r6, [r1, #0]
+    '00be'        # bkpt    #0
+    'c046'        # nop
+    # busy_mask:
+    '00000500'    # .word   0x00050000
+    # error_mask:
+    'f8c30000'    # .word   0x0000C3F8
+    )
 
 
 def block_in_region(addr, size, region_base, region_len):
@@ -41,10 +98,30 @@ class UnlockedOptionsContextManager:
         self.flash._CR.OPTLOCK = 1
 
 
+class LoaderContextManager:
+    def __init__(self, flash):
+        self.flash    = flash
+        self.unlocked = UnlockedContextManager(flash)
+
+    def __enter__(self):
+        self.unlocked.__enter__()
+        self.flash._clear_errors()
+
+    def __exit__(self, _type, value, traceback):
+        try:
+            self.flash._CR = 0
+            if _type is None:
+                self.flash._check_errors()
+        finally:
+            self.unlocked.__exit__(_type, value, traceback)
+
+
 class FLASH(Device, Flash):
     '''
     Common base class for many STM32 flash devices.
     '''
+    PROGRAM_UNIT = 8
+
     def __init__(self, target, regs, sector_size, ap, name, dev_base, mem_base,
                  max_nowait_write_freq, otp_base, otp_len, **kwargs):
         Device.__init__(self, target, ap, dev_base, name, regs, **kwargs)
@@ -64,6 +141,10 @@ class FLASH(Device, Flash):
     def _clear_errors(self):
         self._SR = self._SR
 
+    def _make_loader(self):
+        return FlashLoader.make(self, LOADER_CODE, self.dev_base + 0x10,
+                                LoaderContextManager(self))
+
     def _check_errors(self):
         v = self._SR.read()
         if v & 0x0000C3F8:
@@ -85,14 +166,27 @@ class FLASH(Device, Flash):
                     addr, addr + self.sector_size - 1))
 
         with self._flash_unlocked():
-            self._clear_errors()
-            self._CR = ((n << 3) | (1 << 1))
-            try:
-                self._CR = ((1 << 16) | (n << 3) | (1 << 1))
-                self._wait_bsy_clear()
-                self._check_errors()
-            finally:
-                self._CR = 0
+            self._erase_sector_unlocked(n)
+
+    def _erase_unlocked(self):
+        return self._flash_unlocked()
+
+    def _erase_unlocked_op(self, cr):
+        '''
+        Performs an erase operation selected by the CR bits, setting STRT
+        after them.  The flash must already be unlocked.
+        '''
+        self._clear_errors()
+        self._CR = cr
+        try:
+            self._CR = cr | (1 << 16)
+            self._wait_bsy_clear()
+            self._check_errors()
+        finally:
+            self._CR = 0
+
+    def _erase_sector_unlocked(self, n):
+        self._erase_unlocked_op((n << 3) | (1 << 1))
 
     def erase_all(self, verbose=True):
         '''
@@ -101,14 +195,7 @@ class FLASH(Device, Flash):
         if verbose:
             print('Erasing entire flash...')
         with self._flash_unlocked():
-            self._clear_errors()
-            self._CR = (1 << 15) | (1 << 2)
-            try:
-                self._CR = (1 << 15) | (1 << 2) | (1 << 16)
-                self._wait_bsy_clear()
-                self._check_errors()
-            finally:
-                self._CR = 0
+            self._erase_unlocked_op((1 << 15) | (1 << 2))
 
     def read(self, addr, length):
         '''
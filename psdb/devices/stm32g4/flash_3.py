@@ -116,19 +116,12 @@ class FLASH_3(flash_type1.FLASH):
                          mem_base, max_write_freq, otp_base, otp_len, **kwargs)
         self.nbanks = (2 if sector_size == 2048 else 1)
 
-    def erase_sector(self, n, verbose=True):
+    def _erase_sector_unlocked(self, n):
         '''
         Erases the nth sector in flash.
         This checks if the flash banks are swapped and erases the appropriate
         sector if it needs to reverse the numbers.
         '''
-        assert 0 <= n < self.nsectors
-
-        addr = self.mem_base + n * self.sector_size
-        if verbose:
-            print('Erasing sector [0x%08X - 0x%08X]...' % (
-                    addr, addr + self.sector_size - 1))
-
         # In dual-bank mode, do the right thing.
         if self.sector_size == 2048:
             bker = (((n >= 128) ^ self.target.fb_mode) << 11)
@@ -136,15 +129,20 @@ class FLASH_3(flash_type1.FLASH):
         else:
             bker = 0
 
-        with self._flash_unlocked():
-            self._clear_errors()
-            self._CR = ((n << 3) | (1 << 1) | bker)
-            try:
-                self._CR = ((1 << 16) | (n << 3) | (1 << 1) | bker)
-                self._wait_bsy_clear()
-                self._check_errors()
-            finally:
-                self._CR = 0
+        self._erase_unlocked_op((n << 3) | (1 << 1) | bker)
+
+    def _bank_masks(self):
+        if self.nbanks != 2 or self.nsectors != 256:
+            return []
+        return [((1 << 128) - 1) << (128 * i) for i in range(2)]
+
+    def _erase_bank_unlocked(self, i):
+        '''
+        Mass-erases the ith bank as currently mapped, using MER1 or MER2
+        depending on whether the banks are swapped.
+        '''
+        mer = (1 << 15) if (i ^ self.target.fb_mode) else (1 << 2)
+        self._erase_unlocked_op(mer)
 
     def swap_banks_and_reset_no_connect(self):
         '''
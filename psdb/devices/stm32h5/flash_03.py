@@ -44,6 +44,7 @@ class FLASH_03(Device, Flash):
     '''
     Driver for the FLASH device on the STM32H503 series of MCUs.
     '''
+    PROGRAM_UNIT = 16
     REGS = [AReg32('ACR',           0x000, [('LATENCY',             0,  3),
                                             ('WRHIGHFREQ',          4,  5),
                                             ('PRFTEN',              8),
@@ -239,21 +240,47 @@ class FLASH_03(Device, Flash):
             print('Erasing sector [0x%08X - 0x%08X]...' % (
                     addr, addr + self.sector_size - 1))
 
+        with self._flash_unlocked():
+            self._erase_sector_unlocked(n)
+
+    def _erase_unlocked(self):
+        return self._flash_unlocked()
+
+    def _erase_unlocked_op(self, cr):
+        '''
+        Performs an erase operation selected by the NSCR bits, setting STRT
+        after them.  The flash must already be unlocked.
+        '''
+        self._clear_errors()
+        self._NSCR = cr
+        try:
+            self._NSCR = cr | (1 << 5)
+            self._wait_bsy_clear()
+            self._check_errors()
+        finally:
+            self._NSCR = 0
+
+    def _erase_sector_unlocked(self, n):
         # Do the right thing if the banks are swapped.
         bank_swap    = bool(self._OPTCR.SWAP_BANK)
         bank_sectors = self.nsectors // 2
         bksel        = ((n >= bank_sectors) ^ bank_swap)
         n            = (n % bank_sectors)
 
-        with self._flash_unlocked():
-            self._clear_errors()
-            self._NSCR = ((bksel << 31) | (n << 6) | (1 << 2))
-            try:
-                self._NSCR = ((1 << 5) | (bksel << 31) | (n << 6) | (1 << 2))
-                self._wait_bsy_clear()
-                self._check_errors()
-            finally:
-                self._NSCR = 0
+        self._erase_unlocked_op((bksel << 31) | (n << 6) | (1 << 2))
+
+    def _bank_masks(self):
+        bank_sectors = self.nsectors // 2
+        return [((1 << bank_sectors) - 1) << (bank_sectors * i)
+                for i in range(2)]
+
+    def _erase_bank_unlocked(self, i):
+        '''
+        Erases the ith bank as currently mapped using BER, selecting the
+        physical bank with BKSEL according to SWAP_BANK.
+        '''
+        bksel = (i ^ bool(self._OPTCR.SWAP_BANK))
+        self._erase_unlocked_op((bksel << 31) | (1 << 3))
 
     def read(self, addr, length):
         '''
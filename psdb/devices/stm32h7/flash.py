@@ -1,4 +1,8 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
+import contextlib
+import functools
+
+import psdb
 from ..device import Device, Reg32, Reg32R, Reg32W
 from ..flash import Flash
 
@@ -97,11 +101,22 @@ class FlashBank(Device):
     def _clear_errors(self):
         self._CCR = 0x0FEF0000
 
-    def _check_errors(self):
-        v = self._SR.read()
+    def _check_errors(self, v=None):
+        if v is None:
+            v = self._SR.read()
         if v & 0x0FEE0000:
             raise Exception('Flash operation failed, FLASH_SR=0x%08X' % v)
 
+    def _start_erase_sector(self, n):
+        v  = self._CR.read() & ~0x0000070C
+        v |= (n << 8) | (1 << 7) | (1 << 2)
+        self._CR = v
+
+    def _start_erase_bank(self):
+        v  = self._CR.read() & ~0x0000070C
+        v |= (1 << 7) | (1 << 3)
+        self._CR = v
+
     def _wait_prg_idle(self):
         while self._SR.read() & 7:
             pass
@@ -153,6 +168,11 @@ class FLASH(Device, Flash):
     '''
     Driver for the FLASH device on the STM32H7xx series of MCUs.
     '''
+    PROGRAM_UNIT = 32
+
+    # Size of the slices that dual-bank writes alternate between the banks.
+    WRITE_SLICE  = 4096
+
     REGS_DUAL_BANK = [
             Reg32 ('ACR',           0x000),
             Reg32W('OPTKEYR',       0x008),
@@ -218,12 +238,128 @@ class FLASH(Device, Flash):
         bank = self.banks[n // self.sectors_per_bank]
         with self._flash_bank_unlocked(bank):
             bank._clear_errors()
-            v  = bank._CR.read() & ~0x00000700
-            v |= ((n % self.sectors_per_bank) << 8) | (1 << 7) | (1 << 2)
-            bank._CR = v
+            bank._start_erase_sector(n % self.sectors_per_bank)
             bank._wait_prg_idle()
             bank._check_errors()
 
+    def _banks_unlocked(self):
+        '''
+        Returns a context manager that holds every bank unlocked with its
+        errors cleared.
+        '''
+        stack = contextlib.ExitStack()
+        for bank in self.banks:
+            stack.enter_context(self._flash_bank_unlocked(bank))
+            bank._clear_errors()
+        return stack
+
+    def _wait_banks_idle(self, active):
+        '''
+        Waits for every bank flagged in active to finish its operation.
+        '''
+        for bank, a in zip(self.banks, active):
+            if a:
+                bank._wait_prg_idle()
+
+    def _interleave(self, queues):
+        '''
+        Runs a queue of operations on each bank, keeping both banks busy.
+        Each queue entry is a function that starts an operation on its bank.
+        While any bank is busy, the status registers of all the banks are
+        fetched in a single batched read, and each bank's next operation is
+        started as soon as the bank goes idle.  This is a generator that
+        yields once as each operation completes.  If anything fails, the
+        other banks are allowed to go idle before the exception propagates so
+        that they aren't locked mid-operation.
+        '''
+        queues = [list(q) for q in queues]
+        active = [False] * len(self.banks)
+        while True:
+            try:
+                for i, q in enumerate(queues):
+                    if q and not active[i]:
+                        active[i] = True
+                        q.pop(0)()
+                if not any(active):
+                    return
+
+                with self.batch():
+                    srs = [bank._SR.read() for bank in self.banks]
+                done = []
+                for i, bank in enumerate(self.banks):
+                    v = srs[i].value
+                    if active[i] and not v & 7:
+                        active[i] = False
+                        bank._check_errors(v)
+                        done.append(i)
+            except Exception:
+                self._wait_banks_idle(active)
+                raise
+            for _ in done:
+                yield
+
+    def _bank_masks(self):
+        return [((1 << self.sectors_per_bank) - 1) <<
+                (i * self.sectors_per_bank) for i in range(len(self.banks))]
+
+    def erase_sectors(self, mask, verbose=True):
+        '''
+        Erases the sectors specified in the bit mask, using bank erase for
+        banks that are entirely selected.  On dual-bank parts the two banks
+        erase in parallel, each working through its own operations.
+        '''
+        plan = self._plan_erase(mask)
+        if plan == [('all', None)]:
+            self.erase_all(verbose=verbose)
+            return
+
+        queues = [[] for _ in self.banks]
+        for op, n in plan:
+            if op == 'bank':
+                queues[n].append(self.banks[n]._start_erase_bank)
+            else:
+                i = n // self.sectors_per_bank
+                queues[i].append(
+                    functools.partial(self.banks[i]._start_erase_sector,
+                                      n % self.sectors_per_bank))
+        nops = sum(len(q) for q in queues)
+        with self._banks_unlocked():
+            ops = self._interleave(queues)
+            for _ in psdb.piter(range(nops), verbose=verbose):
+                next(ops)
+
+    def _write_runs_direct(self, runs, verbose):
+        '''
+        Writes a list of (address, data) runs to flash.  On dual-bank parts,
+        runs are cut into WRITE_SLICE-byte slices that are written to the two
+        banks alternately.  The MEM-AP streams one slice at a time, so the
+        banks only overlap while a bank finishes programming the last flash
+        word of its slice as the next slice streams into the other bank; the
+        overlap is small, and the bulk of the dual-bank gain is in
+        erase_sectors().
+        '''
+        if len(self.banks) == 1:
+            super()._write_runs_direct(runs, verbose)
+            return
+
+        assert self.target.is_halted()
+        queues = [[] for _ in self.banks]
+        for addr, data in runs:
+            assert len(data) % 32 == 0
+            assert addr % 32 == 0
+            assert self.mem_base <= addr
+            assert addr + len(data) <= self.mem_base + self.flash_size
+            i = (addr - self.mem_base) // self.bank_size
+            for pos in range(0, len(data), self.WRITE_SLICE):
+                queues[i].append(functools.partial(
+                    self.ap.write_bulk, data[pos:pos + self.WRITE_SLICE],
+                    addr + pos))
+        nops = sum(len(q) for q in queues)
+        with self._banks_unlocked():
+            ops = self._interleave(queues)
+            for _ in psdb.piter(range(nops), verbose=verbose):
+                next(ops)
+
     def erase_all(self, verbose=True):
         '''
         Erases the entire flash.
@@ -45,6 +45,7 @@ class FLASH(Device, Flash):
     '''
     Driver for the FLASH device on the STM32U585 series of MCUs.
     '''
+    PROGRAM_UNIT = 16
     REGS = [AReg32('ACR',           0x000, [('LATENCY',         0, 3),
                                             ('PRFTEN',          8),
                                             ('LPM',             11),
@@ -247,13 +248,37 @@ class FLASH(Device, Flash):
             print('Erasing sector [0x%08X - 0x%08X]...' % (
                     addr, addr + self.sector_size - 1))
 
+        with self._flash_unlocked():
+            self._erase_sector_unlocked(n)
+
+    def _erase_unlocked(self):
+        return self._flash_unlocked()
+
+    def _erase_unlocked_op(self, cr):
+        '''
+        Performs an erase operation selected by the NSCR bits, setting STRT
+        after them.  The flash must already be unlocked.
+        '''
+        self._clear_errors()
+        self._NSCR = cr
+        try:
+            self._NSCR = cr | (1 << 16)
+            self._wait_bsy_clear()
+            self._check_errors()
+        finally:
+            self._NSCR = 0
+
+    def _is_dual_bank(self):
+        return self._OPTR.DUALBANK or self.nsectors == 256
+
+    def _erase_sector_unlocked(self, n):
         # In dual-bank mode, do the right thing if the banks are swapped.  Note
         # that the U5 does not suffer from the FB_MODE/BFB2 synchronization
         # issues that the G4 does; the SWAP_BANK setting is honored by the MCU
         # before the reset vector is fetched rather than relying on boot ROM
         # code to flip an FB_MODE-like bit, so all we have to do is invert the
         # BKER bit if SWAP_BANK is set.
-        if self._OPTR.DUALBANK or self.nsectors == 256:
+        if self._is_dual_bank():
             bank_swap    = bool(self._OPTR.SWAP_BANK)
             bank_sectors = self.nsectors // 2
             bker         = ((n >= bank_sectors) ^ bank_swap)
@@ -261,15 +286,24 @@ class FLASH(Device, Flash):
         else:
             bker = 0
 
-        with self._flash_unlocked():
-            self._clear_errors()
-            self._NSCR = ((n << 3) | (1 << 1))
-            try:
-                self._NSCR = ((1 << 16) | (bker << 11) | (n << 3) | (1 << 1))
-                self._wait_bsy_clear()
-                self._check_errors()
-            finally:
-                self._NSCR = 0
+        self._erase_unlocked_op((bker << 11) | (n << 3) | (1 << 1))
+
+    def _bank_masks(self):
+        if not self._is_dual_bank():
+            return [self.all_mask]
+        bank_sectors = self.nsectors // 2
+        return [((1 << bank_sectors) - 1) << (bank_sectors * i)
+                for i in range(2)]
+
+    def _erase_bank_unlocked(self, i):
+        '''
+        Mass-erases the ith bank as currently mapped, using MER1 or MER2
+        depending on whether the banks are swapped.
+        '''
+        if self._is_dual_bank() and (i ^ bool(self._OPTR.SWAP_BANK)):
+            self._erase_unlocked_op(1 << 15)
+        else:
+            self._erase_unlocked_op(1 << 2)
 
     def read(self, addr, length):
         '''
@@ -0,0 +1,111 @@
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import time
+
+
+class RoutineException(Exception):
+    pass
+
+
+class TargetRoutine:
+    '''
+    Runs a small routine on the target CPU out of SRAM.  The routine must be
+    position-independent and use only the ARMv6-M subset of Thumb so that it
+    runs on every Cortex-M.  It is placed at the start of a RAMDevice,
+    followed by its data area; the stack occupies the top STACK_SIZE bytes.
+    The routine signals completion or failure with a BKPT.
+
+    start() saves the CPU registers that a routine may disturb, uploads the
+    code and data and starts the CPU with interrupts masked; stop() halts it
+    and restores the registers, leaving the CPU halted where it was.  The
+    SRAM contents are clobbered.
+    '''
+    STACK_SIZE = 64
+    TIMEOUT    = 5
+
+    def __init__(self, cpu, ram, code):
+        self.cpu       = cpu
+        self.ap        = cpu.ap
+        self.ram       = ram
+        self.code      = code + b'\x00' * (-len(code) & 3)
+        self.code_addr = ram.dev_base
+        self.data_addr = self.code_addr + len(self.code)
+        self.data_size = TargetRoutine._data_size(ram, len(self.code))
+        self.sp        = (ram.dev_base + ram.size) & ~7
+        self.ctrl      = 'cfbp' if 'cfbp' in cpu.scs.core_regs else 'cp'
+        self.regs      = ['r0', 'r1', 'r2', 'r3', 'r4', 'r5', 'r6', 'r7',
+                          'msp', 'pc', 'xpsr', self.ctrl]
+        self.saved     = None
+
+    @staticmethod
+    def _data_size(ram, code_len):
+        code_len += (-code_len & 3)
+        return (ram.size - code_len - TargetRoutine.STACK_SIZE) & ~7
+
+    @staticmethod
+    def find_ram(target, ap, code_len, data_size):
+        '''
+        Returns the largest SRAM that is on the specified AP, lies in the
+        Cortex-M SRAM region where code can execute and has room for the
+        routine and data_size bytes of data, or None if there isn't one.
+        '''
+        rams = [r for r in target.ram_devs.values()
+                if r.ap is ap and
+                0x20000000 <= r.dev_base < 0x40000000 and
+                r.name != 'Backup SRAM' and
+                TargetRoutine._data_size(r, code_len) >= data_size]
+        return max(rams, key=lambda r: r.size, default=None)
+
+    @staticmethod
+    def find_cpu_and_ram(target, ap, code_len, data_size):
+        '''
+        Returns a (cpu, ram) tuple to run a routine on, or None if the target
+        doesn't have a CPU and suitable SRAM on the specified AP or the CPU
+        isn't halted.  A running CPU is left alone since its state can't be
+        saved and restored around the routine.
+        '''
+        if not target.cpus or target.cpus[0].ap is not ap:
+            return None
+        if not target.cpus[0].is_halted():
+            return None
+        ram = TargetRoutine.find_ram(target, ap, code_len, data_size)
+        if ram is None:
+            return None
+        return target.cpus[0], ram
+
+    def start(self, data=b'', **regs):
+        '''
+        Saves the CPU state, uploads the routine followed by the data and
+        starts the CPU on the routine with the specified core registers set.
+        '''
+        assert self.cpu.is_halted()
+        assert len(data) <= self.data_size
+        self.saved = [(name, self.cpu.read_core_register(name))
+                      for name in self.regs]
+        try:
+            self.ap.write_bulk(self.code + data, self.code_addr)
+            self.cpu.write_core_register(0x00000001, self.ctrl)
+            self.cpu.write_core_register(self.sp, 'msp')
+            for name, v in regs.items():
+                self.cpu.write_core_register(v, name)
+            self.cpu.write_core_register(self.code_addr, 'pc')
+            self.cpu.write_core_register(0x01000000, 'xpsr')
+            self.cpu.resume()
+        except BaseException:
+            self.stop()
+            raise
+
+    def stop(self):
+        '''Halts the CPU and restores the state saved by start().'''
+        self.cpu.halt()
+        for name, v in self.saved:
+            self.cpu.write_core_register(v, name)
+
+    def wait_halted(self, timeout=None):
+        '''
+        Waits for the routine to execute its BKPT and returns the halted PC.
+        '''
+        deadline = time.time() + (timeout or TargetRoutine.TIMEOUT)
+        while not self.cpu.is_halted():
+            if time.time() > deadline:
+                raise RoutineException('Target routine timed out.')
+        return self.cpu.read_core_register('pc')
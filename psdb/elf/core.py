@@ -1,9 +1,8 @@
 # Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
 import struct
 
-from .mmap import MemMap
+from .mmap import MemMap, MemRegion
 from .note import NoteSection
-from ..util import round_up_pow_2
 
 
 class CoreThread:
@@ -20,6 +19,19 @@ class CoreThread:
 
 
 class Core:
+    '''
+    Builds an ELF core file from memory regions and thread register sets.
+
+    Memory is either added up front with add_mem_map() or as a producer
+    with add_mem_region(), in which case it is read in chunks of about
+    CHUNK_SIZE bytes, rounded to a multiple of elide_size, while the core is
+    written and is never held in memory as a whole.  Memory is written in
+    elide_size pages aligned in the address space; whole pages that are
+    entirely 0x00 or entirely 0xFF are left out of the core, and the
+    remaining runs of pages each get their own PT_LOAD segment.  A debugger
+    reports elided memory as inaccessible.  Set elide_size to None to keep
+    everything.
+    '''
     EHDR_FORMAT = '<8B8xHHLLLLLHHHHHH'
     EHDR_SIZE   = struct.calcsize(EHDR_FORMAT)
 
@@ -29,20 +41,15 @@ class Core:
     SHDR_FORMAT = '<LLLLLLLLLL'
     SHDR_SIZE   = struct.calcsize(SHDR_FORMAT)
 
-    def __init__(self):
-        self.mmaps   = []
-        self.threads = []
-        self.notes   = []
+    CHUNK_SIZE  = 0x10000
 
-    @property
-    def phoff(self):
-        return Core.EHDR_SIZE if self.mmaps else 0
+    def __init__(self, elide_size=4096):
+        self.mmaps      = []
+        self.threads    = []
+        self.notes      = []
+        self.elide_size = elide_size
 
-    @property
-    def shoff(self):
-        return self.phoff + (1 + len(self.mmaps))*Core.PHDR_SIZE
-
-    def _write_elf_header(self, f):
+    def _write_elf_header(self, f, phoff, phnum):
         data = struct.pack(Core.EHDR_FORMAT,
                            0x7F, ord('E'), ord('L'), ord('F'),
                            1,                # e_ident[4] = ELFCLASS32
@@ -53,13 +60,12 @@ class Core:
                            40,               # e_machine  = EM_ARM
                            1,                # e_version  = EV_CURRENT
                            0,                # e_entry
-                           self.phoff,       # e_phoff
+                           phoff,            # e_phoff
                            0,                # e_shoff
                            0,                # e_flags
                            Core.EHDR_SIZE,   # e_ehsize
                            Core.PHDR_SIZE,   # e_phentsize
-                           len(self.notes) +
-                           len(self.mmaps),  # e_phnum
+                           phnum,            # e_phnum
                            Core.SHDR_SIZE,   # e_shentsize
                            0,                # e_shnum
                            0                 # e_shstrndx
@@ -79,14 +85,14 @@ class Core:
                            )
         f.write(data)
 
-    def _write_pt_load_phdr(self, f, mmap, p_offset):
+    def _write_pt_load_phdr(self, f, addr, p_offset, size):
         data = struct.pack(Core.PHDR_FORMAT,
                            1,               # p_type = PT_LOAD
                            p_offset,        # p_offset
-                           mmap.addr,       # p_vaddr
-                           mmap.addr,       # p_paddr
-                           len(mmap.data),  # p_filesz
-                           len(mmap.data),  # p_memsz
+                           addr,            # p_vaddr
+                           addr,            # p_paddr
+                           size,            # p_filesz
+                           size,            # p_memsz
                            0x7,             # p_flags = rwx
                            1,               # p_align
                            )
@@ -99,6 +105,16 @@ class Core:
         '''
         self.mmaps.append(MemMap(addr, data))
 
+    def add_mem_region(self, addr, size, producer):
+        '''
+        Adds a region of size bytes at the specified virtual address whose
+        contents will be fetched from the producer while the core is written.
+        The producer is either a callable taking an address and a length,
+        such as a device's read_mem_block() method, or an iterable of byte
+        chunks.
+        '''
+        self.mmaps.append(MemRegion(addr, size, producer))
+
     def add_thread(self, regs, pid=1, sig=6):
         '''
         Adds a thread.  The registers are either a 17- or 18-entry array with
@@ -117,45 +133,91 @@ class Core:
         with open(path, 'wb') as f:
             self.write_to_file_object(f)
 
+    def _write_pages(self, f, base, addr, data, page_size, segments):
+        '''
+        Writes data destined for addr to the file, one page at a time with
+        page boundaries aligned to page_size in the address space, skipping
+        whole pages that are blank when elision is enabled.  Each page that
+        is written either extends the last of the [addr, p_offset, size]
+        segments or starts a new one.
+        '''
+        blanks = ((b'\x00' * page_size, b'\xff' * page_size)
+                  if self.elide_size else ())
+        mv     = memoryview(data)
+        pos    = 0
+        while pos < len(mv):
+            page = mv[pos:pos + page_size - (addr + pos) % page_size]
+            if page not in blanks:
+                offset = f.tell() - base
+                seg    = segments[-1] if segments else None
+                if (seg is None or seg[0] + seg[2] != addr + pos or
+                        seg[1] + seg[2] != offset):
+                    seg = [addr + pos, offset, 0]
+                    segments.append(seg)
+                f.write(page)
+                seg[2] += len(page)
+            pos += len(page)
+
+    def _write_mem(self, f, m, base):
+        '''
+        Streams a memory map into the file, leaving out blank pages.  Returns
+        a list of [addr, p_offset, size] segments for what was written.
+
+        Incoming chunks are buffered until they complete a page, so elision
+        doesn't depend on how the producer sizes its chunks.  Only whole
+        pages are elided; partial pages at either end of the region are
+        always kept.
+        '''
+        page_size  = self.elide_size or Core.CHUNK_SIZE
+        chunk_size = page_size * max(1, Core.CHUNK_SIZE // page_size)
+        segments   = []
+        addr       = m.addr
+        buf        = bytearray()
+        for chunk in m.iter_chunks(chunk_size):
+            buf += chunk
+            end  = addr + len(buf)
+            n    = max(0, len(buf) - end % page_size)
+            if n:
+                self._write_pages(f, base, addr, buf[:n], page_size, segments)
+                del buf[:n]
+                addr += n
+        self._write_pages(f, base, addr, buf, page_size, segments)
+        return segments
+
     def write_to_file_object(self, f):
         '''
         Writes the core file to the specified file-like object.  It should be
-        opened in binary format.
-        '''
-        # Compute the length of all combined headers and then find where the
-        # data offset would be from there based on the data alignment.
-        hdr_size    = (Core.EHDR_SIZE +
-                       len(self.notes)*Core.PHDR_SIZE +
-                       len(self.mmaps)*Core.PHDR_SIZE)
-        note_offset = hdr_size
-        note_size   = sum(len(n.data) for n in self.notes)
-        data_align  = 1
-        data_offset = round_up_pow_2(hdr_size + note_size, data_align)
-
-        # Start with the ELF header.
-        self._write_elf_header(f)
-
-        # Now, write each PT_NOTE header.
-        pos = note_offset
-        for n in self.notes:
-            self._write_pt_note_phdr(f, pos, n.data)
-            pos += len(n.data)
+        opened in binary format and must be seekable.
 
-        # Now, write a PT_LOAD header for each memory mapping.
-        pos = data_offset
-        for m in self.mmaps:
-            self._write_pt_load_phdr(f, m, pos)
-            pos += round_up_pow_2(len(m.data), data_align)
+        The notes and memory are written first, streaming each memory region
+        as it is produced, followed by the program header table; the ELF
+        header is then rewritten to point at the table.
+        '''
+        base = f.tell()
+        f.write(b'\x00'*Core.EHDR_SIZE)
 
-        # Now, write the PT_NOTE sections.
+        # Write the PT_NOTE sections.
+        note_offsets = []
         for n in self.notes:
+            note_offsets.append(f.tell() - base)
             f.write(n.data)
 
-        # Now, write the memory mappings themselves.
-        pos = hdr_size + note_size
-        assert pos == f.tell()
+        # Stream the memory mappings.
+        segments = []
         for m in self.mmaps:
-            pos = f.tell()
-            pad = round_up_pow_2(pos, data_align) - pos
-            f.write(b'\x00'*pad)
-            f.write(m.data)
+            segments += self._write_mem(f, m, base)
+
+        # Write the program header table, with a PT_NOTE header for each note
+        # section and a PT_LOAD header for each memory segment.
+        phoff = f.tell() - base
+        for n, offset in zip(self.notes, note_offsets):
+            self._write_pt_note_phdr(f, offset, n.data)
+        for addr, offset, size in segments:
+            self._write_pt_load_phdr(f, addr, offset, size)
+        end = f.tell()
+
+        # Finally, go back and fill in the ELF header.
+        f.seek(base)
+        self._write_elf_header(f, phoff if segments or self.notes else 0,
+                               len(self.notes) + len(segments))
+        f.seek(end)
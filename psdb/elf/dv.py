@@ -1,4 +1,5 @@
 # Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
+from ..block import IntervalIndex
 
 
 def dv_overlaps_region(dv, addr, size):
@@ -42,14 +43,15 @@ def prune_dv(dv, f_base, f_len):
         if v_base >= f_end or v_end <= f_base:
             continue
 
+        # Trim through a memoryview so that large alps aren't copied.
         if v_base < f_base:
             n       = f_base - v_base
             v_base += n
-            v_data  = v_data[n:]
+            v_data  = memoryview(v_data)[n:]
 
         if v_end > f_end:
             n      = v_end - f_end
-            v_data = v_data[:-n]
+            v_data = memoryview(v_data)[:-n]
 
         pdv.append((v_base, v_data))
 
@@ -61,8 +63,13 @@ def merge_dvs(lhs, rhs):
     Merges lhs and rhs, checking for address conflicts.  Alps from
     rhs will all follow vectors from lhs in the resulting merged vector.
     '''
+    index = IntervalIndex()
+    for alp in lhs:
+        index.add(alp[0], len(alp[1]))
+
     dv = lhs[:]
     for alp in rhs:
-        assert not dv_overlaps_region(dv, alp[0], len(alp[1]))
+        assert not index.overlaps(alp[0], len(alp[1]))
+        index.add(alp[0], len(alp[1]))
         dv.append(alp)
     return dv
@@ -1,37 +1,155 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
+import bisect
+import hashlib
+import mmap
+import os
+
 from elftools.elf.elffile import ELFFile
 
+from .symbol_index import SymbolIndex
+
+
+def _zeroes(n):
+    '''
+    Returns a read-only buffer of n zero bytes.  Where possible it is an
+    anonymous mapping, whose pages the OS only provides when they are read.
+    '''
+    try:
+        return memoryview(mmap.mmap(-1, n, access=mmap.ACCESS_READ))
+    except (OSError, ValueError):
+        return bytes(n)
+
+
+class Segment:
+    '''
+    A PT_LOAD segment.  data is a zero-copy view of the bytes the segment
+    has in the file; the zero padding that follows it in memory up to memsz
+    bytes (typically .bss) is not stored.
+    '''
+    def __init__(self, paddr, vaddr, data, memsz):
+        self.paddr = paddr
+        self.vaddr = vaddr
+        self.data  = data
+        self.memsz = memsz
+
+    def read(self, offset, size):
+        '''
+        Returns size bytes starting at offset into the segment, reading
+        zeroes from the padding.
+        '''
+        assert 0 <= offset and offset + size <= self.memsz
+        if offset >= len(self.data):
+            return bytes(size)
+        data = self.data[offset:offset + size].tobytes()
+        return data + bytes(size - len(data))
+
 
 class ELFBinary:
     '''
     Class used for reading the contents of an existing ELF file; typically used
     by flashing code to analyze an ELF executable and figure out which blocks
     of memory to be written where.
+
+    Symbol lookups go through a SymbolIndex that is built from the symbol
+    table the first time it is needed.  If symbol_cache names a directory,
+    the index is cached there keyed by the SHA-256 of the ELF file.
     '''
-    def __init__(self, file_object):
+    def __init__(self, file_object, symbol_cache=None):
         file_object.seek(0)
-        self.elf_file = ELFFile(file_object)
-        self.symtab   = self.elf_file.get_section_by_name('.symtab')
-        self.entry    = self.elf_file['e_entry']
-        self.pv_dv    = [(s['p_paddr'], s['p_vaddr'],
-                          s.data() + b'\x00'*(s['p_memsz'] - s['p_filesz']))
-                         for s in self.iter_segments()
-                         if s['p_type'] == 'PT_LOAD'
-                         ]
-        self.flash_dv = [(s[0], s[2]) for s in self.pv_dv]
+        self.file_object  = file_object
+        self.symbol_cache = symbol_cache
+        self._sym_index   = None
+        self.elf_file     = ELFFile(file_object)
+        self.symtab       = self.elf_file.get_section_by_name('.symtab')
+        self.entry        = self.elf_file['e_entry']
+        self._map_file(file_object)
+        self.segments     = [Segment(s['p_paddr'], s['p_vaddr'],
+                                     self.mm[s['p_offset']:
+                                             s['p_offset'] + s['p_filesz']],
+                                     s['p_memsz'])
+                             for s in self.iter_segments()
+                             if s['p_type'] == 'PT_LOAD'
+                             ]
+        self._p_index     = sorted(self.segments, key=lambda s: s.paddr)
+        self._p_addrs     = [s.paddr for s in self._p_index]
+        self._v_index     = sorted(self.segments, key=lambda s: s.vaddr)
+        self._v_addrs     = [s.vaddr for s in self._v_index]
+
+        # The .bss padding is given its own alp backed by an anonymous
+        # read-only mapping, so it takes no memory unless something reads it.
+        # It normally lies in SRAM and is pruned before anything does.
+        self.flash_dv = []
+        for s in self.segments:
+            if s.data:
+                self.flash_dv.append((s.paddr, s.data))
+            if s.memsz > len(s.data):
+                self.flash_dv.append((s.paddr + len(s.data),
+                                      _zeroes(s.memsz - len(s.data))))
+
+    def _map_file(self, file_object):
+        '''
+        Maps the file into memory so that segment data can be sliced out of
+        it without copying; file objects that can't be mapped are read.
+        '''
+        try:
+            self.mm = memoryview(mmap.mmap(file_object.fileno(), 0,
+                                           access=mmap.ACCESS_READ))
+        except (AttributeError, OSError, ValueError):
+            file_object.seek(0)
+            self.mm = memoryview(file_object.read())
+
+    @property
+    def pv_dv(self):
+        '''
+        The PT_LOAD segments as a list of (paddr, vaddr, data) tuples with the
+        zero padding included in the data.  This copies every segment; new
+        code should use segments or flash_dv instead.
+        '''
+        return [(s.paddr, s.vaddr,
+                 s.data.tobytes() + bytes(s.memsz - len(s.data)))
+                for s in self.segments]
 
     @staticmethod
-    def from_path(path):
-        return ELFBinary(open(path, 'rb'))
+    def from_path(path, symbol_cache=None):
+        return ELFBinary(open(path, 'rb'), symbol_cache=symbol_cache)
 
     def iter_segments(self):
         return self.elf_file.iter_segments()
 
+    def _file_digest(self):
+        h = hashlib.sha256()
+        self.file_object.seek(0)
+        for chunk in iter(lambda: self.file_object.read(1024*1024), b''):
+            h.update(chunk)
+        return h.hexdigest()
+
+    @property
+    def symbol_index(self):
+        if self._sym_index is None:
+            path = None
+            if self.symbol_cache:
+                os.makedirs(self.symbol_cache, exist_ok=True)
+                path = os.path.join(self.symbol_cache,
+                                    self._file_digest() + '.symbols.json')
+                self._sym_index = SymbolIndex.load(path)
+            if self._sym_index is None:
+                self._sym_index = SymbolIndex.from_symtab(
+                        self.symtab,
+                        thumb=self.elf_file['e_machine'] == 'EM_ARM')
+                if path:
+                    self._sym_index.save(path)
+        return self._sym_index
+
+    def _get_symbols(self, indices):
+        return [self.symtab.get_symbol(i) for i in indices]
+
     def get_symbols_by_substring(self, substr):
-        return [s for s in self.symtab.iter_symbols() if substr in s.name]
+        return self._get_symbols(
+                sorted(i for name, indices in self.symbol_index.by_name.items()
+                       if substr in name for i in indices))
 
     def get_symbols_by_name(self, name):
-        return [s for s in self.symtab.iter_symbols() if s.name == name]
+        return self._get_symbols(self.symbol_index.by_name.get(name, []))
 
     def get_symbol_by_name(self, name):
         s = self.get_symbols_by_name(name)
@@ -41,20 +159,28 @@ class ELFBinary:
     def get_symbol_addr(self, sym):
         return self.get_symbol_by_name(sym)['st_value']
 
-    def _read(self, addr, size, addr_index):
-        for v in self.pv_dv:
-            base = v[addr_index]
-            data = v[2]
-            if base <= addr and addr + size <= base + len(data):
-                offset = addr - base
-                return data[offset:offset + size]
-        return None
+    def lookup_addr(self, addr):
+        '''
+        Returns a (name, offset) tuple for the function or data object that
+        contains the address, or None if there isn't one.
+        '''
+        return self.symbol_index.lookup(addr)
+
+    @staticmethod
+    def _read(addrs, segments, addr, size):
+        i = bisect.bisect_right(addrs, addr) - 1
+        if i < 0:
+            return None
+        offset = addr - addrs[i]
+        if offset + size > segments[i].memsz:
+            return None
+        return segments[i].read(offset, size)
 
     def read_p_addr(self, p_addr, size):
-        return self._read(p_addr, size, 0)
+        return self._read(self._p_addrs, self._p_index, p_addr, size)
 
     def read_v_addr(self, v_addr, size):
-        return self._read(v_addr, size, 1)
+        return self._read(self._v_addrs, self._v_index, v_addr, size)
 
     def read_symbol(self, sym, size):
         return self.read_v_addr(sym.entry.st_value, size)
@@ -5,3 +5,31 @@ class MemMap:
     def __init__(self, addr, data):
         self.addr = addr
         self.data = data
+
+    def iter_chunks(self, chunk_size):
+        mv = memoryview(self.data)
+        for i in range(0, len(mv), chunk_size):
+            yield mv[i:i + chunk_size]
+
+
+class MemRegion:
+    '''
+    A memory region whose contents are produced on demand while the core is
+    being written.  The producer is either a callable that takes an address
+    and a length and returns that many bytes, such as a device's
+    read_mem_block() method, or an iterable of byte chunks that together
+    cover the region.
+    '''
+    def __init__(self, addr, size, producer):
+        self.addr     = addr
+        self.size     = size
+        self.producer = producer
+
+    def iter_chunks(self, chunk_size):
+        if not callable(self.producer):
+            yield from self.producer
+            return
+
+        for offset in range(0, self.size, chunk_size):
+            yield self.producer(self.addr + offset,
+                                min(chunk_size, self.size - offset))
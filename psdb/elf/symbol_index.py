@@ -0,0 +1,103 @@
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import bisect
+import itertools
+import json
+import os
+
+
+class SymbolIndex:
+    '''
+    An index over an ELF symbol table.  by_name maps each symbol name to the
+    list of its symbol table indices, and the parallel addrs, ends and names
+    lists hold the address range and name of every sized function and data
+    object, sorted by address, for resolving addresses back to symbols.
+    For ARM binaries, Thumb function addresses are stored with the
+    interworking bit cleared so that they match the PCs they contain.
+
+    Symbols may nest, for instance a local data object inside a function's
+    range.  max_ends holds the running maximum of ends so that lookup() can
+    step back past symbols that end early until no earlier symbol can reach
+    the address.
+
+    The index only holds plain lists and dicts so that it can be cached on
+    disk as JSON with save() and load().  Addresses are searched with bisect
+    rather than numpy's searchsorted() because lookups come one address at a
+    time, where bisect on a list is over an order of magnitude faster.
+    '''
+    VERSION = 1
+
+    def __init__(self, by_name, addrs, ends, names):
+        self.by_name  = by_name
+        self.addrs    = addrs
+        self.ends     = ends
+        self.names    = names
+        self.max_ends = list(itertools.accumulate(ends, max))
+
+    @staticmethod
+    def from_symtab(symtab, thumb=False):
+        '''
+        Builds the index from a pyelftools symbol table section, which may be
+        None if the ELF file has been stripped.  If thumb is True, bit 0 of
+        function addresses is cleared.
+        '''
+        by_name = {}
+        entries = []
+        if symtab is not None:
+            for i, s in enumerate(symtab.iter_symbols()):
+                if not s.name:
+                    continue
+                by_name.setdefault(s.name, []).append(i)
+
+                typ  = s['st_info']['type']
+                size = s['st_size']
+                if typ not in ('STT_FUNC', 'STT_OBJECT') or not size:
+                    continue
+                addr = s['st_value']
+                if thumb and typ == 'STT_FUNC':
+                    addr &= ~1
+                entries.append((addr, addr + size, s.name))
+        entries.sort()
+
+        return SymbolIndex(by_name,
+                           [e[0] for e in entries],
+                           [e[1] for e in entries],
+                           [e[2] for e in entries])
+
+    def lookup(self, addr):
+        '''
+        Returns a (name, offset) tuple for the function or data object that
+        contains the address, or None if no symbol contains it.  If several
+        nested symbols contain it, the one that starts closest to it wins.
+        '''
+        i = bisect.bisect_right(self.addrs, addr) - 1
+        while i >= 0 and self.max_ends[i] > addr:
+            if addr < self.ends[i]:
+                return self.names[i], addr - self.addrs[i]
+            i -= 1
+        return None
+
+    def save(self, path):
+        '''
+        Atomically writes the index to a JSON file.
+        '''
+        tmp = '%s.%u.tmp' % (path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump([SymbolIndex.VERSION, self.by_name, self.addrs,
+                       self.ends, self.names], f)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path):
+        '''
+        Loads an index written by save(), returning None if the file is
+        missing or unusable.
+        '''
+        try:
+            with open(path, 'r') as f:
+                v = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(v, list) or len(v) != 5 or \
+                v[0] != SymbolIndex.VERSION:
+            return None
+        return SymbolIndex(*v[1:])
@@ -1,13 +1,18 @@
 #!/usr/bin/env python3
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
 import argparse
+import contextlib
 import hashlib
+import io
+import multiprocessing
 import time
 import sys
+import traceback
 
 import psdb.probes
 import psdb.elf
 import psdb.hexfile
+from psdb.devices.burn_plan import BurnPlan, BurnPlanCache
 
 
 IMAGE_PARSERS = [psdb.elf.ELFBinary.from_path,
@@ -25,6 +30,32 @@ def parse_image(path):
     raise Exception('Unrecognized file type.')
 
 
+def make_burn_plan(flash, paths, digests, bank_swap, cache_dir):
+    '''
+    Returns a BurnPlan for the image files, which have the specified SHA-256
+    digests, loading it from the plan cache if possible.
+    '''
+    if cache_dir:
+        cache = BurnPlanCache(cache_dir)
+        key   = cache.key(digests, flash, bank_swap)
+        plan  = cache.get(key)
+        if plan:
+            print('Using cached burn plan %s.' % key)
+            return plan
+
+    dv = []
+    for path in paths:
+        img = parse_image(path)
+        pdv = flash.prune_dv(img.flash_dv)
+        dv  = psdb.elf.dv.merge_dvs(dv, pdv)
+    plan = BurnPlan.make(flash, dv, bank_swap=bank_swap)
+
+    if cache_dir:
+        cache.put(key, plan)
+        print('Cached burn plan %s.' % key)
+    return plan
+
+
 def main(rv):  # noqa: C901
     # Dump all debuggers if requested.
     if rv.dump_debuggers:
@@ -54,14 +85,14 @@ def main(rv):  # noqa: C901
 
     # Read a backup of flash if requested.
     if rv.read_flash:
-        t0 = time.time()
-        data = target.flash.read_all()
-        dt = time.time() - t0
-        with open(rv.read_flash, 'wb') as f:
-            f.write(data)
-        md5 = hashlib.md5(data)
+        t0   = time.time()
+        md5  = target.flash.read_to_file(rv.read_flash,
+                                         chunk_size=rv.read_chunk_size,
+                                         verbose=rv.verbose)
+        dt   = time.time() - t0
+        size = target.flash.flash_size
         print('Read %u bytes in %.2f seconds (%.2f K/s).'
-              % (len(data), dt, len(data) / (1024*dt)))
+              % (size, dt, size / (1024*dt)))
         print('MD5: %s' % md5.hexdigest())
 
     # Dump options if requested.
@@ -97,16 +128,17 @@ def main(rv):  # noqa: C901
 
     # Write a new ELF image to flash if requested.
     if rv.flash:
-        dv = []
+        digests = []
         for path in rv.flash:
             print('Burning "%s"...' % path)
             with open(path, 'rb') as f:
-                md5 = hashlib.md5(f.read())
-            print('MD5: %s' % md5.hexdigest())
-            img = parse_image(path)
-            pdv = target.flash.prune_dv(img.flash_dv)
-            dv  = psdb.elf.dv.merge_dvs(dv, pdv)
-        target.flash.burn_dv(dv, verbose=True, bank_swap=rv.flash_inactive)
+                data = f.read()
+            print('MD5: %s' % hashlib.md5(data).hexdigest())
+            digests.append(hashlib.sha256(data).digest())
+        plan = make_burn_plan(target.flash, rv.flash, digests,
+                              rv.flash_inactive, rv.plan_cache)
+        target.flash.burn_plan(plan, verbose=True, loader=rv.loader,
+                               diff=rv.diff, verify=rv.verify)
         print('Flash completed successfully.')
         target.reset_halt()
 
@@ -116,7 +148,9 @@ def main(rv):  # noqa: C901
         with open(rv.write_raw_binary, 'rb') as f:
             data = f.read()
         target.flash.burn_dv([(target.flash.mem_base, data)],
-                             verbose=True, bank_swap=rv.flash_inactive)
+                             verbose=True, bank_swap=rv.flash_inactive,
+                             loader=rv.loader, diff=rv.diff,
+                             verify=rv.verify)
         print('Flash completed successfully.')
         target.reset_halt()
 
@@ -148,18 +182,96 @@ def main(rv):  # noqa: C901
         target.resume()
 
 
+def _gang_worker(rv, serial_num):
+    '''
+    Runs main() against a single probe in a gang-programming worker process,
+    capturing its output.  Returns a (serial_num, error, elapsed, log) tuple
+    where error is None on success.
+    '''
+    rv.serial_num = serial_num
+    out           = io.StringIO()
+    err           = None
+    t0            = time.time()
+    with contextlib.redirect_stdout(out):
+        try:
+            main(rv)
+        except Exception as e:
+            traceback.print_exc(file=out)
+            err = str(e) or type(e).__name__
+    return serial_num, err, time.time() - t0, out.getvalue()
+
+
+def gang_main(rv):
+    '''
+    Runs main() against every requested probe in parallel, with one worker
+    process per probe, and prints a pass/fail summary.  Each board's output
+    is printed once it completes if it failed or if --verbose was specified.
+    '''
+    if rv.all_probes:
+        enumerations = psdb.probes.find()
+        serial_nums  = [getattr(e, 'serial_num', None) for e in enumerations]
+        if len(set(serial_nums)) != len(serial_nums):
+            raise psdb.ProbeException('Probes need unique serial numbers for '
+                                      'gang programming.')
+    else:
+        serial_nums = rv.serial_num
+    if not serial_nums:
+        raise psdb.ProbeException('No probe found.')
+
+    print('Gang programming %u boards...' % len(serial_nums))
+    results = []
+    t0      = time.time()
+    ctx     = multiprocessing.get_context('spawn')
+    with ctx.Pool(len(serial_nums)) as pool:
+        jobs = [pool.apply_async(_gang_worker, (rv, sn))
+                for sn in serial_nums]
+        for job in jobs:
+            serial_num, err, elapsed, log = job.get()
+            if err or rv.verbose:
+                print('---- %s ----' % serial_num)
+                print(log, end='')
+            results.append((serial_num, err, elapsed))
+    elapsed = time.time() - t0
+
+    print('%-24s %-6s %8s' % ('Serial number', 'Result', 'Seconds'))
+    for serial_num, err, dt in results:
+        print('%-24s %-6s %8.2f%s' % (serial_num, 'FAIL' if err else 'PASS',
+                                      dt, '  ' + err if err else ''))
+    nfailed = sum(1 for _, err, _ in results if err)
+    print('%u of %u boards passed in %.2f seconds.'
+          % (len(results) - nfailed, len(results), elapsed))
+    if nfailed:
+        raise psdb.ProbeException('%u boards failed.' % nfailed)
+
+
 def _main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--dump-debuggers', '-d', action='store_true')
     parser.add_argument('--usb-path')
-    parser.add_argument('--serial-num')
+    parser.add_argument('--serial-num', action='append',
+                        help='Serial number of the probe to use; specify more '
+                             'than once to program several boards in '
+                             'parallel.')
+    parser.add_argument('--all-probes', action='store_true',
+                        help='Program the boards on all attached probes in '
+                             'parallel.')
     parser.add_argument('--halt', action='store_true')
     parser.add_argument('--srst', action='store_true')
     parser.add_argument('--connect-under-reset', action='store_true')
     parser.add_argument('--read-flash')
+    parser.add_argument('--read-chunk-size', type=lambda x: int(x, 0),
+                        default=0x10000,
+                        help='Chunk size for --read-flash; an interrupted '
+                             'read resumes from the last complete chunk.')
     parser.add_argument('--flash', action='append')
     parser.add_argument('--write-raw-binary')
     parser.add_argument('--flash-inactive', action='store_true')
+    parser.add_argument('--loader', action='store_true')
+    parser.add_argument('--diff', nargs='?', const='read',
+                        choices=['read', 'crc'])
+    parser.add_argument('--verify', choices=['read', 'crc'], default='read')
+    parser.add_argument('--plan-cache',
+                        help='Directory in which to cache burn plans.')
     parser.add_argument('--erase', action='store_true')
     parser.add_argument('--erase-region', action='append')
     parser.add_argument('--mem-dump', '-m')
@@ -171,8 +283,17 @@ def _main():
     parser.add_argument('--option', '-o', nargs=2, action='append')
     rv = parser.parse_args()
 
+    gang = rv.all_probes or (rv.serial_num and len(rv.serial_num) > 1)
+    if gang and (rv.dump_debuggers or rv.read_flash or rv.mem_dump):
+        parser.error('--dump-debuggers, --read-flash and --mem-dump cannot be '
+                     'used when programming multiple boards.')
+
     try:
-        main(rv)
+        if gang:
+            gang_main(rv)
+        else:
+            rv.serial_num = rv.serial_num[0] if rv.serial_num else None
+            main(rv)
     except psdb.ProbeException as e:
         print(e)
         sys.exit(1)
@@ -1,4 +1,5 @@
 # Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
+import binascii
 
 
 class HEXFileException(Exception):
@@ -10,41 +11,55 @@ class InvalidFormatException(HEXFileException):
 
 
 class HEXFile:
+    '''
+    Parses an Intel HEX file.  Data records are coalesced as they are read,
+    so flash_dv holds one (address, data) entry for each contiguous run of
+    records rather than one per record.
+    '''
     def __init__(self, path):
         self.path     = path
         self.flash_dv = []
 
-        with open(self.path, 'r', encoding='utf8') as f:
+        with open(self.path, 'rb') as f:
             self._parse(f)
 
     def _raise_inval_format(self, i, err):
         raise InvalidFormatException('%s:%u: %s' % (self.path, i, err))
 
-    def _parse(self, f):
+    def _parse(self, f):  # noqa: C901
         base_address = 0
-        try:
-            lines = f.readlines()
-        except UnicodeDecodeError:
-            self._raise_inval_format(0, 'Non-UTF8 characters.')
-        for i, l in enumerate(lines):
+        ext_addr     = None
+        ext          = bytearray()
+        for i, l in enumerate(f):
             l = l.strip()
-            if l[0] != ':':
+            if l[:1] != b':':
                 self._raise_inval_format(i, 'Expected ":".')
             if len(l) < 11:
                 self._raise_inval_format(i, 'Line too short.')
-            l = l[1:]
-            if len(l) % 2:
+            if len(l) % 2 == 0:
                 self._raise_inval_format(i, 'Odd record length.')
-            record_hex  = [int(l[i:i+2], 16) for i in range(0, len(l), 2)]
-            byte_count  = record_hex[0]
-            offset      = (record_hex[1] << 8) | record_hex[2]
-            record_type = record_hex[3]
-            data        = bytes(record_hex[4:-1])
-            if sum(record_hex) & 0xFF:
+            try:
+                record = binascii.unhexlify(l[1:])
+            except binascii.Error:
+                self._raise_inval_format(i, 'Invalid hex digits.')
+            byte_count  = record[0]
+            offset      = (record[1] << 8) | record[2]
+            record_type = record[3]
+            data        = record[4:-1]
+            if len(data) != byte_count:
+                self._raise_inval_format(i, 'Invalid byte count.')
+            if sum(record) & 0xFF:
                 self._raise_inval_format(i, 'Invalid checksum.')
 
             if record_type == 0x00:
-                self.flash_dv.append((base_address + offset, data))
+                addr = base_address + offset
+                if ext_addr is not None and addr == ext_addr + len(ext):
+                    ext += data
+                    continue
+                if ext:
+                    self.flash_dv.append((ext_addr, bytes(ext)))
+                ext_addr = addr
+                ext      = bytearray(data)
             elif record_type == 0x01:
                 break
             elif record_type == 0x02:
@@ -70,3 +85,6 @@ class HEXFile:
             else:
                 self._raise_inval_format(i, 'Unrecognied type %u record.'
                                          % record_type)
+
+        if ext:
+            self.flash_dv.append((ext_addr, bytes(ext)))
@@ -2,6 +2,7 @@
 from . import xds110
 from . import stlink
 from . import xtswd
+from . import sim  # noqa: F401
 from .probe import Enumeration, Probe
 
 
@@ -0,0 +1,205 @@
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import collections
+import atexit
+import json
+import time
+import os
+
+
+# Instrumentation can be switched on for every probe created by the process by
+# setting PSDB_INSTRUMENT to a non-empty value, in which case a summary is
+# printed at exit.  Setting PSDB_TRACE to a file path also switches it on and
+# writes a Chrome trace-event JSON file (viewable in chrome://tracing or
+# Perfetto) at exit.
+ENV_INSTRUMENT = 'PSDB_INSTRUMENT'
+ENV_TRACE      = 'PSDB_TRACE'
+
+DEFAULT = None
+
+
+class OpStats:
+    '''
+    Accumulated statistics for a single operation type.  Latencies are
+    bucketed into a histogram keyed by the bit length of the latency in
+    microseconds, so bucket k holds latencies in [2**(k-1), 2**k) us.
+    '''
+    def __init__(self):
+        self.count      = 0
+        self.nbytes     = 0
+        self.nxfers     = 0
+        self.nretries   = 0
+        self.total_time = 0.
+        self.max_time   = 0.
+        self.hist       = collections.Counter()
+
+    def record(self, dt, nbytes, nxfers):
+        self.count      += 1
+        self.nbytes     += nbytes
+        self.nxfers     += nxfers
+        self.total_time += dt
+        self.max_time    = max(self.max_time, dt)
+        self.hist[int(dt * 1e6).bit_length()] += 1
+
+    def dump_hist(self, indent='    '):
+        for k in sorted(self.hist):
+            lo = (1 << (k - 1)) if k else 0
+            print('%s%8u - %8u us: %u' % (indent, lo, (1 << k) - 1,
+                                          self.hist[k]))
+
+
+class Instrumentation:
+    '''
+    Records per-operation call counts, bytes moved, USB transfer counts,
+    latency histograms and retry counts for one or more probes, plus a
+    timeline of individual operations that can be exported in Chrome
+    trace-event format.  Operations are keyed by (category, name) where the
+    category is the probe NAME and the name identifies the command (CDB
+    class, XTSWD opcode, XDS110 command).
+
+    Probes bracket each command with begin() and end().  Byte and USB
+    transfer counts are taken from the USBCounter wrapped around the probe's
+    USB device and are inclusive, so a command that issues a nested status
+    command is also charged for the nested command's transfers.
+
+    The timeline is capped at max_events entries; later events still update
+    the statistics but are counted in ndropped instead of being stored.
+    '''
+    def __init__(self, max_events=1000000):
+        self.max_events = max_events
+        self.ops        = collections.defaultdict(OpStats)
+        self.events     = []
+        self.ndropped   = 0
+        self.nxfers     = 0
+        self.nbytes     = 0
+        self.t0         = time.perf_counter()
+        self.pid        = os.getpid()
+
+    def count_xfer(self, nbytes):
+        self.nxfers += 1
+        self.nbytes += nbytes
+
+    def begin(self):
+        '''Returns a token to pass to end() when the operation completes.'''
+        return (time.perf_counter(), self.nxfers, self.nbytes)
+
+    def end(self, cat, name, token, tid=0):
+        t1             = time.perf_counter()
+        t0, nx0, nb0   = token
+        nxfers, nbytes = self.nxfers - nx0, self.nbytes - nb0
+        self.ops[(cat, name)].record(t1 - t0, nbytes, nxfers)
+
+        if len(self.events) >= self.max_events:
+            self.ndropped += 1
+            return
+        self.events.append((cat, name, t0, t1, nbytes, nxfers, tid))
+
+    def record_retry(self, cat, name):
+        self.ops[(cat, name)].nretries += 1
+
+    def reset(self):
+        self.ops.clear()
+        self.events   = []
+        self.ndropped = 0
+
+    def dump(self, histograms=True):
+        if not self.ops:
+            print('No probe operations recorded.')
+            return
+
+        width = max(len('%s.%s' % k) for k in self.ops)
+        print('%-*s %8s %10s %8s %7s %10s %10s' %
+              (width, 'Operation', 'Calls', 'Bytes', 'USB', 'Retries',
+               'Total ms', 'Avg us'))
+        for k, s in sorted(self.ops.items(),
+                           key=lambda kv: kv[1].total_time, reverse=True):
+            avg = (s.total_time / s.count * 1e6) if s.count else 0
+            print('%-*s %8u %10u %8u %7u %10.3f %10.1f' %
+                  (width, '%s.%s' % k, s.count, s.nbytes, s.nxfers,
+                   s.nretries, s.total_time * 1e3, avg))
+            if histograms and s.count:
+                s.dump_hist()
+        if self.ndropped:
+            print('%u trace events dropped.' % self.ndropped)
+
+    def chrome_trace(self):
+        '''Returns the recorded timeline as a Chrome trace-event dict.'''
+        events = []
+        for cat, name, t0, t1, nbytes, nxfers, tid in self.events:
+            events.append({'name' : name,
+                           'cat'  : cat,
+                           'ph'   : 'X',
+                           'ts'   : (t0 - self.t0) * 1e6,
+                           'dur'  : (t1 - t0) * 1e6,
+                           'pid'  : self.pid,
+                           'tid'  : tid,
+                           'args' : {'bytes' : nbytes, 'usb_xfers' : nxfers},
+                           })
+        return {'traceEvents'     : events,
+                'displayTimeUnit' : 'ms',
+                }
+
+    def export_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+class USBCounter:
+    '''
+    Wraps a pyusb device so that every synchronous read() and write() is
+    counted by the Instrumentation object.  Everything else is forwarded to
+    the underlying device.
+    '''
+    def __init__(self, usb_dev, instr):
+        self.usb_dev = usb_dev
+        self.instr   = instr
+
+    def __getattr__(self, name):
+        return getattr(self.usb_dev, name)
+
+    def read(self, endpoint, size_or_buffer, timeout=None):
+        rsp = self.usb_dev.read(endpoint, size_or_buffer, timeout=timeout)
+        self.instr.count_xfer(rsp if isinstance(rsp, int) else len(rsp))
+        return rsp
+
+    def write(self, endpoint, data, timeout=None):
+        size = self.usb_dev.write(endpoint, data, timeout=timeout)
+        self.instr.count_xfer(size)
+        return size
+
+
+def _dump_at_exit(instr, trace_path):
+    if trace_path:
+        instr.export_chrome_trace(trace_path)
+        print('Probe trace written to %s.' % trace_path)
+    if os.environ.get(ENV_INSTRUMENT):
+        instr.dump()
+
+
+def enable():
+    '''
+    Switches on instrumentation for all probes created from now on and
+    returns the shared Instrumentation object.  Existing probes can be
+    instrumented with Probe.enable_instrumentation().
+    '''
+    global DEFAULT
+    if DEFAULT is None:
+        DEFAULT = Instrumentation()
+    return DEFAULT
+
+
+def disable():
+    '''Stops instrumenting newly-created probes.'''
+    global DEFAULT
+    DEFAULT = None
+
+
+def get_default():
+    '''
+    Returns the shared Instrumentation object, or None if instrumentation is
+    switched off.
+    '''
+    return DEFAULT
+
+
+if os.environ.get(ENV_INSTRUMENT) or os.environ.get(ENV_TRACE):
+    atexit.register(_dump_at_exit, enable(), os.environ.get(ENV_TRACE))
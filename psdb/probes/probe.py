@@ -5,6 +5,8 @@ from struct import pack, unpack
 
 import psdb
 import psdb.targets
+from .transaction import Transaction
+from . import instrument
 
 
 class Enumeration:
@@ -46,9 +48,16 @@ class Probe:
         self.cpus         = []
         self.target       = None
         self.max_tck_freq = None
+        self.txn          = None
+        self.instr        = instrument.get_default()
 
     @staticmethod
     def find():
+        # The simulated probe replaces the hardware probes when it is enabled
+        # so that the tools work on machines without a USB backend.
+        if psdb.probes.sim.enabled():
+            return psdb.probes.sim.SimProbe.find()
+
         enumerations = []
         for cls in psdb.probes.PROBE_CLASSES:
             enumerations += cls.find()
@@ -93,6 +102,18 @@ class Probe:
     def _set_tck_freq(self, freq_hz):
         raise NotImplementedError
 
+    def enable_instrumentation(self, instr=None):
+        '''
+        Starts recording per-operation statistics and a trace timeline for
+        this probe into instr, or into a new Instrumentation object if instr
+        is None.  Returns the Instrumentation object.
+        '''
+        self.instr = instr or instrument.Instrumentation()
+        return self.instr
+
+    def disable_instrumentation(self):
+        self.instr = None
+
     def get_stats(self):
         '''
         Return accumulated stats since the last time get_stats was invoked.
@@ -138,41 +159,106 @@ class Probe:
     def write_8(self, v, addr, ap_num=0):
         self._bulk_write_8(pack('<B', v), addr, ap_num=ap_num)
 
-    def read_bulk(self, addr, size, ap_num=0):
+    @staticmethod
+    def _split_bulk(addr, size):
         '''
-        Do a bulk read operation from the specified address.  If the start or
-        end addresses are not word-aligned then multiple transactions will take
-        place.  If the address range crosses a 1K page boundary, multiple
-        transactions will take place to handle the TAR auto-increment issue.
-
-        Note: this helper relies on the probe implementing _bulk_read_8() and
-        _bulk_read_32() methods.  The probe should override this method if it
-        needs to do a different type of offload.
+        Splits a bulk transfer of size bytes at addr into a list of
+        (offset, addr, n, word_size) segments, where offset is the position of
+        the segment within the transfer.  Unaligned head and tail bytes are
+        split out into 8-bit segments and the aligned middle is split into
+        32-bit segments that don't cross 1K TAR boundaries.
         '''
-        # Handle empty transfers.
-        if not size:
-            return bytes(b'')
-
-        mem = bytearray()
+        segs   = []
+        offset = 0
 
         # Align us to a 32-bit boundary.
         count = min(size, -addr & 3)
         if count:
-            mem  += self._bulk_read_8(addr, count, ap_num)
-            addr += count
-            size -= count
+            segs.append((offset, addr, count, 1))
+            offset += count
+            addr   += count
+            size   -= count
 
         # Do 32-bit aligned transfers that don't cross TAR boundaries.
         while size >= 4:
             count = min(size, 0x400 - (addr & 0x3FF)) // 4
-            mem  += self._bulk_read_32(addr, count, ap_num)
-            addr += count * 4
-            size -= count * 4
+            segs.append((offset, addr, count, 4))
+            offset += count * 4
+            addr   += count * 4
+            size   -= count * 4
 
         # Do any remaining bytes.
         if size:
-            mem += self._bulk_read_8(addr, size, ap_num)
+            segs.append((offset, addr, size, 1))
+
+        return segs
+
+    def _bulk_read_into(self, mv, addr, n, word_size, ap_num=0):
+        '''
+        Reads n 8- or 32-bit words from addr into the byte memoryview mv,
+        which is exactly n*word_size bytes long.  The default implementation
+        copies the result of _bulk_read_8() or _bulk_read_32(); probes that
+        can receive data directly into a caller-provided buffer should
+        override this.
+        '''
+        if word_size == 4:
+            mv[:] = self._bulk_read_32(addr, n, ap_num)
+        else:
+            mv[:] = self._bulk_read_8(addr, n, ap_num)
+
+    def _bulk_read_segments_into(self, mv, segs, ap_num=0):
+        '''
+        Reads the list of segments generated by _split_bulk() into the byte
+        memoryview mv.  Probes that can keep several bulk operations in flight
+        should override this.
+        '''
+        for offset, addr, n, word_size in segs:
+            self._bulk_read_into(mv[offset:offset + n * word_size], addr, n,
+                                 word_size, ap_num)
+
+    def _bulk_write_segments(self, mv, segs, ap_num=0):
+        '''
+        Writes the list of segments generated by _split_bulk(), taking the
+        data for each segment from the memoryview mv.  Probes that can keep
+        several bulk operations in flight should override this.
+        '''
+        for offset, addr, n, word_size in segs:
+            data = mv[offset:offset + n * word_size]
+            if word_size == 4:
+                self._bulk_write_32(data, addr, ap_num)
+            else:
+                self._bulk_write_8(data, addr, ap_num)
+
+    def read_bulk_into(self, addr, buf, ap_num=0):
+        '''
+        Do a bulk read operation from the specified address into buf, which
+        can be any writable, contiguous buffer (bytearray, memoryview, NumPy
+        array, etc.).  The number of bytes read is the size of buf in bytes,
+        and that count is returned.  If the start or end addresses are not
+        word-aligned then multiple transactions will take place.  If the
+        address range crosses a 1K page boundary, multiple transactions will
+        take place to handle the TAR auto-increment issue.
+        '''
+        mv = memoryview(buf).cast('B')
+        if mv:
+            self._bulk_read_segments_into(mv, self._split_bulk(addr, len(mv)),
+                                          ap_num)
+        return len(mv)
+
+    def read_bulk(self, addr, size, ap_num=0):
+        '''
+        Do a bulk read operation from the specified address and return the
+        data in a new bytearray.  See read_bulk_into().
 
+        Note: this helper relies on the probe implementing _bulk_read_8() and
+        _bulk_read_32() methods, or on it overriding _bulk_read_into().
+        '''
+        # Handle empty transfers.
+        if not size:
+            return bytes(b'')
+
+        mem = bytearray(size)
+        self.read_bulk_into(addr, mem, ap_num)
         return mem
 
     def write_bulk(self, data, addr, ap_num=0):
@@ -186,26 +272,14 @@ class Probe:
             return
 
         mv = memoryview(data)
-
-        # Align us to a 32-bit boundary.
-        count = min(len(mv), -addr & 3)
-        if count:
-            self._bulk_write_8(mv[:count], addr, ap_num)
-            addr += count
-            mv    = mv[count:]
-
-        # Do 32-bit aligned transfers that don't cross TAR boundaries.
-        while len(mv) >= 4:
-            count = min(len(mv), 0x400 - (addr & 0x3FF)) // 4
-            self._bulk_write_32(mv[:count * 4], addr, ap_num)
-            addr += count * 4
-            mv    = mv[count * 4:]
-
-        # Do any remaining bytes.
-        if mv:
-            self._bulk_write_8(mv, addr, ap_num)
+        self._bulk_write_segments(mv, self._split_bulk(addr, len(mv)), ap_num)
 
     def exec_cmd_list(self, cmd_list):
+        '''
+        Executes a list of ReadCommand and WriteCommand objects in order and
+        returns a list containing the result of each ReadCommand.  Probes that
+        have some sort of batching primitive should override this.
+        '''
         read_vals = []
         for cmd in cmd_list:
             if isinstance(cmd, psdb.devices.ReadCommand):
@@ -218,10 +292,32 @@ class Probe:
                     read_vals.append(self.read_8(cmd.addr, cmd.ap.ap_num))
                 else:
                     raise Exception('Illegal size %u in cmd list.' % cmd.size)
+            elif isinstance(cmd, psdb.devices.WriteCommand):
+                assert cmd.ap.db == self
+                if cmd.size == 4:
+                    self.write_32(cmd.value, cmd.addr, cmd.ap.ap_num)
+                elif cmd.size == 2:
+                    self.write_16(cmd.value, cmd.addr, cmd.ap.ap_num)
+                elif cmd.size == 1:
+                    self.write_8(cmd.value, cmd.addr, cmd.ap.ap_num)
+                else:
+                    raise Exception('Illegal size %u in cmd list.' % cmd.size)
             else:
                 raise Exception('Unrecognized command: %s' % cmd)
         return read_vals
 
+    def transaction(self, coalesce=True):
+        '''
+        Returns a context manager inside of which register accesses made via
+        Device objects are recorded rather than executed.  When the outermost
+        context exits, the recorded accesses are flushed through
+        exec_cmd_list() and any reads return their values via Futures.  If a
+        transaction is already active then it is joined rather than nested.
+        '''
+        if self.txn is not None:
+            return self.txn
+        return Transaction(self, coalesce=coalesce)
+
     def halt(self):
         for c in self.cpus:
             c.halt()
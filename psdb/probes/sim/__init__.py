@@ -0,0 +1,24 @@
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import psdb
+from . import model
+from . import stm32l4
+from .sim import SimProbe, enabled
+
+
+__all__ = ['model',
+           'stm32l4',
+           'SimProbe',
+           'enabled',
+           ]
+
+
+def find(**kwargs):
+    return psdb.probes.find(cls=SimProbe, **kwargs)
+
+
+def make_one(**kwargs):
+    return psdb.probes.make_one(cls=SimProbe, **kwargs)
+
+
+def make_one_ns(ns):
+    return psdb.probes.make_one_ns(ns, cls=SimProbe)
@@ -0,0 +1,212 @@
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import time
+
+from .model import Region, RegisterBlock
+
+
+# FLASH_SR bits.
+SR_EOP     = (1 << 0)
+SR_PROGERR = (1 << 3)
+SR_PGAERR  = (1 << 5)
+SR_SIZERR  = (1 << 6)
+SR_PGSERR  = (1 << 7)
+SR_BSY     = (1 << 16)
+SR_ERRORS  = 0x0000C3FB
+
+# FLASH_CR bits.
+CR_PG         = (1 << 0)
+CR_PER        = (1 << 1)
+CR_MER1       = (1 << 2)
+CR_STRT       = (1 << 16)
+CR_OPTSTRT    = (1 << 17)
+CR_EOPIE      = (1 << 24)
+CR_OBL_LAUNCH = (1 << 27)
+CR_OPTLOCK    = (1 << 30)
+CR_LOCK       = (1 << 31)
+
+KEYR    = 0x008
+OPTKEYR = 0x00C
+SR      = 0x010
+CR      = 0x014
+OPTR    = 0x020
+
+
+class FlashMemory(Region):
+    '''
+    Flash memory controlled by a FLASH model.  Reads return the array
+    contents and writes are handed to the controller to be programmed.
+    '''
+    def __init__(self, name, base, size, flash):
+        super().__init__(name, base, size)
+        self.flash = flash
+        self.mem   = bytearray(b'\xFF') * size
+
+    def read(self, offset, n, word_size):
+        return bytes(self.mem[offset:offset + n])
+
+    def write(self, offset, data, word_size):
+        self.flash.program(self, offset, data, word_size)
+
+
+class FLASH(RegisterBlock):
+    '''
+    Model of the flash controller driven by psdb.devices.stm32.flash_type1.
+    It implements the KEYR/OPTKEYR unlock sequences, page and mass erase via
+    CR.STRT, double-word programming with CR.PG and the error flags that
+    FLASH._check_errors() looks at.  Programming requires pairs of 32-bit
+    writes to an erased double-word, as on the real part.
+
+    Operations complete instantly unless the erase and program times are
+    non-zero, in which case SR.BSY stays set for that long so that the
+    driver's polling is exercised realistically.
+    '''
+    KEY1    = 0x45670123
+    KEY2    = 0xCDEF89AB
+    OPTKEY1 = 0x08192A3B
+    OPTKEY2 = 0x4C5D6E7F
+
+    def __init__(self, target, name, dev_base, mem_base, flash_size,
+                 sector_size, otp_base, otp_len, optr, page_erase_time=0.,
+                 mass_erase_time=0., dword_program_time=0.):
+        super().__init__(name, dev_base, 0x400)
+        self.target             = target
+        self.sector_size        = sector_size
+        self.nsectors           = flash_size // sector_size
+        self.page_erase_time    = page_erase_time
+        self.mass_erase_time    = mass_erase_time
+        self.dword_program_time = dword_program_time
+        self.mem                = FlashMemory('FLASH Memory', mem_base,
+                                              flash_size, self)
+        self.otp                = FlashMemory('OTP', otp_base, otp_len, self)
+        self.regs[OPTR]         = optr
+        self.reset()
+
+        self.write_handlers[KEYR]    = self._write_keyr
+        self.write_handlers[OPTKEYR] = self._write_optkeyr
+        self.read_handlers[SR]       = self._read_sr
+        self.write_handlers[SR]      = self._write_sr
+        self.read_handlers[CR]       = lambda: self.cr
+        self.write_handlers[CR]      = self._write_cr
+        self.write_handlers[OPTR]    = self._write_optr
+
+    def reset(self):
+        self.cr         = CR_LOCK | CR_OPTLOCK
+        self.sr         = 0
+        self.keys       = []
+        self.optkeys    = []
+        self.busy_until = 0.
+        self.pending    = None
+
+    def _busy(self, dt):
+        if dt:
+            self.busy_until = max(time.perf_counter(),
+                                  self.busy_until) + dt
+        if self.cr & CR_EOPIE:
+            self.sr |= SR_EOP
+
+    def _read_sr(self):
+        if time.perf_counter() < self.busy_until:
+            return self.sr | SR_BSY
+        return self.sr
+
+    def _write_sr(self, v):
+        self.sr &= ~(v & SR_ERRORS)
+
+    def _write_keyr(self, v):
+        self.keys = (self.keys + [v])[-2:]
+        if self.keys == [FLASH.KEY1, FLASH.KEY2]:
+            self.cr  &= ~CR_LOCK
+            self.keys = []
+
+    def _write_optkeyr(self, v):
+        if self.cr & CR_LOCK:
+            return
+        self.optkeys = (self.optkeys + [v])[-2:]
+        if self.optkeys == [FLASH.OPTKEY1, FLASH.OPTKEY2]:
+            self.cr     &= ~CR_OPTLOCK
+            self.optkeys = []
+
+    def _write_optr(self, v):
+        if not self.cr & CR_OPTLOCK:
+            self.regs[OPTR] = v
+
+    def _write_cr(self, v):
+        if self.cr & CR_LOCK:
+            return
+
+        optlock = self.cr & CR_OPTLOCK
+        self.cr = (v & ~(CR_STRT | CR_OPTSTRT | CR_OBL_LAUNCH)) | optlock
+        if v & CR_LOCK:
+            self.cr |= CR_OPTLOCK
+        if not v & CR_PG:
+            self.pending = None
+
+        if v & CR_STRT:
+            if v & CR_MER1:
+                self.mem.mem[:] = b'\xFF' * self.mem.size
+                self._busy(self.mass_erase_time)
+            elif v & CR_PER:
+                n = (v >> 3) & 0xFF
+                if n < self.nsectors:
+                    offset = n * self.sector_size
+                    self.mem.mem[offset:offset + self.sector_size] = (
+                        b'\xFF' * self.sector_size)
+                    self._busy(self.page_erase_time)
+                else:
+                    self.sr |= SR_PGSERR
+            else:
+                self.sr |= SR_PGSERR
+        if (v & CR_OPTSTRT) and not optlock:
+            self._busy(self.page_erase_time)
+        if (v & CR_OBL_LAUNCH) and not optlock:
+            self.target.disconnect_reset()
+
+    def _program_dword(self, fm, offset, data):
+        if fm.mem[offset:offset + 8] != b'\xFF'*8:
+            self.sr |= SR_PROGERR
+            return
+        fm.mem[offset:offset + 8] = data
+
+    def program(self, fm, offset, data, word_size):
+        '''
+        Handles a write to flash memory.  Each double-word is programmed when
+        its second 32-bit word is written; a lone word is held until its
+        partner arrives.
+        '''
+        if (self.cr & CR_LOCK) or not (self.cr & CR_PG):
+            self.sr |= SR_PGSERR
+            return
+        if word_size != 4 or (offset | len(data)) & 3:
+            self.sr |= SR_SIZERR
+            return
+
+        # Complete a double-word that was started by a previous write.
+        pos = 0
+        if self.pending is not None:
+            pfm, poffset, pdata = self.pending
+            self.pending = None
+            if pfm is not fm or poffset + 4 != offset:
+                self.sr |= SR_PGAERR
+                return
+            self._program_dword(fm, poffset, pdata + bytes(data[:4]))
+            pos = 4
+        elif offset & 4:
+            self.sr |= SR_PGAERR
+            return
+
+        # Program whole double-words, checking that they are all erased with a
+        # single scan in the common case.
+        end = pos + ((len(data) - pos) & ~7)
+        if end > pos:
+            start = offset + pos
+            n     = end - pos
+            if fm.mem.count(b'\xFF', start, start + n) == n:
+                fm.mem[start:start + n] = data[pos:end]
+            else:
+                for i in range(pos, end, 8):
+                    self._program_dword(fm, offset + i, bytes(data[i:i + 8]))
+        self._busy(((end - pos) // 8) * self.dword_program_time)
+
+        # Hold on to a trailing word.
+        if end < len(data):
+            self.pending = (fm, offset + end, bytes(data[end:]))
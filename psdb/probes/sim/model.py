@@ -0,0 +1,458 @@
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import bisect
+import struct
+
+import psdb
+from . import thumb
+
+
+class SimFaultException(psdb.ProbeException):
+    pass
+
+
+class SimDisconnectedException(psdb.ProbeException):
+    pass
+
+
+def component_ids(cidr, pidr):
+    '''
+    Returns a dict mapping register offsets within a 4K CoreSight component to
+    the values of its CIDR and PIDR registers.  The IDs use the same packing
+    as psdb.component.Component: the upper half of the PIDR is PIDR4-7 and
+    the lower half is PIDR0-3.
+    '''
+    regs = {}
+    for i in range(4):
+        regs[0xFD0 + 4*i] = (pidr >> (32 + 8*i)) & 0xFF
+        regs[0xFE0 + 4*i] = (pidr >> (8*i)) & 0xFF
+        regs[0xFF0 + 4*i] = (cidr >> (8*i)) & 0xFF
+    return regs
+
+
+class Region:
+    '''
+    Base class for a range of the simulated address space.  Offsets are
+    relative to the base of the region and word_size is the access size used
+    by the probe.
+    '''
+    def __init__(self, name, base, size):
+        self.name = name
+        self.base = base
+        self.size = size
+
+    def __repr__(self):
+        return '%s [0x%08X - 0x%08X]' % (self.name, self.base,
+                                         self.base + self.size - 1)
+
+    def read(self, offset, n, word_size):
+        raise NotImplementedError
+
+    def write(self, offset, data, word_size):
+        raise NotImplementedError
+
+
+class RAM(Region):
+    '''
+    Plain memory backed by a bytearray.  Several regions can share the same
+    bytearray to model aliases.
+    '''
+    def __init__(self, name, base, size, fill=0x00, mem=None):
+        super().__init__(name, base, size)
+        self.mem = mem if mem is not None else bytearray([fill]) * size
+        assert len(self.mem) == size
+
+    def read(self, offset, n, word_size):
+        return bytes(self.mem[offset:offset + n])
+
+    def write(self, offset, data, word_size):
+        self.mem[offset:offset + len(data)] = data
+
+
+class ROM(RAM):
+    def write(self, offset, data, word_size):
+        raise SimFaultException('Write to %s at 0x%08X.'
+                                % (self.name, self.base + offset))
+
+
+class RegisterBlock(Region):
+    '''
+    A block of 32-bit registers.  Registers without a handler are plain
+    storage that reads back whatever was last written and unwritten registers
+    read as zero.  Subclasses install read and write handlers for registers
+    with side effects.  Narrow writes are merged into the stored value of the
+    containing register before its write handler is invoked.
+    '''
+    def __init__(self, name, base, size=0x400):
+        super().__init__(name, base, size)
+        self.regs           = {}
+        self.read_handlers  = {}
+        self.write_handlers = {}
+
+    def read_32(self, offset):
+        h = self.read_handlers.get(offset)
+        if h is not None:
+            return h()
+        return self.regs.get(offset, 0)
+
+    def write_32(self, offset, v):
+        h = self.write_handlers.get(offset)
+        if h is not None:
+            h(v)
+        else:
+            self.regs[offset] = v
+
+    def read_only(self, offset):
+        '''Makes the register at offset ignore writes.'''
+        self.write_handlers[offset] = lambda v: None
+
+    def read(self, offset, n, word_size):
+        start = offset & ~3
+        end   = (offset + n + 3) & ~3
+        data  = b''.join(struct.pack('<I', self.read_32(o))
+                         for o in range(start, end, 4))
+        return data[offset - start:offset - start + n]
+
+    def write(self, offset, data, word_size):
+        start = offset & ~3
+        end   = (offset + len(data) + 3) & ~3
+        if start != offset or end - start != len(data):
+            buf = bytearray(b''.join(struct.pack('<I', self.regs.get(o, 0))
+                                     for o in range(start, end, 4)))
+            buf[offset - start:offset - start + len(data)] = data
+            data = buf
+        for i, (v,) in enumerate(struct.iter_unpack('<I', data)):
+            self.write_32(start + 4*i, v)
+
+
+class ROMTable(RegisterBlock):
+    '''
+    A CoreSight ROM table.  The entries are the addresses of the child
+    components, which are encoded as offsets from the table.
+    '''
+    def __init__(self, base, cidr, pidr, children):
+        super().__init__('ROM Table', base, 0x1000)
+        for i, addr in enumerate(children):
+            self.regs[4*i] = ((addr - base) & 0xFFFFF000) | 3
+        self.regs[0xFCC] = 1
+        self.regs.update(component_ids(cidr, pidr))
+        for o in range(0, 0x1000, 4):
+            self.read_only(o)
+
+
+class Bus:
+    '''
+    The address space seen through a MemAP.  Regions must not overlap, except
+    that background regions are consulted when no other region contains the
+    access; they are used to give sparse, always-present storage to the
+    peripheral and private peripheral buses.
+    '''
+    def __init__(self):
+        self.regions    = []
+        self.bases      = []
+        self.background = []
+
+    def add(self, region, background=False):
+        if background:
+            self.background.append(region)
+            return region
+
+        i = bisect.bisect(self.bases, region.base)
+        if i:
+            prev = self.regions[i - 1]
+            assert prev.base + prev.size <= region.base
+        if i < len(self.regions):
+            assert region.base + region.size <= self.bases[i]
+        self.bases.insert(i, region.base)
+        self.regions.insert(i, region)
+        return region
+
+    def find(self, addr, n):
+        i = bisect.bisect(self.bases, addr) - 1
+        if i >= 0:
+            r = self.regions[i]
+            if addr + n <= r.base + r.size:
+                return r
+        for r in self.background:
+            if r.base <= addr and addr + n <= r.base + r.size:
+                return r
+        raise SimFaultException('Fault accessing [0x%08X - 0x%08X].'
+                                % (addr, addr + n - 1))
+
+    def read(self, addr, n, word_size):
+        r = self.find(addr, n)
+        return r.read(addr - r.base, n, word_size)
+
+    def write(self, addr, data, word_size):
+        r = self.find(addr, len(data))
+        r.write(addr - r.base, data, word_size)
+
+
+class MemAP:
+    '''
+    Model of a MEM-AP.  Only the CSW, TAR, DRW, BASE and IDR registers are
+    implemented; the probe model's bulk operations access the bus directly,
+    which is equivalent to driving DRW with auto-increment.
+    '''
+    SIZES = {0 : 1, 1 : 2, 2 : 4}
+
+    def __init__(self, bus, idr, base, csw):
+        self.bus  = bus
+        self.idr  = idr
+        self.base = base
+        self.csw  = csw
+        self.tar  = 0
+
+    def read_reg(self, addr):
+        if addr == 0x00:
+            return self.csw
+        if addr == 0x04:
+            return self.tar
+        if addr == 0x0C:
+            size = MemAP.SIZES[self.csw & 7]
+            data = self.bus.read(self.tar, size, size)
+            v    = int.from_bytes(data, 'little') << (8 * (self.tar & 3))
+            self._advance(size)
+            return v
+        if addr == 0xF8:
+            return self.base
+        if addr == 0xFC:
+            return self.idr
+        return 0
+
+    def write_reg(self, addr, v):
+        if addr == 0x00:
+            self.csw = (v & ~0x40) | (self.csw & 0x40)
+        elif addr == 0x04:
+            self.tar = v
+        elif addr == 0x0C:
+            size = MemAP.SIZES[self.csw & 7]
+            data = (v >> (8 * (self.tar & 3))).to_bytes(4, 'little')[:size]
+            self.bus.write(self.tar, data, size)
+            self._advance(size)
+
+    def _advance(self, size):
+        if self.csw & 0x30 == 0x10:
+            self.tar = ((self.tar & ~0x3FF) |
+                        ((self.tar + size) & 0x3FF))
+
+
+class CortexM(RegisterBlock):
+    '''
+    Model of a Cortex-M core as seen through its System Control Space.  DHCSR,
+    DCRSR and DCRDR implement halting and core register access,
+    AIRCR.SYSRESETREQ triggers a system reset and DEMCR.VC_CORERESET makes the
+    core halt on the way out of reset.
+
+    A running core executes Thumb code with the thumb.Thumb interpreter, but
+    only when the target gives it a time slice via run(), which SimTarget does
+    at the start of every debug access.  Code it can't execute, such as an
+    erased or foreign flash image, locks it up until it is reset or halted
+    by the debugger, as on the real core.
+    '''
+    DHCSR = 0xDF0
+    DCRSR = 0xDF4
+    DCRDR = 0xDF8
+    DEMCR = 0xDFC
+    AIRCR = 0xD0C
+    CPUID = 0xD00
+
+    def __init__(self, target, cpuid, pidr, base=0xE000E000):
+        super().__init__('SCS', base, 0x1000)
+        self.target    = target
+        self.core_regs = {}
+        self.dhcsr     = 0
+        self.halted    = False
+        self.reset_st  = False
+        self.lockup    = False
+        self.thumb     = thumb.Thumb(target.bus)
+        self.regs.update(component_ids(0xB105E00D, pidr))
+        self.regs[CortexM.CPUID] = cpuid
+        self.read_only(CortexM.CPUID)
+        self.read_handlers[CortexM.DHCSR]  = self._read_dhcsr
+        self.write_handlers[CortexM.DHCSR] = self._write_dhcsr
+        self.write_handlers[CortexM.DCRSR] = self._write_dcrsr
+        self.read_handlers[CortexM.AIRCR]  = self._read_aircr
+        self.write_handlers[CortexM.AIRCR] = self._write_aircr
+
+    def _read_dhcsr(self):
+        v = (self.dhcsr & 0x0000002F) | (1 << 16)
+        if self.halted:
+            v |= (1 << 17)
+        if self.lockup:
+            v |= (1 << 19)
+        if self.reset_st:
+            v |= (1 << 25)
+            self.reset_st = False
+        return v
+
+    def _write_dhcsr(self, v):
+        if (v >> 16) != 0xA05F:
+            return
+        self.dhcsr = v & 0x0000002F
+        if not (v & (1 << 0)):
+            self.halted = False
+        elif v & (1 << 1):
+            self.halted = True
+            self.lockup = False
+        elif not (v & (1 << 2)):
+            self.halted = False
+
+    def _write_dcrsr(self, v):
+        sel = v & 0x7F
+        if v & (1 << 16):
+            v = self.regs.get(CortexM.DCRDR, 0)
+            self.core_regs[sel] = v
+            spsel = (self.core_regs.get(20, 0) >> 25) & 1
+            if sel == 13:
+                self.core_regs[17 + spsel] = v
+            elif sel == 17 + spsel:
+                self.core_regs[13] = v
+        else:
+            self.regs[CortexM.DCRDR] = self.core_regs.get(sel, 0)
+
+    def _read_aircr(self):
+        return 0xFA050000 | (self.regs.get(CortexM.AIRCR, 0) & 0x00000700)
+
+    def _write_aircr(self, v):
+        if (v >> 16) != 0x05FA:
+            return
+        self.regs[CortexM.AIRCR] = v & 0x00000700
+        if v & (1 << 2):
+            self.target.system_reset()
+        elif v & (1 << 0):
+            self.reset()
+
+    def reset(self):
+        '''
+        Resets the core, loading SP and PC from the vector table.  The core
+        halts if it has debug enabled and reset vector catch is set.
+        '''
+        sp, pc = struct.unpack('<II', self.target.bus.read(
+            self.target.vector_base, 8, 4))
+        self.core_regs = {13 : sp & ~3,
+                          14 : 0xFFFFFFFF,
+                          15 : pc & ~1,
+                          16 : 0x01000000,
+                          17 : sp & ~3,
+                          }
+        self.reset_st = True
+        self.lockup   = False
+        self.halted   = bool((self.dhcsr & 1) and
+                             (self.regs.get(CortexM.DEMCR, 0) & 1))
+
+    def run(self, n):
+        '''Executes up to n instructions if the core is running.'''
+        if self.halted or self.lockup:
+            return
+        try:
+            self.thumb.run(self.core_regs, n)
+        except thumb.BreakpointException:
+            if self.dhcsr & 1:
+                self.halted = True
+            else:
+                self.lockup = True
+        except thumb.LockupException:
+            self.lockup = True
+
+
+class SimTarget:
+    '''
+    Base class for a simulated target.  Subclasses populate the bus, the
+    MemAPs and the CPU.  SRST holds the target in reset until it is released,
+    at which point a system reset takes place.  Resets that drop the debug
+    connection, such as an option-byte reload, raise
+    SimDisconnectedException on every access until the probe reconnects.
+    '''
+    NAME = None
+
+    def __init__(self, dpidr, vector_base):
+        self.dpidr       = dpidr
+        self.vector_base = vector_base
+        self.bus         = Bus()
+        self.aps         = {}
+        self.cpu         = None
+        self.resettables = []
+        self.connected   = False
+        self.srst        = False
+        self.cpu_steps   = 10000
+
+    def __repr__(self):
+        return self.NAME
+
+    def _check_connected(self):
+        if not self.connected:
+            raise SimDisconnectedException('Target not connected.')
+        if self.cpu is not None and not self.srst:
+            self.cpu.run(self.cpu_steps)
+
+    def add_cortex_m4(self, rom_pidr, cpuid=0x410FC241):
+        '''
+        Adds a Cortex-M4 with an FPU along with the ROM table, DWT, FPB and ITM
+        components that the Cortex-M4 matchers expect.
+        '''
+        self.cpu = self.bus.add(CortexM(self, cpuid, 0x00000004000BB00C))
+
+        dwt = self.bus.add(RegisterBlock('DWT', 0xE0001000, 0x1000))
+        dwt.regs.update(component_ids(0xB105E00D, 0x00000004003BB002))
+        dwt.regs[0x000] = 0x40000000
+
+        fpb = self.bus.add(RegisterBlock('FPB', 0xE0002000, 0x1000))
+        fpb.regs.update(component_ids(0xB105E00D, 0x00000004002BB003))
+        fpb.regs[0x000] = 0x00000260
+
+        def write_fp_ctrl(v):
+            if v & (1 << 1):
+                fpb.regs[0x000] = (fpb.regs[0x000] & ~1) | (v & 1)
+        fpb.write_handlers[0x000] = write_fp_ctrl
+
+        itm = self.bus.add(RegisterBlock('ITM', 0xE0000000, 0x1000))
+        itm.regs.update(component_ids(0xB105E00D, 0x00000004003BB001))
+
+        self.bus.add(ROMTable(0xE00FF000, 0xB105100D, rom_pidr,
+                              [0xE000E000, 0xE0001000, 0xE0002000,
+                               0xE0000000]))
+
+    def connect(self):
+        self.connected = True
+        return self.dpidr
+
+    def read_ap_reg(self, ap_num, addr):
+        self._check_connected()
+        ap = self.aps.get(ap_num)
+        return ap.read_reg(addr) if ap else 0
+
+    def write_ap_reg(self, ap_num, addr, v):
+        self._check_connected()
+        ap = self.aps.get(ap_num)
+        if ap:
+            ap.write_reg(addr, v)
+
+    def read(self, ap_num, addr, n, word_size):
+        self._check_connected()
+        return self.aps[ap_num].bus.read(addr, n, word_size)
+
+    def write(self, ap_num, addr, data, word_size):
+        self._check_connected()
+        self.aps[ap_num].bus.write(addr, data, word_size)
+
+    def assert_srst(self):
+        self.srst = True
+
+    def deassert_srst(self):
+        if self.srst:
+            self.srst = False
+            self.system_reset()
+
+    def system_reset(self):
+        for r in self.resettables:
+            r.reset()
+        if self.cpu is not None:
+            self.cpu.reset()
+
+    def disconnect_reset(self):
+        '''
+        Resets the target and drops the debug connection, as happens on an
+        option-byte reload.
+        '''
+        self.connected = False
+        self.system_reset()
@@ -0,0 +1,159 @@
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import time
+import os
+
+import psdb
+from .. import probe
+from . import stm32l4
+
+
+# Setting PSDB_SIM makes the simulated probe show up in probe enumeration so
+# that the command-line tools can be run against it.  The value is either 1
+# or a comma-separated list of key=value options passed to the SimProbe
+# constructor, for example:
+#
+#   PSDB_SIM=latency=125e-6,bandwidth=1e6,flash_kb=512
+ENV_SIM = 'PSDB_SIM'
+
+SIM_OPTIONS = {
+    'latency'            : float,
+    'bandwidth'          : float,
+    'flash_kb'           : int,
+    'page_erase_time'    : float,
+    'mass_erase_time'    : float,
+    'dword_program_time' : float,
+}
+
+
+def enabled():
+    return bool(os.environ.get(ENV_SIM))
+
+
+def parse_options(s):
+    '''Parses the value of PSDB_SIM into a dict of SimProbe options.'''
+    options = {}
+    for opt in s.split(','):
+        if '=' not in opt:
+            continue
+        k, v = opt.split('=', 1)
+        k    = k.strip()
+        if k not in SIM_OPTIONS:
+            raise psdb.ProbeException('Unknown %s option "%s".' % (ENV_SIM, k))
+        options[k] = SIM_OPTIONS[k](v)
+    return options
+
+
+class SimProbe(probe.Probe):
+    '''
+    A debug probe connected to a simulated target instead of real hardware,
+    for exercising target probing, flash burning and the tools without a
+    probe attached and for benchmarking the host-side cost of psdb's own
+    code.
+
+    Each transaction costs latency seconds plus, if bandwidth is set, the
+    time to move its payload at bandwidth bytes/second.  A transaction is
+    one AP register access or one bulk operation as split up by
+    Probe._split_bulk(), which is roughly what a USB probe turns into a
+    single command.  Delays are busy-waited so that short latencies are
+    accurate.  The remaining keyword arguments are passed to the target
+    model, which defaults to an STM32L4.
+    '''
+    NAME = 'Sim'
+
+    def __init__(self, sim=None, latency=0., bandwidth=None, **kwargs):
+        super().__init__()
+        self.sim        = sim or stm32l4.STM32L4(**kwargs)
+        self.latency    = latency
+        self.bandwidth  = bandwidth
+        self.tck_freq   = None
+        self.serial_num = 'SIM'
+
+    def __str__(self):
+        return '%s Debug Probe (%s target)' % (self.NAME, self.sim)
+
+    def _delay(self, nbytes):
+        dt = self.latency
+        if self.bandwidth:
+            dt += nbytes / self.bandwidth
+        if dt:
+            t1 = time.perf_counter() + dt
+            while time.perf_counter() < t1:
+                pass
+
+    def _transact(self, name, nbytes, fn, *args):
+        if self.instr is not None:
+            token = self.instr.begin()
+        rsp = fn(*args)
+        self._delay(nbytes)
+        if self.instr is not None:
+            self.instr.count_xfer(nbytes)
+            self.instr.end(self.NAME, name, token)
+        return rsp
+
+    def assert_srst(self):
+        self.sim.assert_srst()
+
+    def deassert_srst(self):
+        self.sim.deassert_srst()
+
+    def _set_tck_freq(self, freq_hz):
+        self.tck_freq = freq_hz
+        return freq_hz
+
+    def connect(self):
+        return self._transact('CONNECT', 0, self.sim.connect)
+
+    def open_ap(self, ap_num):
+        pass
+
+    def read_ap_reg(self, ap_num, addr):
+        return self._transact('READ_AP', 4, self.sim.read_ap_reg, ap_num,
+                              addr)
+
+    def write_ap_reg(self, ap_num, addr, value):
+        self._transact('WRITE_AP', 4, self.sim.write_ap_reg, ap_num, addr,
+                       value)
+
+    def _bulk_read(self, name, addr, n, word_size, ap_num):
+        return self._transact(name, n * word_size, self.sim.read, ap_num,
+                              addr, n * word_size, word_size)
+
+    def _bulk_read_8(self, addr, n, ap_num=0):
+        return self._bulk_read('READ8', addr, n, 1, ap_num)
+
+    def _bulk_read_16(self, addr, n, ap_num=0):
+        return self._bulk_read('READ16', addr, n, 2, ap_num)
+
+    def _bulk_read_32(self, addr, n, ap_num=0):
+        return self._bulk_read('READ32', addr, n, 4, ap_num)
+
+    def _bulk_write(self, name, data, addr, word_size, ap_num):
+        assert len(data) % word_size == 0
+        self._transact(name, len(data), self.sim.write, ap_num, addr, data,
+                       word_size)
+
+    def _bulk_write_8(self, data, addr, ap_num=0):
+        self._bulk_write('WRITE8', data, addr, 1, ap_num)
+
+    def _bulk_write_16(self, data, addr, ap_num=0):
+        self._bulk_write('WRITE16', data, addr, 2, ap_num)
+
+    def _bulk_write_32(self, data, addr, ap_num=0):
+        self._bulk_write('WRITE32', data, addr, 4, ap_num)
+
+    @staticmethod
+    def find():
+        if not enabled():
+            return []
+        options = parse_options(os.environ[ENV_SIM])
+        return [probe.Enumeration(SimProbe, **options)]
+
+    @classmethod
+    def show_info(cls, *args, **kwargs):
+        print('============= %s Simulated Probe =============' % cls.NAME)
+        for k, v in kwargs.items():
+            print('%*s: %s' % (13, k, v))
+
+    def show_detailed_info(self):
+        self.show_info(target=self.sim, latency=self.latency,
+                       bandwidth=self.bandwidth)
@@ -0,0 +1,55 @@
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import struct
+
+from .model import SimTarget, MemAP, RAM, ROM, RegisterBlock
+from . import flash_type1
+
+
+class STM32L4(SimTarget):
+    '''
+    Simulated STM32L4 (DEV_ID 0x464) with a single AHB-AP, a Cortex-M4, SRAM1,
+    SRAM2 (and its alias at 0x10000000), the flash and OTP behind a
+    flash_type1 FLASH controller and the device information block that
+    psdb.targets.stm32l4 reads.  Unmodelled peripherals read and write as
+    plain storage.
+    '''
+    NAME = 'STM32L4'
+
+    def __init__(self, flash_kb=256, uuid=b'PSDB-SIM-L4\x00',
+                 page_erase_time=0., mass_erase_time=0.,
+                 dword_program_time=0.):
+        super().__init__(0x2BA01477, 0x08000000)
+        bus = self.bus
+        self.aps[0] = MemAP(bus, 0x24770011, 0xE00FF003, 0x03000052)
+
+        bus.add(RAM('SRAM1', 0x20000000, 0x00008000))
+        sram2 = bus.add(RAM('SRAM2', 0x20008000, 0x00002000))
+        bus.add(RAM('SRAM2 S', 0x10000000, 0x00002000, mem=sram2.mem))
+
+        self.flash = bus.add(flash_type1.FLASH(
+            self, 'FLASH', 0x40022000, 0x08000000, flash_kb * 1024, 2048,
+            0x1FFF7000, 1024, 0xFFEFF8AA, page_erase_time=page_erase_time,
+            mass_erase_time=mass_erase_time,
+            dword_program_time=dword_program_time))
+        bus.add(self.flash.mem)
+        bus.add(self.flash.otp)
+        self.resettables.append(self.flash)
+
+        bus.add(ROM('System ROM', 0x1FFF0000, 0x00007000))
+        info = bytearray(b'\xFF') * 0x100
+        struct.pack_into('<I', info, 0x00, 0x00000000)
+        struct.pack_into('12s', info, 0x90, uuid)
+        struct.pack_into('<I', info, 0xE0, flash_kb)
+        bus.add(ROM('Device Info', 0x1FFF7500, 0x100, mem=info))
+
+        dbgmcu = bus.add(RegisterBlock('DBGMCU', 0xE0042000))
+        dbgmcu.regs[0x000] = 0x10076464
+        dbgmcu.read_only(0x000)
+
+        self.add_cortex_m4(0x00000000000A0464)
+        bus.add(RegisterBlock('Peripherals', 0x40000000, 0x20000000),
+                background=True)
+        bus.add(RegisterBlock('PPB', 0xE0000000, 0x00100000),
+                background=True)
+
+        self.system_reset()
@@ -0,0 +1,449 @@
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import struct
+
+from . import model
+
+
+M32 = 0xFFFFFFFF
+
+# Core register selectors, as used by DCRSR.
+SP   = 13
+LR   = 14
+PC   = 15
+XPSR = 16
+CP   = 20
+
+XPSR_N = (1 << 31)
+XPSR_Z = (1 << 30)
+XPSR_C = (1 << 29)
+XPSR_V = (1 << 28)
+XPSR_T = (1 << 24)
+
+
+class LockupException(Exception):
+    pass
+
+
+class BreakpointException(Exception):
+    pass
+
+
+def sext(v, bits):
+    m = (1 << (bits - 1))
+    return (v ^ m) - m
+
+
+def add_with_carry(x, y, carry):
+    u = x + y + carry
+    r = u & M32
+    s = sext(x, 32) + sext(y, 32) + carry
+    return r, int(u > M32), int(sext(r, 32) != s)
+
+
+class Thumb:
+    '''
+    Interpreter for the ARMv6-M Thumb instruction set, enough to run small
+    RAM-resident routines such as flash loaders on a simulated core.  There is
+    no exception model: an undefined instruction, SVC, exception return or bus
+    fault locks the core up, which stops it executing until it is reset.  BKPT
+    halts the core, as it does with halting debug enabled.  CPSID/CPSIE only
+    track PRIMASK since nothing raises interrupts.
+
+    Registers are the CortexM model's core_regs dict, keyed by DCRSR selector.
+    '''
+    CONDITIONS = [
+        lambda n, z, c, v: z,
+        lambda n, z, c, v: not z,
+        lambda n, z, c, v: c,
+        lambda n, z, c, v: not c,
+        lambda n, z, c, v: n,
+        lambda n, z, c, v: not n,
+        lambda n, z, c, v: v,
+        lambda n, z, c, v: not v,
+        lambda n, z, c, v: c and not z,
+        lambda n, z, c, v: not c or z,
+        lambda n, z, c, v: n == v,
+        lambda n, z, c, v: n != v,
+        lambda n, z, c, v: not z and n == v,
+        lambda n, z, c, v: z or n != v,
+        ]
+
+    def __init__(self, bus):
+        self.bus     = bus
+        self.r       = None
+        self.flags   = None
+        self.primask = 0
+        self.stores  = 0
+
+    def read(self, addr, size):
+        try:
+            data = self.bus.read(addr, size, size)
+        except model.SimFaultException as e:
+            raise LockupException(str(e))
+        return int.from_bytes(data, 'little')
+
+    def write(self, addr, v, size):
+        try:
+            self.bus.write(addr, (v & M32).to_bytes(4, 'little')[:size], size)
+        except model.SimFaultException as e:
+            raise LockupException(str(e))
+        self.stores += 1
+
+    def fetch(self, addr):
+        try:
+            return struct.unpack('<H', self.bus.read(addr, 2, 2))[0]
+        except model.SimFaultException as e:
+            raise LockupException(str(e))
+
+    def run(self, core_regs, n):
+        '''
+        Executes up to n instructions.  Execution also stops early if the core
+        is spinning: when a backward branch is taken twice in a row with the
+        same register contents and no stores in between, the core is assumed
+        to be polling for something that only the debugger or the passage of
+        time will change.  Raises LockupException or BreakpointException.
+        '''
+        r = [core_regs.get(i, 0) for i in range(16)]
+        if not core_regs.get(XPSR, 0) & XPSR_T:
+            raise LockupException('xPSR.T clear')
+
+        xpsr         = core_regs.get(XPSR, 0)
+        self.r       = r
+        self.flags   = [bool(xpsr & XPSR_N), bool(xpsr & XPSR_Z),
+                        bool(xpsr & XPSR_C), bool(xpsr & XPSR_V)]
+        self.primask = core_regs.get(CP, 0) & 1
+        spin         = None
+        try:
+            for _ in range(n):
+                pc = r[15]
+                self.step(pc)
+                if r[15] < pc:
+                    state = (self.stores, tuple(r), tuple(self.flags))
+                    if spin == state:
+                        break
+                    spin = state
+        finally:
+            n, z, c, v = self.flags
+            core_regs.update(enumerate(r))
+            core_regs[XPSR]  = ((xpsr & 0x0FFFFFFF) |
+                                (XPSR_N if n else 0) | (XPSR_Z if z else 0) |
+                                (XPSR_C if c else 0) | (XPSR_V if v else 0))
+            core_regs[CP]    = (core_regs.get(CP, 0) & ~1) | self.primask
+            core_regs[SP]   &= ~3
+            if core_regs.get(CP, 0) & (1 << 25):
+                core_regs[18] = core_regs[SP]
+            else:
+                core_regs[17] = core_regs[SP]
+
+    def set_nz(self, v):
+        self.flags[0] = bool(v & 0x80000000)
+        self.flags[1] = (v == 0)
+
+    def set_nzcv(self, v, c, ov):
+        self.set_nz(v)
+        self.flags[2] = bool(c)
+        self.flags[3] = bool(ov)
+
+    def shift(self, kind, v, amount, carry):
+        if kind == 0:
+            if amount == 0:
+                return v, carry
+            if amount > 32:
+                return 0, 0
+            return (v << amount) & M32, (v >> (32 - amount)) & 1
+        if kind == 1:
+            if amount == 0:
+                return v, carry
+            if amount > 32:
+                return 0, 0
+            return v >> amount, (v >> (amount - 1)) & 1
+        if kind == 2:
+            if amount == 0:
+                return v, carry
+            sv     = sext(v, 32)
+            amount = min(amount, 32)
+            return (sv >> amount) & M32, (sv >> (amount - 1)) & 1
+        if amount == 0:
+            return v, carry
+        amount &= 31
+        if amount == 0:
+            return v, v >> 31
+        v = ((v >> amount) | (v << (32 - amount))) & M32
+        return v, v >> 31
+
+    def branch(self, addr):
+        self.r[15] = addr & M32 & ~1
+
+    def step(self, pc):  # noqa: C901
+        r  = self.r
+        op = self.fetch(pc)
+        r[15] = pc + 2
+        pcv   = pc + 4
+        top   = op >> 11
+
+        if top < 3:
+            # LSL, LSR, ASR (immediate).
+            rd, rm = op & 7, (op >> 3) & 7
+            imm5   = (op >> 6) & 0x1F
+            if top and not imm5:
+                imm5 = 32
+            v, c = self.shift(top, r[rm], imm5, self.flags[2])
+            r[rd] = v
+            self.set_nz(v)
+            self.flags[2] = bool(c)
+        elif top == 3:
+            # ADD/SUB register or 3-bit immediate.
+            rd, rn = op & 7, (op >> 3) & 7
+            y      = (op >> 6) & 7
+            if not op & (1 << 10):
+                y = r[y]
+            if op & (1 << 9):
+                v, c, ov = add_with_carry(r[rn], ~y & M32, 1)
+            else:
+                v, c, ov = add_with_carry(r[rn], y, 0)
+            r[rd] = v
+            self.set_nzcv(v, c, ov)
+        elif top < 8:
+            # MOV, CMP, ADD, SUB with 8-bit immediate.
+            rd  = (op >> 8) & 7
+            imm = op & 0xFF
+            opc = top & 3
+            if opc == 0:
+                r[rd] = imm
+                self.set_nz(imm)
+            elif opc == 1:
+                v, c, ov = add_with_carry(r[rd], ~imm & M32, 1)
+                self.set_nzcv(v, c, ov)
+            else:
+                if opc == 2:
+                    v, c, ov = add_with_carry(r[rd], imm, 0)
+                else:
+                    v, c, ov = add_with_carry(r[rd], ~imm & M32, 1)
+                r[rd] = v
+                self.set_nzcv(v, c, ov)
+        elif top == 8:
+            if op & (1 << 10):
+                self.special_data(op, pcv)
+            else:
+                self.data_processing(op)
+        elif top == 9:
+            # LDR (literal).
+            r[(op >> 8) & 7] = self.read((pcv & ~3) + (op & 0xFF) * 4, 4)
+        elif top < 12:
+            self.load_store_reg(op)
+        elif top < 16:
+            rt, rn = op & 7, (op >> 3) & 7
+            imm5   = (op >> 6) & 0x1F
+            size   = 1 if op & (1 << 12) else 4
+            addr   = (r[rn] + imm5 * size) & M32
+            if op & (1 << 11):
+                r[rt] = self.read(addr, size)
+            else:
+                self.write(addr, r[rt], size)
+        elif top < 18:
+            rt, rn = op & 7, (op >> 3) & 7
+            addr   = (r[rn] + ((op >> 6) & 0x1F) * 2) & M32
+            if op & (1 << 11):
+                r[rt] = self.read(addr, 2)
+            else:
+                self.write(addr, r[rt], 2)
+        elif top < 20:
+            rt   = (op >> 8) & 7
+            addr = (r[13] + (op & 0xFF) * 4) & M32
+            if op & (1 << 11):
+                r[rt] = self.read(addr, 4)
+            else:
+                self.write(addr, r[rt], 4)
+        elif top < 22:
+            rd = (op >> 8) & 7
+            if op & (1 << 11):
+                r[rd] = (r[13] + (op & 0xFF) * 4) & M32
+            else:
+                r[rd] = (pcv & ~3) + (op & 0xFF) * 4
+        elif top < 24:
+            self.misc(op)
+        elif top < 26:
+            self.load_store_multiple(op)
+        elif top < 28:
+            cond = (op >> 8) & 0xF
+            if cond >= 14:
+                raise LockupException('SVC/UDF 0x%04X at 0x%08X' % (op, pc))
+            if Thumb.CONDITIONS[cond](*self.flags):
+                self.branch(pcv + sext(op & 0xFF, 8) * 2)
+        elif top == 28:
+            self.branch(pcv + sext(op & 0x7FF, 11) * 2)
+        else:
+            self.thumb32(op, pc)
+
+    def data_processing(self, op):
+        r      = self.r
+        rd, rm = op & 7, (op >> 3) & 7
+        opc    = (op >> 6) & 0xF
+        x, y   = r[rd], r[rm]
+        if opc in (0, 8):
+            v = x & y
+        elif opc == 1:
+            v = x ^ y
+        elif opc in (2, 3, 4, 7):
+            v, c = self.shift({2: 0, 3: 1, 4: 2, 7: 3}[opc], x, y & 0xFF,
+                              self.flags[2])
+            self.flags[2] = bool(c)
+        elif opc == 5:
+            v, c, ov = add_with_carry(x, y, int(self.flags[2]))
+            self.set_nzcv(v, c, ov)
+        elif opc == 6:
+            v, c, ov = add_with_carry(x, ~y & M32, int(self.flags[2]))
+            self.set_nzcv(v, c, ov)
+        elif opc == 9:
+            v, c, ov = add_with_carry(~y & M32, 0, 1)
+            self.set_nzcv(v, c, ov)
+        elif opc == 10:
+            v, c, ov = add_with_carry(x, ~y & M32, 1)
+            self.set_nzcv(v, c, ov)
+        elif opc == 11:
+            v, c, ov = add_with_carry(x, y, 0)
+            self.set_nzcv(v, c, ov)
+        elif opc == 12:
+            v = x | y
+        elif opc == 13:
+            v = (x * y) & M32
+        elif opc == 14:
+            v = x & ~y
+        else:
+            v = ~y & M32
+        self.set_nz(v)
+        if opc not in (8, 10, 11):
+            r[rd] = v
+
+    def special_data(self, op, pcv):
+        r   = self.r
+        rm  = (op >> 3) & 0xF
+        rd  = (op & 7) | ((op >> 4) & 8)
+        opc = (op >> 8) & 3
+        y   = pcv if rm == 15 else r[rm]
+        if opc == 3:
+            if y & 0xF0000000 == 0xF0000000:
+                raise LockupException('Exception return to 0x%08X' % y)
+            if not y & 1:
+                raise LockupException('Interworking branch to ARM state')
+            if op & (1 << 7):
+                r[14] = r[15] | 1
+            self.branch(y)
+            return
+        x = pcv if rd == 15 else r[rd]
+        if opc == 1:
+            v, c, ov = add_with_carry(x, ~y & M32, 1)
+            self.set_nzcv(v, c, ov)
+            return
+        v = (x + y) & M32 if opc == 0 else y
+        if rd == 15:
+            self.branch(v)
+        else:
+            r[rd] = v
+
+    def load_store_reg(self, op):
+        r          = self.r
+        rt, rn, rm = op & 7, (op >> 3) & 7, (op >> 6) & 7
+        addr       = (r[rn] + r[rm]) & M32
+        opc        = (op >> 9) & 7
+        if opc < 3:
+            self.write(addr, r[rt], (4, 2, 1)[opc])
+        elif opc == 3:
+            r[rt] = sext(self.read(addr, 1), 8) & M32
+        elif opc == 7:
+            r[rt] = sext(self.read(addr, 2), 16) & M32
+        else:
+            r[rt] = self.read(addr, (4, 2, 1)[opc - 4])
+
+    def misc(self, op):  # noqa: C901
+        r = self.r
+        if op & 0xFF00 == 0xB000:
+            imm = (op & 0x7F) * 4
+            r[13] = (r[13] + (-imm if op & 0x80 else imm)) & M32
+        elif op & 0xFF00 == 0xB200:
+            rd, v = op & 7, r[(op >> 3) & 7]
+            opc   = (op >> 6) & 3
+            if opc == 0:
+                v = sext(v & 0xFFFF, 16) & M32
+            elif opc == 1:
+                v = sext(v & 0xFF, 8) & M32
+            elif opc == 2:
+                v = v & 0xFFFF
+            else:
+                v = v & 0xFF
+            r[rd] = v
+        elif op & 0xFE00 == 0xB400:
+            regs = [i for i in range(8) if op & (1 << i)]
+            if op & 0x100:
+                regs.append(14)
+            addr = (r[13] - 4 * len(regs)) & M32
+            r[13] = addr
+            for i in regs:
+                self.write(addr, r[i], 4)
+                addr += 4
+        elif op & 0xFFEF == 0xB662:
+            self.primask = (op >> 4) & 1
+        elif op & 0xFF00 == 0xBA00:
+            rd, v = op & 7, r[(op >> 3) & 7]
+            opc   = (op >> 6) & 3
+            if opc == 0:
+                v = int.from_bytes(v.to_bytes(4, 'little'), 'big')
+            elif opc == 1:
+                v = (((v & 0x00FF00FF) << 8) | ((v >> 8) & 0x00FF00FF))
+            elif opc == 3:
+                v = sext(((v & 0xFF) << 8) | ((v >> 8) & 0xFF), 16) & M32
+            else:
+                raise LockupException('Undefined instruction 0x%04X' % op)
+            r[rd] = v
+        elif op & 0xFE00 == 0xBC00:
+            addr = r[13]
+            regs = [i for i in range(8) if op & (1 << i)]
+            for i in regs:
+                r[i] = self.read(addr, 4)
+                addr += 4
+            if op & 0x100:
+                pc = self.read(addr, 4)
+                addr += 4
+            r[13] = addr & M32
+            if op & 0x100:
+                if pc & 0xF0000000 == 0xF0000000:
+                    raise LockupException('Exception return to 0x%08X' % pc)
+                self.branch(pc)
+        elif op & 0xFF00 == 0xBE00:
+            r[15] -= 2
+            raise BreakpointException()
+        elif op & 0xFF0F == 0xBF00:
+            pass
+        else:
+            raise LockupException('Undefined instruction 0x%04X' % op)
+
+    def load_store_multiple(self, op):
+        r    = self.r
+        rn   = (op >> 8) & 7
+        regs = [i for i in range(8) if op & (1 << i)]
+        addr = r[rn]
+        for i in regs:
+            if op & (1 << 11):
+                r[i] = self.read(addr, 4)
+            else:
+                self.write(addr, r[i], 4)
+            addr += 4
+        if not (op & (1 << 11)) or rn not in regs:
+            r[rn] = addr & M32
+
+    def thumb32(self, op, pc):
+        op2 = self.fetch(pc + 2)
+        self.r[15] = pc + 4
+        if op & 0xF800 == 0xF000 and op2 & 0xD000 == 0xD000:
+            s   = (op >> 10) & 1
+            i1  = 1 ^ ((op2 >> 13) & 1) ^ s
+            i2  = 1 ^ ((op2 >> 11) & 1) ^ s
+            imm = ((s << 24) | (i1 << 23) | (i2 << 22) | ((op & 0x3FF) << 12) |
+                   ((op2 & 0x7FF) << 1))
+            self.r[14] = (pc + 4) | 1
+            self.branch(pc + 4 + sext(imm, 25))
+        elif op == 0xF3BF and op2 & 0xFFF0 in (0x8F40, 0x8F50, 0x8F60):
+            pass
+        else:
+            raise LockupException('Undefined instruction 0x%04X%04X at '
+                                  '0x%08X' % (op, op2, pc))
@@ -1250,8 +1250,8 @@ class ScatterGatherIn(STLinkCommand):
         N      = len(self.ops)
         result = []
         for i, op in enumerate(self.ops):
-            payload = unpack_from('<I', rsp, i * 4)
-            error   = unpack_from('<I', rsp, (i + N) * 4)
+            payload = unpack_from('<I', rsp, i * 4)[0]
+            error   = unpack_from('<I', rsp, (i + N) * 4)[0]
             result.append((op[0], error, payload))
 
         return result
@@ -68,3 +68,12 @@ class STLinkXFERException(psdb.ProbeException):
         super().__init__(msg)
         self.status     = status
         self.fault_addr = fault_addr
+
+
+class STLinkSGException(psdb.ProbeException):
+    def __init__(self, cmd, err):
+        super().__init__('Scatter-gather error 0x%02X (%s) accessing 0x%08X '
+                         'on AP %u' % (err, status_string(err), cmd.addr,
+                                       cmd.ap.ap_num))
+        self.cmd = cmd
+        self.err = err
@@ -1,8 +1,11 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
-from builtins import bytes, range
+from builtins import bytes
+import array
+import collections
 import time
 
 import psdb
+from .. import probe
 from .. import usb_probe
 from . import cdb
 from . import errors
@@ -49,6 +52,71 @@ FEATURE_TRACE         = (1 << 8)
 FEATURE_SWD_WAIT_OK   = (1 << 9)
 
 
+class RetryPolicy:
+    '''
+    Controls how STLink._cmd_allow_retry() handles SWD_AP_WAIT/SWD_DP_WAIT
+    responses.  The first retry happens after initial_delay seconds and each
+    subsequent delay is multiplied by backoff, up to max_delay.  The command
+    fails once deadline seconds have elapsed since the first attempt or, if
+    max_retries is not None, after that many retries.
+    '''
+    def __init__(self, initial_delay=20e-6, backoff=2, max_delay=10e-3,
+                 deadline=1., max_retries=None):
+        assert backoff >= 1
+        self.initial_delay = initial_delay
+        self.backoff       = backoff
+        self.max_delay     = max_delay
+        self.deadline      = deadline
+        self.max_retries   = max_retries
+
+    def delays(self):
+        '''
+        Yields the delay before each retry, stopping when the retry budget is
+        exhausted.
+        '''
+        t_end = time.perf_counter() + self.deadline
+        delay = self.initial_delay
+        n     = 0
+        while self.max_retries is None or n < self.max_retries:
+            delay = min(delay, t_end - time.perf_counter())
+            if delay < 0:
+                return
+            yield delay
+            delay = min(delay * self.backoff, self.max_delay)
+            n    += 1
+
+
+class Stats(probe.Stats):
+    '''
+    WAIT-response counters for each command type, accumulated since the last
+    call to get_stats().  Unlike the XTSWD, whose counters live in the probe
+    firmware, the ST-LINK counters are kept on the host in the STLink object,
+    so they only cover the current process; a separate dump_stats run always
+    starts from zero.
+    '''
+    def __init__(self):
+        self.waits     = collections.Counter()
+        self.failures  = collections.Counter()
+        self.wait_time = collections.Counter()
+
+    def record_wait(self, name, delay=0):
+        self.waits[name]     += 1
+        self.wait_time[name] += delay
+
+    def record_failure(self, name):
+        self.failures[name] += 1
+
+    def dump(self):
+        if not self.waits:
+            print('No WAIT responses in this session.')
+            return
+
+        for name in sorted(self.waits):
+            print('%24s: %u waits, %u failures, %.3f ms backoff' %
+                  (name, self.waits[name], self.failures[name],
+                   self.wait_time[name] * 1000))
+
+
 class STLink(usb_probe.Probe):
     '''
     STLink V2.1 debug probe.  This can be found on the Nucleo 144 board we have
@@ -61,6 +129,9 @@ class STLink(usb_probe.Probe):
         self.max_rw8      = None
         self.max_sg_ops   = 0
         self.max_swo_freq = 0
+        self.retry_policy = RetryPolicy()
+        self.stats        = Stats()
+        self._rx_array    = array.array('B')
 
     def _check_xfer_status(self):
         '''
@@ -82,6 +153,16 @@ class STLink(usb_probe.Probe):
         Executes a CDB by writing it to the TX_EP and then driving the various
         phases according to the CDB flags.
         '''
+        if self.instr is None:
+            return self._exec_cdb_phases(cmd, timeout)
+
+        token = self.instr.begin()
+        try:
+            return self._exec_cdb_phases(cmd, timeout)
+        finally:
+            self.instr.end(self.NAME, type(cmd).__name__, token)
+
+    def _exec_cdb_phases(self, cmd, timeout):
         assert len(cmd.cdb) == 16
         assert self.usb_dev.write(TX_EP, cmd.cdb) == len(cmd.cdb)
 
@@ -103,20 +184,86 @@ class STLink(usb_probe.Probe):
 
         return retval
 
-    def _cmd_allow_retry(self, cmd, retries=10, delay=0.1):
+    def _get_rx_array(self, n):
+        '''
+        Returns the probe's reusable array.array resized in place to exactly
+        n bytes for pyusb to receive into.  The length must be exact since the
+        STLINK doesn't terminate data phases with a short packet.  Only one
+        buffer is kept, so its storage is bounded by the largest transfer.
+        '''
+        buf = self._rx_array
+        if len(buf) > n:
+            del buf[n:]
+        elif len(buf) < n:
+            buf.frombytes(bytes(n - len(buf)))
+        return buf
+
+    def _exec_cdb_into(self, cmd, mv, timeout=1000):
+        '''
+        Executes a CDB that has a raw data-in phase, receiving the response
+        through the reusable pyusb array buffer and copying the first len(mv)
+        bytes of it into the memoryview mv instead of decoding it.  pyusb can
+        only receive into an array.array, so this costs one copy but no
+        per-transfer allocations.
+        '''
+        if self.instr is None:
+            self._exec_cdb_phases_into(cmd, mv, timeout)
+            return
+
+        token = self.instr.begin()
+        try:
+            self._exec_cdb_phases_into(cmd, mv, timeout)
+        finally:
+            self.instr.end(self.NAME, type(cmd).__name__, token)
+
+    def _exec_cdb_phases_into(self, cmd, mv, timeout):
+        assert cmd.CMD_FLAGS & cdb.HAS_DATA_IN_PHASE
+        assert not cmd.CMD_FLAGS & (cdb.HAS_EMBEDDED_STATUS |
+                                    cdb.HAS_DATA_OUT_PHASE)
+        assert len(cmd.cdb) == 16
+        assert self.usb_dev.write(TX_EP, cmd.cdb) == len(cmd.cdb)
+
+        buf  = self._get_rx_array(cmd.RSP_LEN)
+        size = self.usb_dev.read(RX_EP, buf, timeout=timeout)
+        assert size == cmd.RSP_LEN
+        # Release the view before returning so that the buffer can be resized
+        # for the next transfer.
+        with memoryview(buf) as src:
+            mv[:] = src[:len(mv)]
+
+        if cmd.CMD_FLAGS & cdb.HAS_STATUS_PHASE:
+            self._check_xfer_status()
+
+    def _cmd_allow_retry(self, cmd, policy=None):
         '''
-        Executes the CDB, retrying it if necessary based on the status code.
+        Executes the CDB, retrying it with backoff according to the retry
+        policy if the target responds with a WAIT.  Uses self.retry_policy if
+        no policy is specified.
 
         Returns the decoded response if a response is expected.
         '''
-        for _ in range(retries):
+        policy = policy or self.retry_policy
+        name   = type(cmd).__name__
+        try:
+            return self._exec_cdb(cmd)
+        except errors.STLinkCmdException as e:
+            if e.err not in (errors.SWD_AP_WAIT, errors.SWD_DP_WAIT):
+                raise
+
+        for delay in policy.delays():
+            self.stats.record_wait(name, delay)
+            if self.instr is not None:
+                self.instr.record_retry(self.NAME, name)
+            time.sleep(delay)
             try:
                 return self._exec_cdb(cmd)
             except errors.STLinkCmdException as e:
                 if e.err not in (errors.SWD_AP_WAIT, errors.SWD_DP_WAIT):
                     raise
-            time.sleep(delay)
-        raise psdb.ProbeException('Max retries exceeded!')
+
+        self.stats.record_wait(name)
+        self.stats.record_failure(name)
+        raise psdb.ProbeException('Max retries exceeded for %s!' % name)
 
     def _get_voltage(self):
         '''
@@ -163,13 +310,9 @@ class STLink(usb_probe.Probe):
         '''
         Reads a consecutive number of bytes from the specified address.
         '''
-        data = bytes(b'')
-        while n:
-            size  = min(n, self.max_rw8)
-            data += self._exec_cdb(cdb.BulkRead8(addr, size, ap_num))
-            addr += size
-            n    -= size
-        return data
+        data = bytearray(n)
+        self._bulk_read_into(memoryview(data), addr, n, 1, ap_num)
+        return bytes(data)
 
     def _bulk_read_16(self, addr, n, ap_num=0):
         '''
@@ -187,6 +330,24 @@ class STLink(usb_probe.Probe):
         assert n > 0
         return self._exec_cdb(cdb.BulkRead32(addr, n, ap_num))
 
+    def _bulk_read_into(self, mv, addr, n, word_size, ap_num=0):
+        '''
+        Reads n 8- or 32-bit words from addr directly into the memoryview mv.
+        8-bit reads are split up according to max_rw8.
+        '''
+        if word_size == 4:
+            self._exec_cdb_into(cdb.BulkRead32(addr, n, ap_num), mv)
+            return
+
+        pos = 0
+        while n:
+            size  = min(n, self.max_rw8)
+            self._exec_cdb_into(cdb.BulkRead8(addr, size, ap_num),
+                                mv[pos:pos + size])
+            addr += size
+            pos  += size
+            n    -= size
+
     def _bulk_write_8(self, data, addr, ap_num=0):
         '''
         Writes a consecutive number of bytes to the specified address.
@@ -213,6 +374,15 @@ class STLink(usb_probe.Probe):
         assert data
         self._exec_cdb(cdb.BulkWrite32(data, addr, ap_num))
 
+    def get_stats(self):
+        '''
+        Returns the WAIT statistics accumulated by this STLink object since
+        the last call.  The counters are not persisted, so this is only
+        useful from the process that issued the commands.
+        '''
+        stats, self.stats = self.stats, Stats()
+        return stats
+
     def _get_max_sg_ops(self):
         return self._cmd_allow_retry(cdb.ScatterGatherGetMaxOps())
 
@@ -280,6 +450,104 @@ class STLink(usb_probe.Probe):
         self._cmd_allow_retry(cdb.ScatterGatherOut(ops))
         return self._cmd_allow_retry(cdb.ScatterGatherIn(ops))
 
+    def _exec_sg_ops(self, ops, op_cmds, cmd_list, read_vals):
+        '''
+        Executes a scatter/gather ops list.  The op_cmds list holds
+        (cmd_list index, ops index) pairs mapping each CMD_READ or CMD_WRITE
+        op back to the command that generated it; read results are stored in
+        the matching read_vals slot.  If an op got a WAIT response then it and
+        every following op in the batch are reissued individually, in order,
+        with the usual retry backoff; any other error is raised against the
+        offending command.
+        '''
+        if not ops:
+            return
+
+        results = self.scatter_gather(ops)
+        for k, (i, j) in enumerate(op_cmds):
+            cmd             = cmd_list[i]
+            _, err, payload = results[j]
+            if err in (errors.SWD_AP_WAIT, errors.SWD_DP_WAIT):
+                self.stats.record_wait('ScatterGather')
+                if self.instr is not None:
+                    self.instr.record_retry(self.NAME, 'ScatterGatherIn')
+                self._reissue_sg_cmds(op_cmds[k:], cmd_list, read_vals)
+                return
+            if err != errors.DEBUG_OK:
+                raise errors.STLinkSGException(cmd, err)
+            if isinstance(cmd, psdb.devices.ReadCommand):
+                read_vals[i] = payload
+
+    def _reissue_sg_cmds(self, op_cmds, cmd_list, read_vals):
+        '''
+        Executes the commands for the tail of a scatter/gather batch one at a
+        time, preserving their order.
+        '''
+        for i, _ in op_cmds:
+            cmd = cmd_list[i]
+            if isinstance(cmd, psdb.devices.ReadCommand):
+                read_vals[i] = self.read_32(cmd.addr, cmd.ap.ap_num)
+            else:
+                self.write_32(cmd.value, cmd.addr, cmd.ap.ap_num)
+
+    def exec_cmd_list(self, cmd_list):
+        '''
+        Executes a list of ReadCommand and WriteCommand objects, packing
+        consecutive 32-bit accesses into as few scatter/gather transactions as
+        max_sg_ops allows.  A CMD_APNUM op is inserted at the start of each
+        transaction and whenever the AP changes, and a CMD_ADDRESS op precedes
+        each write to a new address.  8- and 16-bit accesses can't be encoded
+        as scatter/gather ops and are executed individually, in order.
+
+        Returns the list of values from the ReadCommands.
+        '''
+        if not self.features & FEATURE_SCATTERGATHER or self.max_sg_ops < 3:
+            return super().exec_cmd_list(cmd_list)
+
+        read_vals = [None] * len(cmd_list)
+        ops       = []
+        op_cmds   = []
+        ap_num    = None
+        wr_addr   = None
+        for i, cmd in enumerate(cmd_list):
+            is_read = isinstance(cmd, psdb.devices.ReadCommand)
+            if not is_read and not isinstance(cmd, psdb.devices.WriteCommand):
+                raise Exception('Unrecognized command: %s' % cmd)
+            assert cmd.ap.db == self
+
+            if cmd.size != 4:
+                self._exec_sg_ops(ops, op_cmds, cmd_list, read_vals)
+                ops, op_cmds, ap_num, wr_addr = [], [], None, None
+                vals = super().exec_cmd_list([cmd])
+                if is_read:
+                    read_vals[i] = vals[0]
+                continue
+
+            nops  = 1
+            nops += 0 if cmd.ap.ap_num == ap_num else 1
+            nops += 0 if is_read or cmd.addr == wr_addr else 1
+            if len(ops) + nops > self.max_sg_ops:
+                self._exec_sg_ops(ops, op_cmds, cmd_list, read_vals)
+                ops, op_cmds, ap_num, wr_addr = [], [], None, None
+
+            if cmd.ap.ap_num != ap_num:
+                ap_num  = cmd.ap.ap_num
+                wr_addr = None
+                ops.append((cdb.CMD_APNUM, ap_num))
+            if is_read:
+                op_cmds.append((i, len(ops)))
+                ops.append((cdb.CMD_READ, cmd.addr))
+            else:
+                if cmd.addr != wr_addr:
+                    wr_addr = cmd.addr
+                    ops.append((cdb.CMD_ADDRESS, wr_addr))
+                op_cmds.append((i, len(ops)))
+                ops.append((cdb.CMD_WRITE, cmd.value))
+
+        self._exec_sg_ops(ops, op_cmds, cmd_list, read_vals)
+        return [v for v, cmd in zip(read_vals, cmd_list)
+                if isinstance(cmd, psdb.devices.ReadCommand)]
+
     def trace_enable(self, swo_freq_hz, trace_size=4096):
         return self._cmd_allow_retry(cdb.TraceEnable(swo_freq_hz, trace_size))
 
@@ -0,0 +1,198 @@
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import psdb
+
+
+class FutureNotResolvedException(psdb.PSDBException):
+    pass
+
+
+class Future:
+    '''
+    Placeholder for the result of a read that was recorded in a Transaction.
+    The value becomes available once the transaction has been flushed.  For
+    field reads, the shift and mask are applied to the raw register value.
+    '''
+    def __init__(self, cmd, shift=0, mask=None):
+        self.cmd      = cmd
+        self.shift    = shift
+        self.mask     = mask
+        self.resolved = False
+        self._value   = None
+
+    def __repr__(self):
+        if not self.resolved:
+            return 'Future(0x%08X, unresolved)' % self.cmd.addr
+        return 'Future(0x%08X, 0x%X)' % (self.cmd.addr, self._value)
+
+    def __bool__(self):
+        raise Exception("Don't test a Future!")
+
+    def _resolve(self, v):
+        v >>= self.shift
+        if self.mask is not None:
+            v &= self.mask
+        self._value   = v
+        self.resolved = True
+
+    @property
+    def value(self):
+        if not self.resolved:
+            raise FutureNotResolvedException(
+                    'Future for 0x%08X read before transaction flushed.'
+                    % self.cmd.addr)
+        return self._value
+
+
+class _Op:
+    '''
+    A single recorded operation.  Reads carry the Future to resolve.
+    Writes carry the full value to write.  Field updates carry a mask/bits
+    pair that is merged into the register value at flush time.
+    '''
+    READ      = 0
+    WRITE     = 1
+    SET_FIELD = 2
+
+    def __init__(self, typ, ap, addr, size, value=0, mask=0):
+        self.typ     = typ
+        self.ap      = ap
+        self.addr    = addr
+        self.size    = size
+        self.value   = value
+        self.mask    = mask
+        self.future  = None
+
+    @property
+    def key(self):
+        return (self.ap.ap_num, self.addr)
+
+
+class Transaction:
+    '''
+    Records register reads, writes and field read-modify-writes issued through
+    Device objects and then executes them in as few probe transactions as
+    possible via Probe.exec_cmd_list().  Typical usage:
+
+        with dev.ap.db.transaction():
+            dev._CR.PG    = 1
+            dev._CR.PSIZE = 2
+            v = dev._SR.read()
+        print(v.value)
+
+    Reads return Future objects whose value is available after the context
+    exits.  Writes are never reordered or dropped.  If coalesce is True then
+    consecutive field updates to the same 32-bit register are folded into a
+    single write; sequences that require the hardware to observe separate
+    field writes should use a full-register write or call flush() between
+    them.
+
+    The base value for a field update is taken from the immediately
+    preceding operation if that was a full write of the same register.
+    Otherwise the register is read after all the operations recorded before
+    the update have executed, so that side-effects of earlier writes, such
+    as a KEYR unlock clearing CR.LOCK or a write-1-to-clear of a status
+    register, are seen; each such read costs a round trip.
+
+    If an exception propagates out of the context, the pending operations are
+    discarded rather than executed.
+    '''
+    def __init__(self, db, coalesce=True):
+        self.db       = db
+        self.coalesce = coalesce
+        self.ops      = []
+        self.depth    = 0
+
+    def __enter__(self):
+        if self.depth == 0:
+            assert self.db.txn is None
+            self.db.txn = self
+        self.depth += 1
+        return self
+
+    def __exit__(self, _type, value, traceback):
+        self.depth -= 1
+        if self.depth:
+            return
+        self.db.txn = None
+        if _type is None:
+            self.flush()
+        else:
+            self.ops = []
+
+    def read(self, ap, addr, size, shift=0, mask=None):
+        '''Records a read and returns a Future for its value.'''
+        op = _Op(_Op.READ, ap, addr, size)
+        op.future = Future(op, shift=shift, mask=mask)
+        self.ops.append(op)
+        return op.future
+
+    def write(self, ap, addr, size, v):
+        '''Records a write of the full register.'''
+        assert isinstance(v, int)
+        self.ops.append(_Op(_Op.WRITE, ap, addr, size, value=v))
+
+    def set_field(self, ap, addr, mask, bits):
+        '''
+        Records a read-modify-write of the 32-bit register at addr, replacing
+        the bits selected by mask with bits.
+        '''
+        assert (bits & ~mask) == 0
+        if self.coalesce and self.ops:
+            prev = self.ops[-1]
+            if (prev.typ == _Op.SET_FIELD and prev.ap is ap and
+                    prev.addr == addr):
+                prev.value = (prev.value & ~mask) | bits
+                prev.mask |= mask
+                return
+
+        self.ops.append(_Op(_Op.SET_FIELD, ap, addr, 4, value=bits,
+                            mask=mask))
+
+    def _exec(self, cmds, futures):
+        '''
+        Executes a list of commands and resolves the Futures of its reads.
+        Returns the values of any reads that follow the Futures' reads.
+        '''
+        vals = self.db.exec_cmd_list(cmds)
+        assert len(vals) >= len(futures)
+        for f, v in zip(futures, vals):
+            f._resolve(v)
+        return vals[len(futures):]
+
+    def flush(self):
+        '''
+        Executes all pending operations and resolves their Futures.
+        '''
+        ops      = self.ops
+        self.ops = []
+        if not ops:
+            return
+
+        # last holds the key and value of the most recent write if it was a
+        # full 32-bit write, since that value is then still the register's
+        # contents.  Any other field update needs a fresh base read, which
+        # has to happen after all the operations before it.
+        cmds    = []
+        futures = []
+        last    = None
+        for op in ops:
+            if op.typ == _Op.READ:
+                cmds.append(psdb.devices.ReadCommand(op.ap, op.addr, op.size))
+                futures.append(op.future)
+                continue
+
+            if op.typ == _Op.SET_FIELD:
+                if last is not None and last[0] == op.key:
+                    base = last[1]
+                else:
+                    cmds.append(psdb.devices.ReadCommand(op.ap, op.addr, 4))
+                    base    = self._exec(cmds, futures)[0]
+                    cmds    = []
+                    futures = []
+                v = (base & ~op.mask) | op.value
+            else:
+                v = op.value
+            last = (op.key, v) if op.size == 4 else None
+            cmds.append(psdb.devices.WriteCommand(op.ap, op.addr, op.size, v))
+
+        self._exec(cmds, futures)
@@ -1,8 +1,13 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
+import ctypes
+
 import usb.core
+import usb.backend.libusb1 as libusb1
 
 import psdb
+from psdb.util import usb_record
 from . import probe
+from . import instrument
 
 
 def usb_path(usb_dev):
@@ -10,6 +15,178 @@ def usb_path(usb_dev):
         usb_dev.bus, '.'.join('%u' % n for n in usb_dev.port_numbers))
 
 
+class AsyncTransfer:
+    '''
+    A single libusb bulk transfer that has been submitted to an AsyncEngine.
+    For IN transfers, the received data is available from AsyncEngine.wait().
+    '''
+    def __init__(self, engine, ep, buf, length, timeout):
+        self.buf      = buf
+        self.done     = False
+        self.is_in    = bool(ep & 0x80)
+        self.transfer = engine.lib.libusb_alloc_transfer(0)
+        if not self.transfer:
+            raise MemoryError('libusb_alloc_transfer failed')
+        self.key      = ctypes.addressof(self.transfer.contents)
+
+        t            = self.transfer.contents
+        t.dev_handle = engine.handle
+        t.endpoint   = ep
+        t.type       = libusb1._LIBUSB_TRANSFER_TYPE_BULK
+        t.timeout    = timeout
+        t.buffer     = ctypes.cast(buf, ctypes.c_void_p)
+        t.length     = length
+        t.callback   = engine._callback_fn
+
+    @property
+    def status(self):
+        return self.transfer.contents.status
+
+    @property
+    def actual_length(self):
+        return self.transfer.contents.actual_length
+
+
+class AsyncEngine:
+    '''
+    Submits libusb bulk transfers asynchronously so that several commands and
+    their data phases can be in flight at once instead of waiting out a full
+    USB round trip for each one.  Transfers on the same endpoint complete in
+    the order they were submitted.  Typical usage:
+
+        w = engine.submit_write(CMD_EP, cmd_data)
+        r = engine.submit_read(RSP_EP, rsp_len)
+        ...
+        engine.wait(w)
+        data = engine.wait(r)
+
+    This relies on the internals of pyusb's libusb1 backend, so it is only
+    available if the device was opened through that backend and those
+    internals look as expected; otherwise the constructor raises a
+    ProbeException and callers should fall back to the synchronous pyusb API.
+    Probes don't use the engine unless enable_async_transfers() is called.
+    '''
+    def __init__(self, usb_dev):
+        if isinstance(usb_dev, instrument.USBCounter):
+            usb_dev = usb_dev.usb_dev
+        if isinstance(usb_dev, (usb_record.RecordingDevice,
+                                usb_record.ReplayDevice)):
+            raise psdb.ProbeException('Asynchronous USB transfers are not '
+                                      'supported while recording or '
+                                      'replaying.')
+        try:
+            backend = usb_dev._ctx.backend
+            if not isinstance(backend, libusb1._LibUSB):
+                raise psdb.ProbeException('Asynchronous USB transfers '
+                                          'require the libusb1 backend.')
+
+            self.lib          = backend.lib
+            self.ctx          = backend.ctx
+            self.handle       = usb_dev._ctx.managed_open().handle
+            self._callback_fn = libusb1._libusb_transfer_cb_fn_p(
+                self._callback)
+        except AttributeError as e:
+            raise psdb.ProbeException('Unsupported pyusb version for '
+                                      'asynchronous USB transfers.') from e
+
+        self.usb_dev      = usb_dev
+        self.inflight     = {}
+        self.allocated    = {}
+        self.instr        = None
+
+        self.lib.libusb_cancel_transfer.argtypes = [libusb1._libusb_transfer_p]
+
+    def _callback(self, transfer_p):
+        xfer = self.inflight.pop(ctypes.addressof(transfer_p.contents), None)
+        if xfer is not None:
+            xfer.done = True
+
+    def _submit(self, ep, buf, length, timeout):
+        self.usb_dev._ctx.setup_request(self.usb_dev, ep)
+        xfer = AsyncTransfer(self, ep, buf, length, timeout)
+        self.allocated[xfer.key] = xfer
+        self.inflight[xfer.key]  = xfer
+        try:
+            libusb1._check(self.lib.libusb_submit_transfer(xfer.transfer))
+        except BaseException:
+            del self.inflight[xfer.key]
+            self._free(xfer)
+            raise
+        return xfer
+
+    def _free(self, xfer):
+        if xfer.transfer:
+            del self.allocated[xfer.key]
+            self.lib.libusb_free_transfer(xfer.transfer)
+            xfer.transfer = None
+
+    def submit_write(self, ep, data, timeout=1000):
+        '''Submits an OUT transfer of data on the specified endpoint.'''
+        buf = (ctypes.c_ubyte * len(data)).from_buffer_copy(data)
+        return self._submit(ep, buf, len(data), timeout)
+
+    def submit_read(self, ep, length, timeout=1000):
+        '''Submits an IN transfer of up to length bytes.'''
+        buf = (ctypes.c_ubyte * length)()
+        return self._submit(ep, buf, length, timeout)
+
+    # Runs libusb completion callbacks for any transfers that have finished.
+    def handle_events(self):
+        libusb1._check(self.lib.libusb_handle_events(self.ctx))
+
+    def cancel(self, xfer):
+        '''
+        Requests cancellation of a transfer.  Cancellation is asynchronous and
+        the transfer must still be collected with retire() or wait(); if it
+        had already completed then it is unaffected.
+        '''
+        if xfer.key in self.inflight:
+            self.lib.libusb_cancel_transfer(xfer.transfer)
+
+    def retire(self, xfer):
+        '''
+        Waits for the transfer to finish and frees it.  Returns a tuple of the
+        libusb transfer status and either the received data for IN transfers
+        or the number of bytes sent for OUT transfers.  Unlike wait(), this
+        doesn't raise if the transfer failed or was cancelled.
+        '''
+        while not xfer.done:
+            self.handle_events()
+
+        status = xfer.status
+        length = xfer.actual_length
+        self._free(xfer)
+        if self.instr is not None:
+            self.instr.count_xfer(length)
+        if xfer.is_in:
+            return status, bytes(memoryview(xfer.buf)[:length])
+        return status, length
+
+    def wait(self, xfer):
+        '''
+        Waits for the transfer to complete and frees it.  Returns the received
+        data for IN transfers and the number of bytes sent for OUT transfers.
+        Raises a usb.core.USBError if the transfer failed.
+        '''
+        status, v = self.retire(xfer)
+        if status != libusb1.LIBUSB_TRANSFER_COMPLETED:
+            raise usb.core.USBError(libusb1._str_transfer_error[status],
+                                    status, libusb1._transfer_errno[status])
+        return v
+
+    def cancel_all(self):
+        '''
+        Cancels all in-flight transfers, waits for libusb to retire them and
+        then frees every transfer that hasn't been collected by wait().
+        '''
+        for xfer in list(self.inflight.values()):
+            self.lib.libusb_cancel_transfer(xfer.transfer)
+        while self.inflight:
+            self.handle_events()
+        for xfer in list(self.allocated.values()):
+            self._free(xfer)
+
+
 class Enumeration(probe.Enumeration):
     def __init__(self, cls, usb_dev, *args, **kwargs):
         super().__init__(cls, *args, **kwargs)
@@ -44,7 +221,8 @@ class Enumeration(probe.Enumeration):
 class Probe(probe.Probe):  # pylint: disable=W0223
     def __init__(self, usb_dev, usb_reset=False, bConfigurationValue=None):
         super().__init__()
-        self.usb_dev = usb_dev
+        self.usb_dev      = usb_dev
+        self.async_engine = None
         try:
             self.serial_num = usb_dev.serial_number
         except ValueError as e:
@@ -62,9 +240,54 @@ class Probe(probe.Probe):  # pylint: disable=W0223
 
         self._set_configuration(bConfigurationValue)
 
+        if self.instr is not None:
+            self.enable_instrumentation(self.instr)
+
     def __str__(self):
         return '%s Debug Probe at %s' % (self.NAME, usb_path(self.usb_dev))
 
+    def enable_instrumentation(self, instr=None):
+        '''
+        Also wraps the USB device in a USBCounter so that every USB transfer
+        is attributed to the operation that issued it.
+        '''
+        instr = super().enable_instrumentation(instr)
+        if isinstance(self.usb_dev, instrument.USBCounter):
+            self.usb_dev.instr = instr
+        else:
+            self.usb_dev = instrument.USBCounter(self.usb_dev, instr)
+        if self.async_engine is not None:
+            self.async_engine.instr = instr
+        return instr
+
+    def disable_instrumentation(self):
+        super().disable_instrumentation()
+        if isinstance(self.usb_dev, instrument.USBCounter):
+            self.usb_dev = self.usb_dev.usb_dev
+        if self.async_engine is not None:
+            self.async_engine.instr = None
+
+    def enable_async_transfers(self):
+        '''
+        Creates an AsyncEngine for the probe if the USB backend supports it.
+        Probes that have a pipelined path use it whenever async_engine is set.
+        Returns True if asynchronous transfers are now enabled.
+        '''
+        if self.async_engine is None:
+            try:
+                self.async_engine = AsyncEngine(self.usb_dev)
+            except psdb.ProbeException:
+                pass
+            else:
+                self.async_engine.instr = self.instr
+        return self.async_engine is not None
+
+    def disable_async_transfers(self):
+        '''Reverts the probe to fully-synchronous USB transfers.'''
+        if self.async_engine is not None:
+            self.async_engine.cancel_all()
+            self.async_engine = None
+
     def _get_active_configuration(self):
         try:
             return self.usb_dev.get_active_configuration()
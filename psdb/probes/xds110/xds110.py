@@ -18,8 +18,27 @@ ENDPOINT_OUT = 0x02
 
 MAX_PACKET       = 1024
 MAX_DATA_BLOCK   = 4096
+MAX_RESULTS      = MAX_DATA_BLOCK // 4
 USB_PAYLOAD_SIZE = MAX_DATA_BLOCK + 60
 
+# Command names, for instrumentation.
+COMMAND_NAMES = {
+    0x03 : 'XDS_VERSION',
+    0x04 : 'XDS_SET_TCK_DELAY',
+    0x0E : 'XDS_SET_SRST',
+    0x0F : 'CMAPI_CONNECT',
+    0x10 : 'CMAPI_DISCONNECT',
+    0x11 : 'CMAPI_ACQUIRE',
+    0x12 : 'CMAPI_RELEASE',
+    0x15 : 'CMAPI_READ_DAP_REG',
+    0x16 : 'CMAPI_WRITE_DAP_REG',
+    0x17 : 'SWD_CONNECT',
+    0x18 : 'SWD_DISCONNECT',
+    0x3A : 'OCD_DAP_REQUEST',
+    0x3B : 'OCD_SCAN_REQUEST',
+    0x3C : 'OCD_PATHMOVE',
+}
+
 # Features supported by various versions of the XDS110 firmware.
 FEATURE_TCK_V2  = (1 << 0)
 FEATURE_TCK_V3  = (1 << 1)
@@ -105,6 +124,17 @@ class XDS110(usb_probe.Probe):
         assert self.write(cmd) == len(cmd)
 
     def execute(self, cmd, expected_len=None, allowed_errs=(0,)):
+        if self.instr is None:
+            return self._execute(cmd, expected_len, allowed_errs)
+
+        token = self.instr.begin()
+        try:
+            return self._execute(cmd, expected_len, allowed_errs)
+        finally:
+            self.instr.end(self.NAME,
+                           COMMAND_NAMES.get(cmd[0], '0x%02X' % cmd[0]), token)
+
+    def _execute(self, cmd, expected_len, allowed_errs):
         self.send_command(cmd)
         rsp, err = self.get_response(allowed_errs)
         if err == 0 and expected_len is not None and expected_len != len(rsp):
@@ -212,11 +242,19 @@ class XDS110(usb_probe.Probe):
     def _make_ap_write_request(self, v, reg):
         return pack('<BI', self._make_dap_cmd(((reg << 1) & 0x18) | 0x03), v)
 
-    def ocd_dap_request(self, reqs, result_count):
-        '''Handle block of DAP requests'''
+    def _ocd_dap_request_raw(self, reqs, result_count):
+        '''
+        Handle block of DAP requests, returning the raw little-endian result
+        words as a bytes object.
+        '''
         cmd = pack('<B', 0x3A) + reqs + b'\x00'
         rsp, _ = self.execute(cmd, result_count*4)
-        return unpack('I'*result_count, rsp)
+        return rsp
+
+    def ocd_dap_request(self, reqs, result_count):
+        '''Handle block of DAP requests'''
+        rsp = self._ocd_dap_request_raw(reqs, result_count)
+        return unpack('<%uI' % result_count, rsp)
 
     def ocd_scan_request(self, reqs, result_size):
         '''Handle block of JTAG scan requests'''
@@ -230,8 +268,10 @@ class XDS110(usb_probe.Probe):
         self.execute(cmd, 0)
 
     def _get_csw_base(self, ap_num):
-        csw_base = self.csw_bases.get(ap_num, self.read_ap_reg(ap_num, 0x00))
-        self.csw_bases[ap_num] = csw_base
+        csw_base = self.csw_bases.get(ap_num)
+        if csw_base is None:
+            csw_base = self.read_ap_reg(ap_num, 0x00)
+            self.csw_bases[ap_num] = csw_base
         return csw_base
 
     def _bulk_read_8(self, addr, n, ap_num=0):
@@ -247,12 +287,8 @@ class XDS110(usb_probe.Probe):
         reqs += self._make_ap_write_request(addr, 0x04)
         reqs += self._make_ap_read_request(0x0C)*n
         reqs += self._make_dp_read_request(0x0C)
-        results = self.ocd_dap_request(reqs, 1 + n)
-        mem = bytes(b'')
-        for v in results[1:]:
-            mem += b'%c' % ((v >> 8*(addr % 4)) & 0xFF)
-            addr += 1
-        return mem
+        rsp = self._ocd_dap_request_raw(reqs, 1 + n)
+        return bytes(rsp[4*(i + 1) + ((addr + i) % 4)] for i in range(n))
 
     def _bulk_read_16(self, addr, n, ap_num=0):
         '''
@@ -268,13 +304,12 @@ class XDS110(usb_probe.Probe):
         reqs += self._make_ap_write_request(addr, 0x04)
         reqs += self._make_ap_read_request(0x0C)*n
         reqs += self._make_dp_read_request(0x0C)
-        results = self.ocd_dap_request(reqs, 1 + n)
-        mem = bytes(b'')
-        for v in results[1:]:
-            mem += b'%c%c' % (((v >> (8*(addr % 4) + 0)) & 0xFF),
-                              ((v >> (8*(addr % 4) + 8)) & 0xFF))
-            addr += 2
-        return mem
+        rsp = self._ocd_dap_request_raw(reqs, 1 + n)
+        mem = bytearray(n*2)
+        for i in range(n):
+            pos            = 4*(i + 1) + ((addr + i*2) % 4)
+            mem[i*2:i*2+2] = rsp[pos:pos + 2]
+        return bytes(mem)
 
     def _bulk_read_32(self, addr, n, ap_num=0):
         '''
@@ -283,21 +318,65 @@ class XDS110(usb_probe.Probe):
         assert addr % 4 == 0
         assert n > 0
         assert (addr & 0xFFFFFC00) == ((addr + n*4 - 1) & 0xFFFFFC00)
+        mem = bytearray(n*4)
+        self._read_32_stream_into(memoryview(mem), addr, ap_num)
+        return bytes(mem)
+
+    def _read_32_stream_into(self, mv, addr, ap_num):
+        '''
+        Reads len(mv)/4 aligned 32-bit values into the byte memoryview mv; the
+        range may span any number of 1K TAR pages.  Each DAP request block
+        covers as many pages as will fit in the firmware's result buffer; TAR
+        is rewritten in-stream at every page crossing.  Each page segment is
+        terminated by an RDBUFF read so that its posted results are
+        self-contained, which means the first result of each segment is stale
+        and is skipped.  Results are copied straight out of the raw response
+        into mv without being decoded.
+        '''
+        assert addr % 4 == 0
 
         csw_base = self._get_csw_base(ap_num)
-        reqs  = self._make_dp_write_request((ap_num << 24), 0x08)
-        reqs += self._make_ap_write_request((csw_base & ~0x37) | 0x12, 0x00)
-        reqs += self._make_ap_write_request(addr, 0x04)
-        reqs += self._make_ap_read_request(0x0C)*n
-        reqs += self._make_dp_read_request(0x0C)
-        results = self.ocd_dap_request(reqs, 1 + n)
-        r = bytes(b'')
-        for v in results[1:]:
-            r += b'%c%c%c%c' % (((v >>  0) & 0xFF),
-                                ((v >>  8) & 0xFF),
-                                ((v >> 16) & 0xFF),
-                                ((v >> 24) & 0xFF))
-        return r
+        hdr      = (self._make_dp_write_request((ap_num << 24), 0x08) +
+                    self._make_ap_write_request((csw_base & ~0x37) | 0x12,
+                                                0x00))
+        drw_read = self._make_ap_read_request(0x0C)
+        rdbuff   = self._make_dp_read_request(0x0C)
+        n        = len(mv) // 4
+        pos      = 0
+        while n:
+            reqs     = hdr
+            segs     = []
+            nresults = 0
+            while n and nresults + 2 <= MAX_RESULTS:
+                count = min(n, (0x400 - (addr & 0x3FF)) // 4,
+                            MAX_RESULTS - nresults - 1)
+                reqs += self._make_ap_write_request(addr, 0x04)
+                reqs += drw_read*count
+                reqs += rdbuff
+                segs.append((nresults + 1, count))
+                nresults += 1 + count
+                addr     += count*4
+                n        -= count
+
+            rsp = self._ocd_dap_request_raw(reqs, nresults)
+            for i, count in segs:
+                mv[pos:pos + count*4] = rsp[i*4:(i + count)*4]
+                pos += count*4
+
+    def _bulk_read_segments_into(self, mv, segs, ap_num=0):
+        '''
+        Unaligned head and tail bytes are read using 8-bit accesses and all of
+        the 32-bit segments in between are streamed using multi-page DAP
+        request blocks.
+        '''
+        words = [seg for seg in segs if seg[3] == 4]
+        for offset, addr, n, word_size in segs:
+            if word_size == 1:
+                mv[offset:offset + n] = self._bulk_read_8(addr, n, ap_num)
+        if words:
+            start = words[0][0]
+            end   = words[-1][0] + words[-1][2]*4
+            self._read_32_stream_into(mv[start:end], words[0][1], ap_num)
 
     def _bulk_write_8(self, data, addr, ap_num=0):
         assert data
@@ -335,16 +414,148 @@ class XDS110(usb_probe.Probe):
         assert len(data) % 4 == 0
         assert data
         assert (addr & 0xFFFFFC00) == ((addr + len(data) - 1) & 0xFFFFFC00)
+        self._write_32_stream(data, addr, ap_num)
 
-        csw_base = self._get_csw_base(ap_num)
-        reqs  = self._make_dp_write_request((ap_num << 24), 0x08)
-        reqs += self._make_ap_write_request((csw_base & ~0x37) | 0x12, 0x00)
-        reqs += self._make_ap_write_request(addr, 0x04)
-        for i in range(len(data)//4):
-            v     = unpack_from('<I', data, offset=i*4)[0]
-            reqs += self._make_ap_write_request(v, 0x0C)
-        reqs += self._make_dp_write_request((ap_num << 24), 0x08)
-        self.ocd_dap_request(reqs, 0)
+    def _write_32_stream(self, data, addr, ap_num):
+        '''
+        Writes aligned 32-bit values which may span any number of 1K TAR
+        pages.  Each DAP request block is filled up to the firmware's command
+        buffer size and TAR is rewritten in-stream at every page crossing.
+        The DRW write requests are built by interleaving the request opcode
+        with the data bytes using strided slice assignment rather than packing
+        each word individually.
+        '''
+        assert addr % 4 == 0
+        assert len(data) % 4 == 0
+
+        csw_base  = self._get_csw_base(ap_num)
+        select    = self._make_dp_write_request((ap_num << 24), 0x08)
+        hdr       = select + self._make_ap_write_request(
+                        (csw_base & ~0x37) | 0x12, 0x00)
+        drw_write = self._make_ap_write_request(0, 0x0C)[:1]
+        mv        = memoryview(data).cast('B')
+        while mv:
+            reqs = bytearray(hdr)
+            while mv and len(reqs) + 4*5 <= MAX_DATA_BLOCK:
+                count = min(len(mv) // 4, (0x400 - (addr & 0x3FF)) // 4,
+                            (MAX_DATA_BLOCK - len(reqs) - 2*5) // 5)
+                reqs += self._make_ap_write_request(addr, 0x04)
+
+                seg         = bytearray(count*5)
+                seg[0::5]   = drw_write*count
+                for k in range(4):
+                    seg[k+1::5] = mv[k:count*4:4]
+                reqs += seg
+
+                addr += count*4
+                mv    = mv[count*4:]
+
+            reqs += select
+            self.ocd_dap_request(bytes(reqs), 0)
+
+    def write_bulk(self, data, addr, ap_num=0):
+        '''
+        Do a bulk write operation to the specified address.  Unaligned head
+        and tail bytes are written using 8-bit accesses and everything in
+        between is streamed using multi-page DAP request blocks.
+        '''
+        if not data:
+            return
+
+        mv = memoryview(data).cast('B')
+
+        # Align us to a 32-bit boundary.
+        count = min(len(mv), -addr & 3)
+        if count:
+            self._bulk_write_8(mv[:count], addr, ap_num)
+            addr += count
+            mv    = mv[count:]
+
+        # Stream all the words.
+        count = len(mv) // 4
+        if count:
+            self._write_32_stream(mv[:count*4], addr, ap_num)
+            addr += count * 4
+            mv    = mv[count * 4:]
+
+        # Do any remaining bytes.
+        if mv:
+            self._bulk_write_8(mv, addr, ap_num)
+
+    def _exec_dap_cmds(self, reqs, nresults, read_cmds, ends_with_write):
+        '''
+        Sends a DAP request block built by exec_cmd_list() and returns the
+        values for the read commands it contains.  Each read was encoded as
+        a DRW read followed by an RDBUFF read, so the value we want is the
+        second result of each pair.
+        '''
+        if not reqs:
+            return []
+        if ends_with_write:
+            reqs += self._make_dp_read_request(0x0C)
+            nresults += 1
+
+        results = self.ocd_dap_request(reqs, nresults)
+        vals    = []
+        for i, cmd in enumerate(read_cmds):
+            v     = results[2*i + 1] >> (8*(cmd.addr % 4))
+            vals.append(v & ((1 << (8*cmd.size)) - 1))
+        return vals
+
+    def exec_cmd_list(self, cmd_list):
+        '''
+        Executes a list of ReadCommand and WriteCommand objects by encoding
+        them into as few DAP request blocks as the firmware's buffer allows.
+        SELECT and CSW are only rewritten when the AP or access size changes;
+        TAR is written before every access.
+
+        Returns the list of values from the ReadCommands.
+        '''
+        read_vals = []
+        reqs      = b''
+        nresults  = 0
+        read_cmds = []
+        is_write  = False
+        ap_num    = None
+        csw       = None
+        for cmd in cmd_list:
+            is_read = isinstance(cmd, psdb.devices.ReadCommand)
+            if not is_read and not isinstance(cmd, psdb.devices.WriteCommand):
+                raise Exception('Unrecognized command: %s' % cmd)
+            assert cmd.ap.db == self
+            assert cmd.size in (1, 2, 4)
+            assert cmd.addr % cmd.size == 0
+
+            if (len(reqs) + 32 > MAX_DATA_BLOCK or
+                    (nresults + 3) * 4 > MAX_DATA_BLOCK):
+                read_vals += self._exec_dap_cmds(reqs, nresults, read_cmds,
+                                                 is_write)
+                reqs, nresults, read_cmds = b'', 0, []
+                ap_num, csw               = None, None
+
+            if cmd.ap.ap_num != ap_num:
+                ap_num = cmd.ap.ap_num
+                csw    = None
+                reqs  += self._make_dp_write_request((ap_num << 24), 0x08)
+
+            v = (self._get_csw_base(ap_num) & ~0x37) | (cmd.size // 2)
+            if v != csw:
+                csw   = v
+                reqs += self._make_ap_write_request(csw, 0x00)
+
+            reqs += self._make_ap_write_request(cmd.addr, 0x04)
+            if is_read:
+                reqs     += self._make_ap_read_request(0x0C)
+                reqs     += self._make_dp_read_request(0x0C)
+                nresults += 2
+                read_cmds.append(cmd)
+            else:
+                reqs += self._make_ap_write_request(
+                        cmd.value << (8*(cmd.addr % 4)), 0x0C)
+            is_write = not is_read
+
+        read_vals += self._exec_dap_cmds(reqs, nresults, read_cmds, is_write)
+        return read_vals
 
     def assert_srst(self):
         '''Holds the target in reset.'''
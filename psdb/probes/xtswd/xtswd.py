@@ -1,7 +1,11 @@
 # Copyright (c) 2022 Phase Advanced Sensor Systems, Inc.
 from enum import IntEnum
+import collections
+import os
 import random
+import usb.core
 import usb.util
+import usb.backend.libusb1 as libusb1
 
 import btype
 import numpy as np
@@ -13,6 +17,10 @@ from ...util import pusb
 
 TRACE_EN   = False
 
+# Set this environment variable to have XTSWD probes use the AsyncEngine for
+# pipelined transfers by default.
+ENV_ASYNC  = 'PSDB_XTSWD_ASYNC'
+
 
 # Approximate ADC-to-mA ratio for prototype board.
 MA_RATIO = 11.047
@@ -73,6 +81,20 @@ class Opcode(IntEnum):
     BAD_OPCODE  = 0xCCCC
 
 
+READ_OPCODES = {
+    1 : Opcode.READ8,
+    2 : Opcode.READ16,
+    4 : Opcode.READ32,
+}
+
+
+WRITE_OPCODES = {
+    1 : Opcode.WRITE8,
+    2 : Opcode.WRITE16,
+    4 : Opcode.WRITE32,
+}
+
+
 class Command(btype.Struct):
     opcode         = btype.uint16_t()
     tag            = btype.uint16_t()
@@ -129,18 +151,252 @@ class XTSWDCommandException(psdb.ProbeException):
         self.rx_data = rx_data
 
 
+class XTSWDPipelineAbortedException(psdb.ProbeException):
+    def __init__(self, cmd):
+        super().__init__(
+            'Command %s (tag 0x%04X) cancelled by an earlier pipeline error.'
+            % (Opcode(cmd.opcode).name, cmd.tag))
+        self.cmd = cmd
+
+
+class PipelinedCommand:
+    '''
+    A command posted to a Pipeline.  Once the pipeline has retired it,
+    result() returns the (rsp, rx_data) tuple for the command or raises the
+    exception that this particular command failed with.
+    '''
+    def __init__(self, tag, opcode, rx_len):
+        self.tag       = tag
+        self.opcode    = opcode
+        self.rx_len    = rx_len
+        self.done      = False
+        self.rsp       = None
+        self.rx_data   = None
+        self.exception = None
+        self.w         = None
+        self.r         = None
+        self.token     = None
+
+    def _complete(self, rsp, rx_data):
+        self.rsp     = rsp
+        self.rx_data = rx_data
+        self.done    = True
+
+    def _fail(self, e):
+        self.exception = e
+        self.done      = True
+
+    def result(self):
+        assert self.done
+        if self.exception is not None:
+            raise self.exception
+        return self.rsp, self.rx_data
+
+
+class Pipeline:
+    '''
+    Posts XTSWD commands back-to-back on CMD_EP, keeping up to depth commands
+    in flight, and matches the responses arriving on RSP_EP to their commands
+    by tag.  Typical usage:
+
+        with probe.pipeline() as pl:
+            c0 = pl.submit(Opcode.WRITE32, [ap_num, addr, v])
+            c1 = pl.submit(Opcode.READ32, [ap_num, addr])
+        rsp, _ = c1.result()
+
+    When the context exits, all outstanding commands are retired and the
+    first command error, if any, is raised.  Each command records its own
+    result or exception.
+
+    When a command fails, the commands posted behind it that haven't reached
+    the probe yet are pulled back and an abort is sent so that the probe
+    stops waiting for the data phase of any partially-delivered command.
+    Commands that the probe did receive still complete and report their own
+    status; everything else fails with XTSWDPipelineAbortedException, as do
+    any commands submitted after the failure.
+
+    If the probe has no async engine then commands are executed as they are
+    submitted, with the same error semantics.
+    '''
+    def __init__(self, probe, depth, timeout):
+        self.probe   = probe
+        self.depth   = depth
+        self.timeout = timeout
+        self.pending = collections.OrderedDict()
+        self.error   = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _type, value, traceback):
+        if _type is None:
+            self.flush()
+        elif self.pending:
+            self._abort()
+            self._drain()
+
+    def _set_error(self, e):
+        if self.error is None:
+            self.error = e
+            if self.probe.async_engine is not None:
+                self._abort()
+
+    def submit(self, opcode, params=None, bulk_data=b'', rx_len=0):
+        '''Posts a command and returns its PipelinedCommand.'''
+        engine = self.probe.async_engine
+        if engine is not None:
+            while len(self.pending) >= self.depth:
+                self._retire()
+
+        tag, data = self.probe._make_command(opcode, params)
+        cmd       = PipelinedCommand(tag, opcode, rx_len)
+        if self.error is not None:
+            cmd._fail(XTSWDPipelineAbortedException(cmd))
+            return cmd
+
+        if engine is None:
+            try:
+                cmd._complete(*self.probe._exec_packed(
+                    opcode, tag, data, bulk_data, self.timeout, rx_len))
+            except XTSWDCommandException as e:
+                cmd._fail(e)
+                self._set_error(e)
+            return cmd
+
+        if self.probe.instr is not None:
+            cmd.token = self.probe.instr.begin()
+        try:
+            cmd.w = engine.submit_write(self.probe.CMD_EP, data + bulk_data,
+                                        timeout=self.timeout)
+            cmd.r = engine.submit_read(self.probe.RSP_EP,
+                                       Response._STRUCT.size + rx_len,
+                                       timeout=self.timeout)
+        except usb.core.USBError as e:
+            self._resync(e)
+            raise
+        self.pending[tag] = cmd
+        return cmd
+
+    def _retire(self):
+        '''
+        Collects the next response from RSP_EP and completes the command with
+        the matching tag.  The probe executes commands in order, so this is
+        always the oldest outstanding command.
+        '''
+        engine = self.probe.async_engine
+        oldest = next(iter(self.pending.values()))
+        try:
+            engine.retire(oldest.w)
+            data = engine.wait(oldest.r)
+        except usb.core.USBError as e:
+            self._resync(e)
+            raise
+
+        rsp = Response.unpack(data[-Response._STRUCT.size:])
+        cmd = self.pending.pop(rsp.tag, None)
+        if cmd is not oldest:
+            e = psdb.ProbeException('XTSWD response tag 0x%04X out of order.'
+                                    % rsp.tag)
+            self._resync(e)
+            raise e
+
+        if cmd.token is not None:
+            self.probe.instr.end(self.probe.NAME, Opcode(cmd.opcode).name,
+                                 cmd.token, tid=1)
+        try:
+            cmd._complete(*self.probe._decode_response(data, cmd.tag,
+                                                       cmd.rx_len))
+        except XTSWDCommandException as e:
+            cmd._fail(e)
+            self._set_error(e)
+
+    def _abort(self):
+        '''
+        Cancels every posted command that hasn't fully reached the probe and,
+        if one of them only got part of its data phase out, sends an abort so
+        that the probe stops waiting for the rest of it.  Cancellation is
+        done newest-first so that a later command can't slip out ahead of an
+        earlier one that was pulled back.
+        '''
+        engine = self.probe.async_engine
+        for cmd in reversed(self.pending.values()):
+            engine.cancel(cmd.w)
+
+        partial = False
+        for tag, cmd in list(self.pending.items()):
+            while not cmd.w.done:
+                engine.handle_events()
+            if cmd.w.status == libusb1.LIBUSB_TRANSFER_COMPLETED:
+                continue
+            if cmd.w.actual_length:
+                partial = True
+                continue
+
+            engine.retire(cmd.w)
+            engine.cancel(cmd.r)
+            engine.retire(cmd.r)
+            del self.pending[tag]
+            cmd._fail(XTSWDPipelineAbortedException(cmd))
+
+        if partial:
+            self.probe._send_abort()
+
+    def _drain(self):
+        while self.pending:
+            try:
+                self._retire()
+            except (usb.core.USBError, psdb.ProbeException):
+                break
+
+    def _resync(self, e):
+        '''
+        Recovers from a USB-level failure by cancelling all outstanding
+        transfers, failing their commands and resynchronizing with the probe.
+        '''
+        self.probe.async_engine.cancel_all()
+        for cmd in self.pending.values():
+            cmd._fail(e)
+        self.pending.clear()
+        if self.error is None:
+            self.error = e
+        self.probe.njunk_bytes = self.probe._synchronize()
+
+    def flush(self):
+        '''
+        Retires all outstanding commands and raises the first command error
+        that occurred in the pipeline, if any.
+        '''
+        while self.pending:
+            self._retire()
+        if self.error is not None:
+            raise self.error
+
+
 class XTSWD(usb_probe.Probe):
     NAME    = 'XTSWD'
     RSP_EP  = 0x81
     CMD_EP  = 0x02
     IMON_EP = 0x83
 
-    def __init__(self, usb_dev, **kwargs):
+    # Default number of commands kept in flight by a Pipeline.
+    PIPELINE_DEPTH = 4
+
+    def __init__(self, usb_dev, async_transfers=None, **kwargs):
+        '''
+        Transfers are fully synchronous unless async_transfers is True or, if
+        it is None, the PSDB_XTSWD_ASYNC environment variable is set; they
+        can also be switched later with enable_async_transfers() and
+        disable_async_transfers().
+        '''
         super().__init__(usb_dev, bConfigurationValue=0x30, **kwargs)
         self.tag         = random.randint(0, 65535)
         self.imon_tag    = None
         self.git_sha1    = usb.util.get_string(usb_dev, 6)
         self.njunk_bytes = self._synchronize()
+        if async_transfers is None:
+            async_transfers = bool(os.environ.get(ENV_ASYNC))
+        if async_transfers:
+            self.enable_async_transfers()
 
         # Stop current monitoring in case it had been started previously.
         self.stop_current_monitoring()
@@ -186,22 +442,18 @@ class XTSWD(usb_probe.Probe):
         self.tag = (self.tag + 1) & 0xFFFF
         return tag
 
-    def _exec_command(self, opcode, params=None, bulk_data=b'', timeout=1000,
-                      rx_len=0):
+    def _make_command(self, opcode, params=None):
         if not params:
             params = [0, 0, 0, 0, 0, 0, 0]
         elif len(params) < 7:
             params = params + [0]*(7 - len(params))
 
-        tag  = self._alloc_tag()
-        cmd  = Command(opcode=opcode, tag=tag, params=params)
-        data = cmd.pack()
-        size = self.usb_dev.write(self.CMD_EP, data + bulk_data,
-                                  timeout=timeout)
-        assert size == len(data) + len(bulk_data)
+        tag = self._alloc_tag()
+        cmd = Command(opcode=opcode, tag=tag, params=params)
+        return tag, cmd.pack()
 
-        data = self.usb_dev.read(self.RSP_EP, Response._STRUCT.size + rx_len,
-                                 timeout=timeout)
+    @staticmethod
+    def _decode_response(data, tag, rx_len):
         assert len(data) >= Response._STRUCT.size
 
         rsp = Response.unpack(
@@ -216,6 +468,38 @@ class XTSWD(usb_probe.Probe):
         assert len(rx_data) == rx_len
         return rsp, rx_data
 
+    def _exec_packed(self, opcode, tag, data, bulk_data, timeout, rx_len):
+        if self.instr is None:
+            return self._exec_phases(tag, data, bulk_data, timeout, rx_len)
+
+        token = self.instr.begin()
+        try:
+            return self._exec_phases(tag, data, bulk_data, timeout, rx_len)
+        finally:
+            self.instr.end(self.NAME, Opcode(opcode).name, token)
+
+    def _exec_phases(self, tag, data, bulk_data, timeout, rx_len):
+        size = self.usb_dev.write(self.CMD_EP, data + bulk_data,
+                                  timeout=timeout)
+        assert size == len(data) + len(bulk_data)
+
+        data = self.usb_dev.read(self.RSP_EP, Response._STRUCT.size + rx_len,
+                                 timeout=timeout)
+        return self._decode_response(data, tag, rx_len)
+
+    def _exec_command(self, opcode, params=None, bulk_data=b'', timeout=1000,
+                      rx_len=0):
+        tag, data = self._make_command(opcode, params)
+        return self._exec_packed(opcode, tag, data, bulk_data, timeout,
+                                 rx_len)
+
+    def pipeline(self, depth=None, timeout=1000):
+        '''
+        Returns a Pipeline context manager for posting several commands
+        without waiting for each response.
+        '''
+        return Pipeline(self, depth or self.PIPELINE_DEPTH, timeout)
+
     def _bulk_read(self, addr, n, word_size, ap_num=0):
         trace('BULK READ%u: 0x%08X len %u' % (word_size, addr, n*word_size))
         _, data = self._exec_command(Opcode.BULK_READ,
@@ -248,6 +532,57 @@ class XTSWD(usb_probe.Probe):
     def _bulk_write_32(self, data, addr, ap_num=0):
         self._bulk_write(data, addr, 4, ap_num=ap_num)
 
+    def _bulk_read_segments_into(self, mv, segs, ap_num=0):
+        if self.async_engine is None or len(segs) < 2:
+            super()._bulk_read_segments_into(mv, segs, ap_num=ap_num)
+            return
+
+        trace('PIPELINED READ: %u segments' % len(segs))
+        with self.pipeline() as pl:
+            cmds = [(offset, pl.submit(Opcode.BULK_READ,
+                                       [ap_num, addr, n, word_size],
+                                       rx_len=n*word_size))
+                    for offset, addr, n, word_size in segs]
+        for offset, cmd in cmds:
+            mv[offset:offset + cmd.rx_len] = cmd.rx_data
+
+    def _bulk_write_segments(self, mv, segs, ap_num=0):
+        if self.async_engine is None or len(segs) < 2:
+            super()._bulk_write_segments(mv, segs, ap_num=ap_num)
+            return
+
+        trace('PIPELINED WRITE: %u segments' % len(segs))
+        with self.pipeline() as pl:
+            for offset, addr, n, word_size in segs:
+                pl.submit(Opcode.BULK_WRITE, [ap_num, addr, n, word_size],
+                          bulk_data=mv[offset:offset + n*word_size])
+
+    def exec_cmd_list(self, cmd_list):
+        '''
+        Executes the ReadCommand and WriteCommand list through a Pipeline so
+        that register writes and polls go out back-to-back.
+        '''
+        reads = []
+        with self.pipeline() as pl:
+            for cmd in cmd_list:
+                assert cmd.ap.db == self
+                if isinstance(cmd, psdb.devices.ReadCommand):
+                    opcode = READ_OPCODES.get(cmd.size)
+                    params = [cmd.ap.ap_num, cmd.addr]
+                elif isinstance(cmd, psdb.devices.WriteCommand):
+                    opcode = WRITE_OPCODES.get(cmd.size)
+                    params = [cmd.ap.ap_num, cmd.addr, cmd.value]
+                else:
+                    raise Exception('Unrecognized command: %s' % cmd)
+                if opcode is None:
+                    raise Exception('Illegal size %u in cmd list.' % cmd.size)
+
+                pc = pl.submit(opcode, params)
+                if isinstance(cmd, psdb.devices.ReadCommand):
+                    reads.append(pc)
+
+        return [pc.rsp.params[0] for pc in reads]
+
     def assert_srst(self):
         self._exec_command(Opcode.SET_SRST, [1])
 
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import argparse
+import random
+import time
+
+import psdb.probes.sim
+
+
+def timed(f, *args, **kwargs):
+    t0 = time.perf_counter()
+    f(*args, **kwargs)
+    return time.perf_counter() - t0
+
+
+def bench_read_bulk(target, rv):
+    sram = target.ram_devs['SRAM1']
+    size = min(rv.size, sram.size)
+    dt   = sum(timed(sram.ap.read_bulk, sram.dev_base, size)
+               for _ in range(rv.iterations))
+    return size * rv.iterations / dt
+
+
+def bench_write_bulk(target, rv):
+    sram = target.ram_devs['SRAM1']
+    data = random.randbytes(min(rv.size, sram.size))
+    dt   = sum(timed(sram.ap.write_bulk, data, sram.dev_base)
+               for _ in range(rv.iterations))
+    return len(data) * rv.iterations / dt
+
+
+def bench_registers(target, rv):
+    ap   = target.ahb_ap
+    addr = 0xE0042004
+    t0   = time.perf_counter()
+    for _ in range(rv.reg_iterations):
+        ap.write_32(ap.read_32(addr), addr)
+    dt = time.perf_counter() - t0
+    return 8 * rv.reg_iterations / dt
+
+
+def bench_burn_dv(target, rv):
+    flash = target.flash
+    data  = random.randbytes(min(rv.size, flash.flash_size))
+    dt    = timed(flash.burn_dv, [(flash.mem_base, data)], verbose=False)
+    return len(data) / dt
+
+
+def bench_burn_loader(target, rv):
+    flash = target.flash
+    data  = random.randbytes(min(rv.size, flash.flash_size))
+    dt    = timed(flash.burn_dv, [(flash.mem_base, data)], verbose=False,
+                  loader=True)
+    return len(data) / dt
+
+
+BENCHMARKS = [('read_bulk',   bench_read_bulk),
+              ('write_bulk',  bench_write_bulk),
+              ('registers',   bench_registers),
+              ('burn_dv',     bench_burn_dv),
+              ('burn_loader', bench_burn_loader),
+              ]
+
+
+def main(rv):
+    print('%12s %12s' % ('Latency us', 'Bandwidth') +
+          ''.join(' %12s' % name for name, _ in BENCHMARKS) + '  (KiB/s)')
+    for latency in rv.latency:
+        probe  = psdb.probes.sim.SimProbe(latency=latency * 1e-6,
+                                          bandwidth=rv.bandwidth,
+                                          flash_kb=rv.flash_kb)
+        target = probe.probe()
+        rates  = [f(target, rv) for _, f in BENCHMARKS]
+        print('%12.1f %12s' % (latency, rv.bandwidth or '-') +
+              ''.join(' %12.1f' % (r / 1024) for r in rates))
+
+
+def _main():
+    parser = argparse.ArgumentParser(
+        description='Benchmarks psdb against a simulated probe and target.')
+    parser.add_argument('--latency', type=float, nargs='+',
+                        default=[0, 50, 125],
+                        help='Per-transaction latencies to test, in us.')
+    parser.add_argument('--bandwidth', type=float,
+                        help='Probe payload bandwidth in bytes/second.')
+    parser.add_argument('--size', type=int, default=32768)
+    parser.add_argument('--iterations', type=int, default=8)
+    parser.add_argument('--reg-iterations', type=int, default=1000)
+    parser.add_argument('--flash-kb', type=int, default=256)
+    rv = parser.parse_args()
+
+    main(rv)
+
+
+if __name__ == '__main__':
+    _main()
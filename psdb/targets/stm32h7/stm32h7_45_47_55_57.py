@@ -1,4 +1,5 @@
 # Copyright (c) 2019 Phase Advanced Sensor Systems, Inc.
+import struct
 import time
 
 import psdb
@@ -166,19 +167,20 @@ class STM32H7_45_47_55_57(Target):
         # Specifically, we need to ensure that DIER.CC1DE is cleared BEFORE we
         # enable the DMA engine.
         rcc.enable_device('TIM17')
-        tim17._CR1     = 0x00000000
-        tim17._CCER    = 0x00000000
-        tim17._DIER    = 0
-        tim17._CCMR1_I = 0
-        tim17._TISEL   = 2
-        tim17._CCMR1_I = 0x0000000D
-        tim17._ARR     = 0xFFFF
-        tim17._CNT     = 0
-        tim17._PSC     = 0
-        tim17._SR      = 0
-
-        # DMAMUX1 is always enabled; set channel 0 to be TIM17_CH1.
-        dmamux1._C0CR = 111
+        with self.db.transaction():
+            tim17._CR1     = 0x00000000
+            tim17._CCER    = 0x00000000
+            tim17._DIER    = 0
+            tim17._CCMR1_I = 0
+            tim17._TISEL   = 2
+            tim17._CCMR1_I = 0x0000000D
+            tim17._ARR     = 0xFFFF
+            tim17._CNT     = 0
+            tim17._PSC     = 0
+            tim17._SR      = 0
+
+            # DMAMUX1 is always enabled; set channel 0 to be TIM17_CH1.
+            dmamux1._C0CR = 111
 
         # Configure DMA1 to transfer 16 bits nsamples times from TIM17_CH1,
         # incrementing after each transfer.
@@ -186,27 +188,28 @@ class STM32H7_45_47_55_57(Target):
         dma1._S0CR = 0x00000000
         while dma1._S0CR.read() & 1:
             pass
-        dma1._LIFCR  = 0x0000003D
-        dma1._S0CR   = 0x00002C00
-        dma1._S0NDTR = nsamples
-        dma1._S0PAR  = tim17._CCR1.addr
-        dma1._S0M0AR = sram1.dev_base
-        dma1._S0M1AR = 0x00000000
-        dma1._S0FCR  = 0x00000000
-        dma1._S0CR   = 0x00002C01
-
-        # Finally, arm TIM17 to start capturing HSE/63 pulses.
-        tim17._DIER  = 0x00000200
-        tim17._CR1   = 0x00000001
-        tim17._CCER  = 0x00000001
+        with self.db.transaction():
+            dma1._LIFCR  = 0x0000003D
+            dma1._S0CR   = 0x00002C00
+            dma1._S0NDTR = nsamples
+            dma1._S0PAR  = tim17._CCR1.addr
+            dma1._S0M0AR = sram1.dev_base
+            dma1._S0M1AR = 0x00000000
+            dma1._S0FCR  = 0x00000000
+            dma1._S0CR   = 0x00002C01
+
+            # Finally, arm TIM17 to start capturing HSE/63 pulses.
+            tim17._DIER  = 0x00000200
+            tim17._CR1   = 0x00000001
+            tim17._CCER  = 0x00000001
 
         # Wait for the DMA transfer to complete.
         while (dma1._LISR.read() & (1 << 5)) == 0:
             time.sleep(0.01)
 
         # Load each of the counter captures and sum their deltas.
-        caps  = [sram1.ap.read_16(sram1.dev_base + i*2)
-                 for i in range(nsamples)]
+        caps  = struct.unpack('<%uH' % nsamples,
+                              sram1.ap.read_bulk(sram1.dev_base, nsamples*2))
         ticks = 0
         for i in range(1, nsamples):
             ticks += ((caps[i] - caps[i-1]) & 0xFFFF)
@@ -4,6 +4,8 @@ import usb.core
 import usb.backend.libusb1
 import libusb_package_tng
 
+from . import usb_record
+
 
 LIBUSB_BACKEND = None
 
@@ -19,7 +21,13 @@ def get_backend():
 
 
 def find(**kwargs):
-    return list(usb.core.find(**kwargs, backend=get_backend()))
+    if usb_record.REPLAYER:
+        return list(usb_record.REPLAYER.find(**kwargs))
+
+    devs = list(usb.core.find(**kwargs, backend=get_backend()))
+    if usb_record.RECORDER:
+        devs = [usb_record.RECORDER.wrap(d) for d in devs]
+    return devs
 
 
 __all__ = ['find',
@@ -0,0 +1,450 @@
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import atexit
+import struct
+import array
+import json
+import time
+import os
+
+import usb.core
+
+import psdb
+
+
+# Setting PSDB_USB_RECORD to a file path records every USB transfer made to
+# the probes found by pusb.find() into that file.  Setting PSDB_USB_REPLAY to a
+# previously-recorded file makes pusb.find() return replay devices that serve
+# the recorded responses instead of talking to real hardware, so a tool
+# session can be rerun deterministically without a probe or target attached.
+ENV_RECORD = 'PSDB_USB_RECORD'
+ENV_REPLAY = 'PSDB_USB_REPLAY'
+
+MAGIC = b'PSDBUSB1'
+
+# Record header: type, device index, endpoint, value, start time relative to
+# the start of the recording, duration and payload length.  The value field
+# holds the return value of write() and ctrl_transfer() and the requested
+# length of read().
+RECORD    = struct.Struct('<BBBidfI')
+REC_DEV   = 0
+REC_WRITE = 1
+REC_READ  = 2
+REC_CTRL  = 3
+REC_ERROR = 4
+
+# Control transfer setup: bmRequestType, bRequest, wValue, wIndex, wLength.
+# The payload that follows holds the OUT data or the IN response.
+CTRL_SETUP = struct.Struct('<BBHHH')
+
+REC_NAMES = {
+    REC_DEV   : 'device',
+    REC_WRITE : 'write',
+    REC_READ  : 'read',
+    REC_CTRL  : 'ctrl_transfer',
+    REC_ERROR : 'error',
+}
+
+# Device attributes captured when a device is first recorded so that the
+# replay device can be enumerated and matched exactly like the real one.
+DEV_ATTRS = ['idVendor',
+             'idProduct',
+             'bcdDevice',
+             'bDeviceClass',
+             'bDeviceSubClass',
+             'bDeviceProtocol',
+             'bus',
+             'address',
+             'port_numbers',
+             ]
+DEV_STRINGS = ['manufacturer',
+               'product',
+               'serial_number',
+               ]
+
+RECORDER = None
+REPLAYER = None
+
+
+class ReplayMismatchException(psdb.ProbeException):
+    pass
+
+
+def _to_bytes(data):
+    if isinstance(data, str):
+        return data.encode()
+    return bytes(memoryview(data).cast('B'))
+
+
+class Recorder:
+    '''
+    Writes a compact binary log of USB transfers.  The file starts with MAGIC
+    and is followed by a sequence of RECORD headers, each followed by its
+    payload.  Devices are described by REC_DEV records holding a JSON
+    dictionary of their descriptor attributes; the transfers that follow
+    refer to the device by its index.
+    '''
+    def __init__(self, path):
+        self.path    = path
+        self.f       = open(path, 'wb')
+        self.t0      = time.perf_counter()
+        self.devices = {}
+        self.f.write(MAGIC)
+        atexit.register(self.close)
+
+    def close(self):
+        if not self.f.closed:
+            self.f.close()
+
+    def _write(self, rtype, dev_index, ep, value, t0, t1, payload=b''):
+        self.f.write(RECORD.pack(rtype, dev_index, ep, value, t0 - self.t0,
+                                 t1 - t0, len(payload)))
+        self.f.write(payload)
+
+    def wrap(self, usb_dev):
+        '''
+        Returns a RecordingDevice for usb_dev.  The same physical device always
+        maps to the same RecordingDevice so that repeated enumerations don't
+        duplicate its description in the log.
+        '''
+        key = (usb_dev.bus, usb_dev.address)
+        rdev = self.devices.get(key)
+        if rdev is None:
+            rdev = RecordingDevice(self, usb_dev, len(self.devices))
+            self.devices[key] = rdev
+            t = time.perf_counter()
+            self._write(REC_DEV, rdev.index, 0, 0, t, t,
+                        json.dumps(rdev.describe()).encode())
+        else:
+            rdev.usb_dev = usb_dev
+        return rdev
+
+
+class RecordingDevice:
+    '''
+    Wraps a pyusb device so that every read(), write() and ctrl_transfer() is
+    logged along with its timing.  Everything else is forwarded to the
+    underlying device.
+    '''
+    def __init__(self, recorder, usb_dev, index):
+        self.recorder = recorder
+        self.usb_dev  = usb_dev
+        self.index    = index
+
+    def __getattr__(self, name):
+        return getattr(self.usb_dev, name)
+
+    def describe(self):
+        d = {a : getattr(self.usb_dev, a) for a in DEV_ATTRS}
+        for a in DEV_STRINGS:
+            try:
+                d[a] = getattr(self.usb_dev, a)
+            except (ValueError, usb.core.USBError):
+                d[a] = None
+
+        try:
+            d['langids'] = list(self.usb_dev.langids)
+        except (ValueError, usb.core.USBError):
+            d['langids'] = []
+        d['configurations'] = [c.bConfigurationValue
+                               for c in self.usb_dev.configurations()]
+        return d
+
+    def _error(self, rtype, ep, t0, e):
+        payload = json.dumps({'op'         : rtype,
+                              'timeout'    : isinstance(
+                                  e, getattr(usb.core, 'USBTimeoutError', ())),
+                              'strerror'   : e.strerror,
+                              'error_code' : e.backend_error_code,
+                              'errno'      : e.errno,
+                              }).encode()
+        self.recorder._write(REC_ERROR, self.index, ep, rtype, t0,
+                             time.perf_counter(), payload)
+
+    def read(self, endpoint, size_or_buffer, timeout=None):
+        size = (size_or_buffer if isinstance(size_or_buffer, int) else
+                len(memoryview(size_or_buffer).cast('B')))
+        t0 = time.perf_counter()
+        try:
+            rsp = self.usb_dev.read(endpoint, size_or_buffer, timeout=timeout)
+        except usb.core.USBError as e:
+            self._error(REC_READ, endpoint, t0, e)
+            raise
+        t1 = time.perf_counter()
+
+        if isinstance(rsp, int):
+            data = _to_bytes(memoryview(size_or_buffer).cast('B')[:rsp])
+        else:
+            data = _to_bytes(rsp)
+        self.recorder._write(REC_READ, self.index, endpoint, size, t0, t1,
+                             data)
+        return rsp
+
+    def write(self, endpoint, data, timeout=None):
+        t0 = time.perf_counter()
+        try:
+            size = self.usb_dev.write(endpoint, data, timeout=timeout)
+        except usb.core.USBError as e:
+            self._error(REC_WRITE, endpoint, t0, e)
+            raise
+        self.recorder._write(REC_WRITE, self.index, endpoint, size, t0,
+                             time.perf_counter(), _to_bytes(data))
+        return size
+
+    def ctrl_transfer(self, bmRequestType, bRequest, wValue=0, wIndex=0,
+                      data_or_wLength=None, timeout=None):
+        t0 = time.perf_counter()
+        try:
+            rsp = self.usb_dev.ctrl_transfer(bmRequestType, bRequest, wValue,
+                                             wIndex, data_or_wLength,
+                                             timeout=timeout)
+        except usb.core.USBError as e:
+            self._error(REC_CTRL, 0, t0, e)
+            raise
+        t1 = time.perf_counter()
+
+        if bmRequestType & 0x80:
+            data  = _to_bytes(rsp)
+            value = len(data)
+            if isinstance(data_or_wLength, int):
+                wLength = data_or_wLength
+            else:
+                wLength = len(data_or_wLength or b'')
+        else:
+            data    = (_to_bytes(data_or_wLength) if data_or_wLength else b'')
+            value   = rsp
+            wLength = len(data)
+        setup = CTRL_SETUP.pack(bmRequestType, bRequest, wValue, wIndex,
+                                wLength)
+        self.recorder._write(REC_CTRL, self.index, 0, value, t0, t1,
+                             setup + data)
+        return rsp
+
+
+class Record:
+    def __init__(self, rtype, dev_index, ep, value, t, dt, payload):
+        self.rtype     = rtype
+        self.dev_index = dev_index
+        self.ep        = ep
+        self.value     = value
+        self.t         = t
+        self.dt        = dt
+        self.payload   = payload
+
+    def __repr__(self):
+        return '%s(dev=%u, ep=0x%02X, value=%d, len=%u)' % (
+            REC_NAMES.get(self.rtype, self.rtype), self.dev_index, self.ep,
+            self.value, len(self.payload))
+
+
+def load(path):
+    '''Parses a recording and returns a list of Record objects.'''
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise psdb.ProbeException('%s is not a USB recording.' % path)
+
+    records = []
+    pos     = len(MAGIC)
+    while pos < len(data):
+        if pos + RECORD.size > len(data):
+            raise psdb.ProbeException('Truncated USB recording %s.' % path)
+        rtype, dev_index, ep, value, t, dt, n = RECORD.unpack_from(data, pos)
+        pos += RECORD.size
+        records.append(Record(rtype, dev_index, ep, value, t, dt,
+                              data[pos:pos + n]))
+        pos += n
+    return records
+
+
+class Replayer:
+    '''
+    Serves the transfers from a recording in the order they were made.  If
+    strict is True, then every write and control transfer is checked against
+    the recording and a ReplayMismatchException is raised as soon as the
+    session diverges from it.  If realtime is True, then each transfer sleeps
+    for as long as the original did so that end-to-end timings are
+    reproduced; otherwise the replay runs as fast as the host can drive it,
+    which isolates host-side overhead when benchmarking.
+    '''
+    def __init__(self, path, strict=True, realtime=False):
+        self.path     = path
+        self.strict   = strict
+        self.realtime = realtime
+        self.records  = []
+        self.devices  = []
+        self.pos      = 0
+        for r in load(path):
+            if r.rtype == REC_DEV:
+                assert r.dev_index == len(self.devices)
+                self.devices.append(
+                    ReplayDevice(self, r.dev_index, json.loads(r.payload)))
+            else:
+                self.records.append(r)
+
+    def find(self, find_all=False, custom_match=None, **kwargs):
+        kwargs.pop('backend', None)
+        devs = [d for d in self.devices
+                if all(getattr(d, k) == v for k, v in kwargs.items()) and
+                (custom_match is None or custom_match(d))]
+        if find_all:
+            return devs
+        return devs[0] if devs else None
+
+    def _mismatch(self, what, r):
+        raise ReplayMismatchException(
+                'USB replay diverged at record %u: got %s, recorded %s.'
+                % (self.pos, what, r))
+
+    def next(self, dev_index, rtype, ep, what):
+        if self.pos >= len(self.records):
+            raise ReplayMismatchException(
+                    'USB replay ran past the end of %s: got %s.'
+                    % (self.path, what))
+
+        r = self.records[self.pos]
+        if r.dev_index != dev_index:
+            self._mismatch(what, r)
+        if r.rtype == REC_ERROR:
+            info = json.loads(r.payload)
+            if info['op'] != rtype or r.ep != ep:
+                self._mismatch(what, r)
+        elif r.rtype != rtype or r.ep != ep:
+            self._mismatch(what, r)
+        self.pos += 1
+
+        if self.realtime:
+            time.sleep(r.dt)
+        if r.rtype == REC_ERROR:
+            cls = usb.core.USBError
+            if info['timeout']:
+                cls = getattr(usb.core, 'USBTimeoutError', cls)
+            raise cls(info['strerror'], info['error_code'], info['errno'])
+        return r
+
+
+class ReplayConfiguration:
+    def __init__(self, bConfigurationValue):
+        self.bConfigurationValue = bConfigurationValue
+
+
+class ReplayContext:
+    '''Absorbs usb.util.dispose_resources() calls on a ReplayDevice.'''
+    def dispose(self, device, close_handle=True):
+        pass
+
+
+class ReplayDevice:
+    '''
+    Stands in for a pyusb device during replay.  The descriptor attributes
+    come from the recording and the transfers are served by the Replayer.
+    Configuration changes and resets are accepted and ignored since the
+    recorded session already contains their effects.
+    '''
+    def __init__(self, replayer, index, desc):
+        self.replayer = replayer
+        self.index    = index
+        self.desc     = desc
+        self._ctx     = ReplayContext()
+        self.langids  = tuple(desc['langids'])
+        self._config  = ReplayConfiguration(desc['configurations'][0])
+        for a in DEV_ATTRS:
+            setattr(self, a, desc[a])
+        self.port_numbers = tuple(self.port_numbers)
+
+    def _string(self, name):
+        s = self.desc[name]
+        if s is None:
+            raise ValueError('The device has no langid')
+        return s
+
+    @property
+    def manufacturer(self):
+        return self._string('manufacturer')
+
+    @property
+    def product(self):
+        return self._string('product')
+
+    @property
+    def serial_number(self):
+        return self._string('serial_number')
+
+    def configurations(self):
+        return [ReplayConfiguration(v) for v in self.desc['configurations']]
+
+    def get_active_configuration(self):
+        return self._config
+
+    def set_configuration(self, configuration=None):
+        if configuration is not None:
+            self._config = ReplayConfiguration(configuration)
+
+    def reset(self):
+        pass
+
+    def clear_halt(self, ep):
+        pass
+
+    def read(self, endpoint, size_or_buffer, timeout=None):
+        r = self.replayer.next(self.index, REC_READ, endpoint,
+                               'read(0x%02X)' % endpoint)
+        if isinstance(size_or_buffer, int):
+            return array.array('B', r.payload)
+
+        mv = memoryview(size_or_buffer).cast('B')
+        mv[:len(r.payload)] = r.payload
+        return len(r.payload)
+
+    def write(self, endpoint, data, timeout=None):
+        data = _to_bytes(data)
+        r    = self.replayer.next(self.index, REC_WRITE, endpoint,
+                                  'write(0x%02X, %u bytes)'
+                                  % (endpoint, len(data)))
+        if self.replayer.strict and r.payload != data:
+            self.replayer.pos -= 1
+            self.replayer._mismatch('write(0x%02X, %s)'
+                                    % (endpoint, data.hex()), r)
+        return r.value
+
+    def ctrl_transfer(self, bmRequestType, bRequest, wValue=0, wIndex=0,
+                      data_or_wLength=None, timeout=None):
+        r = self.replayer.next(self.index, REC_CTRL, 0,
+                               'ctrl_transfer(0x%02X, 0x%02X)'
+                               % (bmRequestType, bRequest))
+        setup = CTRL_SETUP.unpack_from(r.payload)
+        data  = r.payload[CTRL_SETUP.size:]
+        if (self.replayer.strict and
+                setup[:4] != (bmRequestType, bRequest, wValue, wIndex)):
+            self.replayer.pos -= 1
+            self.replayer._mismatch('ctrl_transfer(0x%02X, 0x%02X, 0x%04X, '
+                                    '0x%04X)' % (bmRequestType, bRequest,
+                                                 wValue, wIndex), r)
+        if bmRequestType & 0x80:
+            return array.array('B', data)
+        return r.value
+
+
+def start_recording(path):
+    '''
+    Records all USB transfers made to devices found by pusb.find() from now
+    on into the file at path.
+    '''
+    global RECORDER
+    RECORDER = Recorder(path)
+    return RECORDER
+
+
+def start_replay(path, strict=True, realtime=False):
+    '''
+    Makes pusb.find() return devices from the recording at path instead of
+    real hardware.
+    '''
+    global REPLAYER
+    REPLAYER = Replayer(path, strict=strict, realtime=realtime)
+    return REPLAYER
+
+
+if os.environ.get(ENV_REPLAY):
+    start_replay(os.environ[ENV_REPLAY])
+elif os.environ.get(ENV_RECORD):
+    start_recording(os.environ[ENV_RECORD])
@@ -0,0 +1,88 @@
+# Copyright (c) 2026 Phase Advanced Sensor Systems, Inc.
+import psdb.devices
+from psdb.probes.transaction import Transaction
+
+
+class FakeAP:
+    def __init__(self, db, ap_num=0):
+        self.db     = db
+        self.ap_num = ap_num
+
+
+class FakeDB:
+    '''
+    A little-endian memory that executes command lists, with a hook for
+    writes that change other registers as a side-effect.
+    '''
+    def __init__(self):
+        self.txn      = None
+        self.mem      = {}
+        self.batches  = 0
+        self.on_write = {}
+
+    def _read(self, addr, size):
+        word = self.mem.get(addr & ~3, 0)
+        return (word >> (8 * (addr & 3))) & ((1 << (8 * size)) - 1)
+
+    def _write(self, addr, size, v):
+        shift = 8 * (addr & 3)
+        mask  = ((1 << (8 * size)) - 1) << shift
+        word  = self.mem.get(addr & ~3, 0)
+        self.mem[addr & ~3] = (word & ~mask) | ((v << shift) & mask)
+        if addr in self.on_write:
+            self.on_write[addr](v)
+
+    def exec_cmd_list(self, cmds):
+        self.batches += 1
+        vals = []
+        for c in cmds:
+            if isinstance(c, psdb.devices.ReadCommand):
+                vals.append(self._read(c.addr, c.size))
+            else:
+                self._write(c.addr, c.size, c.value)
+        return vals
+
+
+def test_write8_then_set_field():
+    db = FakeDB()
+    ap = FakeAP(db)
+    db.mem[0x100] = 0x11223344
+    with Transaction(db) as txn:
+        txn.write(ap, 0x100, 1, 0xAA)
+        txn.set_field(ap, 0x100, 0x0000FF00, 0x00005500)
+    assert db.mem[0x100] == 0x112255AA
+
+
+def test_set_field_sees_earlier_side_effects():
+    db = FakeDB()
+    ap = FakeAP(db)
+    db.mem[0x10] = 0x80000000
+    db.on_write[0x04] = lambda v: db.mem.__setitem__(0x10, 0)
+    with Transaction(db) as txn:
+        txn.write(ap, 0x04, 4, 0x45670123)
+        txn.set_field(ap, 0x10, 0x00000001, 0x00000001)
+    assert db.mem[0x10] == 0x00000001
+
+
+def test_set_field_after_full_write_uses_written_value():
+    db = FakeDB()
+    ap = FakeAP(db)
+    with Transaction(db) as txn:
+        txn.write(ap, 0x20, 4, 0x0000F000)
+        txn.set_field(ap, 0x20, 0x0000000F, 0x00000005)
+        f = txn.read(ap, 0x20, 4)
+    assert f.value == 0x0000F005
+    assert db.batches == 1
+
+
+def test_reads_resolve_in_order_across_base_reads():
+    db = FakeDB()
+    ap = FakeAP(db)
+    db.mem[0x30] = 1
+    with Transaction(db) as txn:
+        f1 = txn.read(ap, 0x30, 4)
+        txn.write(ap, 0x30, 4, 2)
+        txn.set_field(ap, 0x40, 0xF, 0x3)
+        f2 = txn.read(ap, 0x30, 4)
+        f3 = txn.read(ap, 0x40, 4)
+    assert (f1.value, f2.value, f3.value) == (1, 2, 3)